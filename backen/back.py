@@ -2,13 +2,17 @@ import socket
 import threading
 import time
 import queue
+import itertools
+import collections
+import random
 import os
 import sys
 import yaml
 import json
+import struct
 import requests
 from urllib3.exceptions import InsecureRequestWarning
-from flask import Flask, request, jsonify
+from flask import Flask, Response, request, jsonify
 from flask_cors import CORS
 
 # 禁用不安全请求警告
@@ -18,19 +22,32 @@ requests.packages.urllib3.disable_warnings(InsecureRequestWarning)
 sys.path.append(os.path.dirname(os.path.dirname(__file__)))
 from utils.Logger import logger
 from utils.process_data import DataProcessor
+from utils.topology import DeviceTopology, normalize_port
+from utils.protocol import (
+    MSG_JSON, MSG_RESPONSE, MSG_SCHEDULE, FrameReader, encode_json, encode_request, decode_response, to_hex
+)
+from utils.queues import BoundedQueue
+from utils.modbus import crc16, WRITE_FUNCTION_CODES
+from utils.config_watcher import ConfigWatcher
+from utils.snapshot import SnapshotStore
+from utils.tracing import tracer
+from utils.alarms import AlarmEngine
+from utils.rollups import RollupStore
+from utils.rollup_archive import RollupArchive
+from utils.data_view import DataView
+from utils.history_export import FORMATS as EXPORT_FORMATS, HistoryExporter, parse_time
+from utils.shm_transport import LOCAL_HOSTS, open_client_channel
 
 
 class ConfigLoader:
     """配置加载器类"""
     
     @staticmethod
-    def load_config():
-        """加载配置文件"""
+    def resolve_path(relative_path):
+        """查找配置文件路径，优先使用与可执行文件同目录的外部文件"""
         # 首先尝试读取外部配置文件
-        external_config = 'config/config.yaml'  # 与可执行文件同目录的配置文件
-        if os.path.exists(external_config):
-            with open(external_config, 'r', encoding='utf-8') as file:
-                return yaml.safe_load(file)
+        if os.path.exists(relative_path):
+            return relative_path
         
         # 如果外部配置不存在，则使用打包的配置
         if getattr(sys, 'frozen', False):
@@ -40,50 +57,148 @@ class ConfigLoader:
             # 运行在开发环境
             base_path = os.path.dirname(__file__)
         
-        config_path = os.path.join(base_path, 'config/config.yaml')
+        return os.path.join(base_path, relative_path)
+    
+    @staticmethod
+    def load_alarms(config, data_processor):
+        """按配置加载报警规则，未启用时返回None"""
+        alarms_config = config.get('alarms', {})
+        if not alarms_config.get('enabled', True):
+            return None
+        alarms_file = alarms_config.get('file', 'config/alarms.yaml')
+        return AlarmEngine.load(data_processor, ConfigLoader.resolve_path(alarms_file))
+    
+    @staticmethod
+    def load_config(config_path=None):
+        """加载配置文件"""
+        config_path = config_path or ConfigLoader.resolve_path('config/config.yaml')
         with open(config_path, 'r', encoding='utf-8') as file:
             return yaml.safe_load(file)
+    
+    @staticmethod
+    def load_topology(config):
+        """加载设备拓扑配置"""
+        topology_file = config.get('topology', {}).get('file', 'config/topology.yaml')
+        return DeviceTopology.load(ConfigLoader.resolve_path(topology_file))
 
 
 class TCPClient:
     """TCP客户端类，用于连接服务器"""
     # 原来是设计有一个数据库TCP连接的，目前只有串口服务器需要连接
     
-    def __init__(self, host='127.0.0.1', port=8888, connection_name="服务器"):
-        """初始化TCP客户端"""
+    def __init__(self, host='127.0.0.1', port=8888, connection_name="服务器", queue_config=None,
+                 reconnect_config=None, serial_ports=None, receive_queue=None, transport_config=None):
+        """初始化TCP客户端
+        
+        Args:
+            host: 服务器地址
+            port: 服务器端口
+            connection_name: 连接名称，用于日志
+            queue_config: 发送和接收队列的长度和溢出策略，见config.yaml的queue配置
+            reconnect_config: 断线重连配置，见config.yaml的server.reconnect配置
+            serial_ports: 该服务器负责的串口配置列表，None表示使用config.yaml中的全部串口
+            receive_queue: 共享的接收队列，多个服务器的响应合并到同一个队列
+            transport_config: 传输方式配置，见config.yaml的server.transport配置
+        """
         self.host = host
         self.port = port
         self.connection_name = connection_name
+        self.serial_ports = serial_ports
+        # 同机部署时可改用共享内存传输，TCP连接只用作门铃
+        self.transport_config = transport_config or {}
+        self.transport = "tcp"
         self.socket = None
         self.is_connected = False
         self.socket_lock = threading.Lock()
         
-        # 发送和接收队列
-        self.send_queue = queue.Queue()
-        self.receive_queue = queue.Queue()
+        # 发送和接收队列，有界，服务器卡住时内存和延迟不会无限增长
+        queue_config = queue_config or {}
+        self.send_queue = BoundedQueue(
+            maxsize=queue_config.get('send_maxsize', 100),
+            policy=queue_config.get('send_policy', 'replace'),
+            block_timeout=queue_config.get('block_timeout'),
+            priority_maxsize=queue_config.get('priority_maxsize', 100)
+        )
+        self.receive_queue = receive_queue or BoundedQueue(
+            maxsize=queue_config.get('receive_maxsize', 1000),
+            policy=queue_config.get('receive_policy', 'drop_oldest'),
+            block_timeout=queue_config.get('block_timeout'),
+            priority_maxsize=queue_config.get('priority_maxsize', 100)
+        )
+        # 响应处理函数，返回True表示已处理，不再进入接收队列（如写命令的确认）
+        self.response_handlers = []
+        
+        # 断线重连配置
+        reconnect_config = reconnect_config or {}
+        self.auto_reconnect = reconnect_config.get('enabled', True)
+        self.reconnect_min_delay = reconnect_config.get('min_delay', 0.5)
+        self.reconnect_max_delay = reconnect_config.get('max_delay', 30)
+        self.closing = False
+        self.reconnect_thread = None
+        self.reconnect_count = 0
+        
+        # 每次连接成功后需要执行的握手函数，如初始化串口
+        self.handshakes = []
+        
+        # 已发送但未收到响应的请求 {序号: (数据, key, 发送时间, 是否高优先级)}
+        self.in_flight = collections.OrderedDict()
+        self.in_flight_lock = threading.Lock()
+        self.in_flight_limit = reconnect_config.get('in_flight_limit', 1000)
+        self.reissued_count = 0
+        # 调用方已放弃、发送线程已经取出还没有发送的请求序号，发送线程取到时丢弃
+        self.cancelled = collections.OrderedDict()
         
         # 线程对象
         self.send_thread = None
         self.receive_thread = None
     
+    def add_handshake(self, handshake):
+        """注册握手函数，每次连接（包括重连）成功后按注册顺序执行，参数为当前TCP客户端"""
+        self.handshakes.append(handshake)
+    
+    def add_response_handler(self, handler):
+        """注册响应处理函数，在接收线程中调用，handler(data) 返回True时该响应不进入接收队列"""
+        self.response_handlers.append(handler)
+    
     def connect(self):
         """连接到服务器"""
+        self.closing = False
+        if self._open():
+            return True
+        if self.auto_reconnect:
+            self._start_reconnect()
+        return False
+    
+    def _open(self):
+        """建立连接，执行握手后启动收发线程"""
+        sock = None
         try:
             # 创建TCP套接字
-            self.socket = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
-            self.socket.connect((self.host, self.port))
+            sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+            sock.connect((self.host, self.port))
+            sock = self._negotiate_transport(sock)
+            self.socket = sock
             self.is_connected = True
             
+            # 先完成握手，再启动发送线程，保证握手消息最先到达服务器
+            for handshake in self.handshakes:
+                handshake(self)
+            
+            # 上一次连接中未收到响应的请求重新发送
+            self._reissue_in_flight()
+            
             # 启动发送线程
             self.send_thread = threading.Thread(
-                target=self._send_thread_func
+                target=self._send_thread_func,
+                args=(sock,)
             )
             self.send_thread.daemon = True
             self.send_thread.start()
 
             # 启动接收线程
             self.receive_thread = threading.Thread(
-                target=self._receive_thread_func
+                target=self._receive_thread_func,
+                args=(sock,)
             )
             self.receive_thread.daemon = True
             self.receive_thread.start()
@@ -92,31 +207,126 @@ class TCPClient:
             return True
         except Exception as e:
             logger.error(f"连接{self.connection_name}失败: {e}")
-            if self.socket:
-                self.socket.close()
+            if sock:
+                sock.close()
             self.socket = None
             self.is_connected = False
             return False
     
+    def _negotiate_transport(self, sock):
+        """配置为共享内存传输且服务器在本机时，切换到共享内存，否则继续使用TCP
+        
+        Returns:
+            用于收发的连接对象，与socket接口一致
+        """
+        self.transport = "tcp"
+        if self.transport_config.get('type', 'tcp') != 'shm':
+            return sock
+        if self.host not in LOCAL_HOSTS:
+            logger.warning(f"{self.connection_name} {self.host} 不在本机，使用TCP传输")
+            return sock
+        channel = open_client_channel(sock, self.transport_config)
+        if channel is None:
+            return sock
+        self.transport = "shm"
+        logger.info(f"{self.connection_name}已切换为共享内存传输")
+        return channel
+    
     def disconnect(self):
-        """断开与服务器的连接"""
-        if self.socket:
+        """主动断开与服务器的连接，不再重连"""
+        self.closing = True
+        self._close()
+    
+    def _close(self):
+        """关闭当前连接"""
+        with self.socket_lock:
+            sock = self.socket
+            self.socket = None
+            self.is_connected = False
+        if sock:
             try:
-                self.socket.close()
+                sock.close()
             except Exception as e:
                 logger.error(f"关闭{self.connection_name}连接错误: {e}")
             finally:
-                self.socket = None
-                self.is_connected = False
                 logger.info(f"已断开与{self.connection_name}的连接")
     
+    def _connection_lost(self, sock):
+        """收发线程出错时调用，关闭连接并在后台重连"""
+        with self.socket_lock:
+            if self.socket is not sock:
+                # 另一个线程已经处理过本次断线
+                return
+        self._close()
+        if self.auto_reconnect and not self.closing:
+            self._start_reconnect()
+    
+    def _start_reconnect(self):
+        """启动重连线程"""
+        if self.reconnect_thread and self.reconnect_thread.is_alive():
+            return
+        self.reconnect_thread = threading.Thread(target=self._reconnect_thread_func)
+        self.reconnect_thread.daemon = True
+        self.reconnect_thread.start()
+    
+    def _reconnect_thread_func(self):
+        """重连线程函数，指数退避并加入随机抖动，避免多个客户端同时重连"""
+        attempt = 0
+        while not self.closing and not self.is_connected_status():
+            delay = min(self.reconnect_max_delay, self.reconnect_min_delay * (2 ** attempt))
+            delay = random.uniform(delay / 2, delay)
+            logger.info(f"{delay:.1f}秒后重连{self.connection_name}")
+            time.sleep(delay)
+            if self.closing:
+                break
+            if self._open():
+                self.reconnect_count += 1
+                break
+            attempt += 1
+    
     def is_connected_status(self):
         """检查是否已连接到服务器"""
         return self.is_connected and self.socket is not None
     
-    def send(self, data):
-        """发送数据到发送队列"""
-        self.send_queue.put(data)
+    def route(self, serial):
+        """查找串口所在服务器的连接，单个连接时所有串口都由自身负责"""
+        return self
+    
+    def connections(self):
+        """所有服务器连接"""
+        return [self]
+    
+    def is_running(self):
+        """检查客户端是否在运行（已连接或正在重连）"""
+        if self.closing:
+            return False
+        return self.is_connected_status() or self.auto_reconnect
+    
+    def send(self, data, key=None, seq=None, serial=None, priority=False):
+        """发送数据到发送队列
+        
+        Args:
+            data: 要发送的数据
+            key: 队列去重的key，如 (串口, 从站ID)，replace策略下只保留最新的一条
+            seq: 请求序号，指定时会跟踪该请求直到收到响应，断线重连后重新发送
+            serial: 请求的串口名，单个连接时不使用，与ServerPool.send保持一致
+            priority: 是否走高优先级通道（写命令），排在所有轮询请求之前
+        """
+        return self.send_queue.put((data, key, seq, priority), key, priority)
+    
+    def get_stats(self):
+        """获取连接和队列计数"""
+        with self.in_flight_lock:
+            in_flight = len(self.in_flight)
+        return {
+            "connected": self.is_connected_status(),
+            "transport": self.transport,
+            "reconnect_count": self.reconnect_count,
+            "in_flight": in_flight,
+            "reissued": self.reissued_count,
+            "send_queue": self.send_queue.stats(),
+            "receive_queue": self.receive_queue.stats(),
+        }
     
     def receive(self, timeout=1):
         """从接收队列获取数据"""
@@ -125,57 +335,305 @@ class TCPClient:
         except queue.Empty:
             return None
     
-    def _send_thread_func(self):
+    def _track(self, seq, data, key, priority=False):
+        """记录即将发送的请求
+
+        Returns:
+            bool: 是否发送，调用方已放弃的请求返回False
+        """
+        with self.in_flight_lock:
+            if self.cancelled.pop(seq, None):
+                return False
+            self.in_flight[seq] = (data, key, time.time(), priority)
+            # 超出上限时丢弃最早的记录，避免服务器不响应时无限增长
+            while len(self.in_flight) > self.in_flight_limit:
+                self.in_flight.popitem(last=False)
+            return True
+    
+    def cancel(self, seq, serial=None):
+        """放弃请求（如写命令等待确认超时），从发送队列和未响应记录中移除，之后不再发送或重发
+        
+        Args:
+            seq: 请求序号
+            serial: 请求的串口名，单个连接时不使用，与ServerPool.cancel保持一致
+        
+        Returns:
+            bool: 请求是否还没有发出；返回False时请求已经发给服务器，设备可能已经执行
+        """
+        with self.in_flight_lock:
+            if self.in_flight.pop(seq, None) is not None:
+                return False
+            if not self.send_queue.remove(lambda item: item[2] == seq):
+                # 发送线程已经取出还没有记录，或者已经收到响应；记录数有上限
+                self.cancelled[seq] = True
+                while len(self.cancelled) > self.in_flight_limit:
+                    self.cancelled.popitem(last=False)
+            return True
+    
+    def _complete(self, seq):
+        """收到响应，移除对应的请求记录"""
+        with self.in_flight_lock:
+            self.in_flight.pop(seq, None)
+    
+    def _reissue_in_flight(self):
+        """将未收到响应的请求重新放入发送队列"""
+        with self.in_flight_lock:
+            pending = list(self.in_flight.items())
+            self.in_flight.clear()
+        for seq, (data, key, _, priority) in pending:
+            # 队列中已有同一key的更新请求时不再重发
+            if key is not None and self.send_queue.contains(key):
+                continue
+            # 写命令回到高优先级通道，不排在轮询请求之后，也不会被溢出策略丢弃
+            self.send_queue.put((data, key, seq, priority), key, priority)
+        if pending:
+            self.reissued_count += len(pending)
+            logger.info(f"重新发送 {len(pending)} 条未响应的请求")
+    
+    def _handle_response(self, data):
+        """交给响应处理函数，写命令的确认不经过接收队列，不会被溢出策略丢弃"""
+        for handler in self.response_handlers:
+            try:
+                if handler(data):
+                    return True
+            except Exception as e:
+                logger.error(f"{self.connection_name}响应处理出错: {e}")
+        return False
+    
+    def _send_thread_func(self, sock):
         """发送线程函数"""
-        while self.is_connected:
+        while self.socket is sock:
             try:
-                data = self.send_queue.get(timeout=1)
-                self.socket.sendall(data.encode('utf-8'))
-                time.sleep(0.1)
+                data, key, seq, priority = self.send_queue.get(timeout=1)
             except queue.Empty:
                 # 队列为空，继续循环
                 continue
+            if self.socket is not sock:
+                # 等待期间连接已经断开，数据留给新连接的发送线程
+                self.send_queue.put((data, key, seq, priority), key, priority)
+                break
+            try:
+                if isinstance(data, str):
+                    data = data.encode('utf-8')
+                if seq is not None:
+                    if not self._track(seq, data, key, priority):
+                        continue
+                    tracer.add_since("backend.queue_wait", ("send", seq), seq)
+                with tracer.span("backend.socket_send", seq, bytes=len(data)):
+                    with self.socket_lock:
+                        sock.sendall(data)
             except Exception as e:
                 logger.error(f"{self.connection_name}发送失败: {e}")
-                self.disconnect()
+                # 没有发出去的数据放回队列，重连后再发送
+                if seq is not None:
+                    self._complete(seq)
+                self.send_queue.put((data, key, seq, priority), key, priority)
+                self._connection_lost(sock)
                 break
     
-    def _receive_thread_func(self):
-        """接收线程函数"""
-        while self.is_connected:
+    def _receive_thread_func(self, sock):
+        """接收线程函数，按二进制帧协议分帧"""
+        reader = FrameReader()
+        while self.socket is sock:
             try:
-                data_str = self.socket.recv(1024).decode('utf-8')
-                if not data_str:
+                raw_data = sock.recv(4096)
+                if not raw_data:
                     logger.warning(f"{self.connection_name}已断开连接")
-                    self.disconnect()
+                    self._connection_lost(sock)
                     break
                 
-                data = json.loads(data_str)
-                # 记录接收到的数据
-                logger.info(f"接收到{self.connection_name}数据: {data}")
-                
-                self.receive_queue.put(data)
+                for msg_type, payload in reader.feed(raw_data):
+                    if msg_type == MSG_RESPONSE:
+                        # Modbus响应保持原始字节，只在日志中转换为十六进制
+                        data = decode_response(payload)
+                        self._complete(data['seq'])
+                        # 从服务器封装响应到后端收到响应
+                        tracer.add("backend.response_trip", data['time'], time.time(), data['seq'], serial=data['serial'])
+                        if data['status'] == 'success':
+                            logger.info(f"接收到{self.connection_name}数据: {data['serial']} {to_hex(data['response'])}")
+                        else:
+                            logger.warning(f"{self.connection_name}返回错误: {data['serial']} {data['message']}")
+                    elif msg_type == MSG_JSON:
+                        data = json.loads(bytes(payload).decode('utf-8'))
+                        # 记录接收到的数据
+                        logger.info(f"接收到{self.connection_name}数据: {data}")
+                    else:
+                        logger.warning(f"{self.connection_name}未知的帧类型: {msg_type}")
+                        continue
+                    
+                    if self._handle_response(data):
+                        continue
+                    
+                    # 按 (串口, 从站ID) 作为key，receive_policy为replace时只保留最新的响应
+                    key = None
+                    if data.get('status') == 'success' and len(data['response']) > 0:
+                        key = (data['serial'], data['response'][0])
+                    self.receive_queue.put(data, key)
             except Exception as e:
-                logger.error(f"{self.connection_name}接收失败: {e}")
-                self.disconnect()
+                if self.socket is sock:
+                    logger.error(f"{self.connection_name}接收失败: {e}")
+                    self._connection_lost(sock)
                 break
 
+class ServerPool:
+    """串口服务器连接池，每个串口服务器节点一个TCP连接
+    
+    根据路由表把请求分发到串口所在的节点，所有节点的响应合并到同一个接收队列，
+    对设备管理器来说与单个TCPClient的用法一致。
+    """
+    
+    DEFAULT_NODE = 'default'
+    
+    def __init__(self, config):
+        """初始化连接池
+        
+        Args:
+            config: 完整配置，server为默认节点，servers为其他节点及其负责的串口
+        """
+        self.clients = {}
+        # 串口名 -> 节点名
+        self.routes = {}
+        
+        queue_config = config.get('queue', {})
+        self.receive_queue = BoundedQueue(
+            maxsize=queue_config.get('receive_maxsize', 1000),
+            policy=queue_config.get('receive_policy', 'drop_oldest'),
+            block_timeout=queue_config.get('block_timeout'),
+            priority_maxsize=queue_config.get('priority_maxsize', 100)
+        )
+        
+        server_config = config.get('server', {})
+        nodes = [dict(server_config, name=self.DEFAULT_NODE)] + list(config.get('servers', []))
+        for node in nodes:
+            for port in node.get('ports', []):
+                self.routes[normalize_port(port)] = node['name']
+            name = node['name']
+            self.clients[name] = TCPClient(
+                host=node.get('host', '127.0.0.1'),
+                port=node.get('port', 8888),
+                connection_name=f"串口服务器[{name}]" if name != self.DEFAULT_NODE else "服务器",
+                queue_config=queue_config,
+                reconnect_config=node.get('reconnect', server_config.get('reconnect', {})),
+                serial_ports=[],
+                receive_queue=self.receive_queue,
+                transport_config=node.get('transport')
+            )
+        self.set_serial_ports(config.get('serial_ports', []))
+    
+    def set_serial_ports(self, serial_ports):
+        """按路由表拆分串口初始化列表，未列出的串口由默认节点负责"""
+        node_ports = {name: [] for name in self.clients}
+        for port_config in serial_ports:
+            node_ports[self._route_name(port_config['name'])].append(port_config)
+        for name, client in self.clients.items():
+            if name != self.DEFAULT_NODE and not node_ports[name]:
+                logger.warning(f"串口服务器节点 {name} 没有分配串口")
+            client.serial_ports = node_ports[name]
+    
+    def connections(self):
+        """所有节点的连接"""
+        return list(self.clients.values())
+    
+    def _route_name(self, serial):
+        """查找串口所在的节点名"""
+        return self.routes.get(normalize_port(serial), self.DEFAULT_NODE)
+    
+    def route(self, serial):
+        """查找串口所在节点的TCP客户端"""
+        return self.clients[self._route_name(serial)]
+    
+    def add_handshake(self, handshake):
+        """为所有节点注册握手函数"""
+        for client in self.clients.values():
+            client.add_handshake(handshake)
+    
+    def add_response_handler(self, handler):
+        """为所有节点注册响应处理函数"""
+        for client in self.clients.values():
+            client.add_response_handler(handler)
+    
+    def connect(self):
+        """连接所有节点，全部连接成功返回True"""
+        results = [client.connect() for client in self.clients.values()]
+        return all(results)
+    
+    def disconnect(self):
+        """断开所有节点"""
+        for client in self.clients.values():
+            client.disconnect()
+    
+    def is_connected_status(self):
+        """是否所有节点都已连接"""
+        return all(client.is_connected_status() for client in self.clients.values())
+    
+    def is_running(self):
+        """是否有节点在运行（已连接或正在重连）"""
+        return any(client.is_running() for client in self.clients.values())
+    
+    def send(self, data, key=None, seq=None, serial=None, priority=False):
+        """按串口把请求发送到对应节点"""
+        return self.route(serial).send(data, key, seq, priority=priority)
+    
+    def cancel(self, seq, serial=None):
+        """在串口所在节点上放弃请求，见 TCPClient.cancel"""
+        return self.route(serial).cancel(seq)
+    
+    def receive(self, timeout=1):
+        """从合并后的接收队列获取数据"""
+        try:
+            return self.receive_queue.get(timeout=timeout)
+        except queue.Empty:
+            return None
+    
+    def get_stats(self):
+        """获取各节点的连接和队列计数"""
+        return {name: client.get_stats() for name, client in self.clients.items()}
+
+
 class APIService:
     """API服务类，封装Flask应用和路由处理"""
     
-    def __init__(self, host='0.0.0.0', port=5000, data_manager=None):
+    def __init__(self, host='0.0.0.0', port=5000, data_manager=None, device_manager=None, alarm_engine=None,
+                 rollup_store=None, compression=None, export_config=None, rollup_archive=None):
         """初始化API服务
         
         Args:
             host: 服务器主机，默认为0.0.0.0
             port: 服务器端口，默认为5000
             data_manager: 数据管理器实例
+            device_manager: 设备管理器实例，用于下发写命令
+            alarm_engine: 报警规则引擎，用于查询当前报警
+            rollup_store: 测点滚动统计，用于报表查询
+            compression: /data 响应的压缩配置 {"min_size": 字节数, "level": 1-9}
+            export_config: 历史数据导出配置 {"chunk_buckets", "pause", "max_concurrent"}，见 HistoryExporter
+            rollup_archive: 测点统计归档，导出早于内存保留范围的数据时读取
         """
         self.app = Flask(__name__)
         CORS(self.app)
         self.host = host
         self.port = port
         self.data_manager = data_manager
+        self.device_manager = device_manager
+        self.alarm_engine = alarm_engine
+        self.rollup_store = rollup_store
+        # /data 的测点选择和压缩，响应体按数据版本缓存
+        compression = compression or {}
+        self.data_view = DataView(
+            data_manager,
+            min_compress_size=compression.get('min_size', 512),
+            compress_level=compression.get('level', 6)
+        ) if data_manager is not None else None
+        # 测点统计的流式导出
+        export_config = export_config or {}
+        self.exporter = HistoryExporter(
+            rollup_store,
+            chunk_buckets=export_config.get('chunk_buckets', 240),
+            pause=export_config.get('pause', 0.01),
+            max_concurrent=export_config.get('max_concurrent', 2),
+            archive=rollup_archive
+        ) if rollup_store is not None else None
+        # 其他模块的统计信息，名称 -> 获取统计的函数
+        self.stats_sources = {}
         
         # 注册API蓝图
         self._register_routes()
@@ -198,11 +656,142 @@ class APIService:
             res = json.loads(res_json)
             return jsonify(res)
         
+        # 写命令，如强排开关、设定值修改
+        @self.app.route('/com/<com>/id/<id>/write', methods=['POST'])
+        def write_device(com, id):
+            """向设备写寄存器或线圈，等待设备确认后返回
+            
+            请求体: {"function_code": 6, "address": 20, "value": 1}
+            多个写入时使用 "values": [..]，function_code 为 15 或 16
+            """
+            if self.device_manager is None:
+                return jsonify({"status": "error", "message": "写命令不可用"}), 503
+            body = request.get_json(silent=True) or {}
+            try:
+                function_code = int(body.get('function_code', 6))
+                if function_code not in WRITE_FUNCTION_CODES:
+                    raise ValueError(f"不支持的写功能码: {function_code}")
+                values = body['values'] if function_code in (15, 16) else body['value']
+                result = self.device_manager.write(
+                    com, id, function_code, int(body['address']), values,
+                    timeout=float(body.get('timeout', 3))
+                )
+            except (KeyError, TypeError, ValueError) as e:
+                return jsonify({"status": "error", "message": f"写命令参数错误: {e}"}), 400
+            if result is None:
+                return jsonify({"status": "timeout", "message": "等待设备确认超时，未发出的写命令已取消"}), 504
+            if result["status"] == "rejected":
+                return jsonify(result), 503
+            return jsonify(result)
+        
         # 获取整个data数据
         @self.app.route('/data', methods=['GET'])
         def get_all_data():
-            """根据COM口和ID获取设备信息"""
-            res = self.data_manager.get_all_data()
+            """获取数据树，可按楼层、设备、测点选择
+            
+            参数: floor=楼层，device=设备名或设备路径，point=测点名（均可重复或用逗号分隔），
+            mode=full（默认，包含单位等属性）/value（只返回值）
+            客户端支持时按 gzip/deflate 压缩
+            """
+            def arg_list(name):
+                return [item for value in request.args.getlist(name) for item in value.split(',') if item]
+            try:
+                body, encoding = self.data_view.render(
+                    floors=arg_list('floor'),
+                    devices=arg_list('device'),
+                    points=arg_list('point'),
+                    mode=request.args.get('mode', 'full'),
+                    accept_encoding=request.headers.get('Accept-Encoding')
+                )
+            except ValueError as e:
+                return jsonify({"status": "error", "message": str(e)}), 400
+            response = Response(body, mimetype='application/json')
+            response.headers['Vary'] = 'Accept-Encoding'
+            if encoding:
+                response.headers['Content-Encoding'] = encoding
+            return response
+        
+        # 当前报警和最近的报警事件
+        @self.app.route('/alarms', methods=['GET'])
+        def get_alarms():
+            """获取当前报警，history=N 时同时返回最近N条报警事件"""
+            if self.alarm_engine is None:
+                return jsonify({"status": "error", "message": "报警功能未启用"}), 503
+            res = {"active": self.alarm_engine.get_active()}
+            limit = request.args.get('history', type=int)
+            if limit:
+                res["history"] = self.alarm_engine.get_history(limit)
+            return jsonify(res)
+        
+        # 测点的分钟/小时/天统计
+        @self.app.route('/rollups', methods=['GET'])
+        def get_rollups():
+            """获取测点统计
+            
+            参数: point=测点路径（可重复），device=设备路径（该设备下的所有测点），
+            resolution=minute/hour/day（默认hour），start/end=时间范围（秒）
+            不指定测点时返回有统计数据的测点列表
+            """
+            if self.rollup_store is None:
+                return jsonify({"status": "error", "message": "测点统计未启用"}), 503
+            resolution = request.args.get('resolution', 'hour')
+            if resolution not in self.rollup_store.stats()["resolutions"]:
+                return jsonify({"status": "error", "message": f"未知的统计粒度: {resolution}"}), 400
+            paths = request.args.getlist('point')
+            device = request.args.get('device')
+            if device:
+                prefix = device.rstrip('/') + '/'
+                paths += [path for path in self.rollup_store.paths() if path.startswith(prefix)]
+            if not paths:
+                return jsonify({"points": self.rollup_store.paths()})
+            start = request.args.get('start', type=float)
+            end = request.args.get('end', type=float)
+            return jsonify({
+                "resolution": resolution,
+                "points": {path: self.rollup_store.query(path, resolution, start, end) for path in paths}
+            })
+        
+        # 历史数据导出，按时间分块流式返回
+        @self.app.route('/export', methods=['GET'])
+        def export_history():
+            """导出测点统计为 CSV 或 NDJSON
+            
+            参数: point=测点路径（可重复），device=设备路径（该设备下的所有测点），
+            resolution=minute/hour/day（默认hour），start/end=时间范围（秒或 YYYY-MM-DD[ HH:MM[:SS]]），
+            format=csv（默认）/ndjson
+            响应边生成边发送，不在内存中拼出完整结果
+            """
+            if self.exporter is None:
+                return jsonify({"status": "error", "message": "测点统计未启用"}), 503
+            paths = request.args.getlist('point')
+            device = request.args.get('device')
+            if device:
+                prefix = device.rstrip('/') + '/'
+                paths += [path for path in self.rollup_store.paths() if path.startswith(prefix)]
+            if not paths:
+                return jsonify({"status": "error", "message": "未指定测点或设备"}), 400
+            resolution = request.args.get('resolution', 'hour')
+            fmt = request.args.get('format', 'csv')
+            try:
+                start = parse_time(request.args.get('start'))
+                end = parse_time(request.args.get('end'))
+                stream = self.exporter.open(paths, resolution, start, end, fmt)
+            except ValueError as e:
+                return jsonify({"status": "error", "message": str(e)}), 400
+            if stream is None:
+                return jsonify({"status": "error", "message": "同时进行的导出过多，请稍后重试"}), 429
+            response = Response(stream, mimetype=EXPORT_FORMATS[fmt])
+            filename = f"export_{resolution}_{time.strftime('%Y%m%d%H%M%S')}.{fmt}"
+            response.headers['Content-Disposition'] = f'attachment; filename="{filename}"'
+            return response
+        
+        # 运行统计，如读取到可见的延迟
+        @self.app.route('/stats', methods=['GET'])
+        def get_stats():
+            """获取运行统计信息"""
+            res = self.data_manager.get_stats()
+            for name, source in self.stats_sources.items():
+                res[name] = source()
             return jsonify(res)
 
         # @self.app.route('/get_data', methods=['POST'])
@@ -210,6 +799,10 @@ class APIService:
         #     """依次获取后端解析的单个数据，作为历史数据存储到数据库"""
         #     pass
     
+    def add_stats_source(self, name, source):
+        """注册统计信息来源，/stats 接口会一并返回"""
+        self.stats_sources[name] = source
+    
     def run(self, debug=False, use_reloader=False):
         """运行API服务器"""
         logger.info(f"启动API服务器 {self.host}:{self.port}")
@@ -238,69 +831,333 @@ class ModbusHelper:
     @staticmethod
     def calculate_crc(data):
         """计算CRC校验码"""
-        crc = 0xffff
-        for byte in data:
-            crc ^= byte
-            for _ in range(8):
-                if crc & 0x0001:
-                    crc = (crc >> 1) ^ 0xA001
-                else:
-                    crc = crc >> 1
-        return crc.to_bytes(2, byteorder='little')
+        return crc16(data).to_bytes(2, byteorder='little')
+    
+    @staticmethod
+    def build_request(slave_address, function_code, start_address, quantity):
+        """构建Modbus请求帧（bytes）"""
+        request = struct.pack('>BBHH', int(slave_address), int(function_code), int(start_address), int(quantity))
+        return request + ModbusHelper.calculate_crc(request)
+    
+    @staticmethod
+    def build_write_request(slave_address, function_code, address, values):
+        """构建Modbus写请求帧（bytes）
+        
+        Args:
+            slave_address: 从站地址
+            function_code: 5写单个线圈 / 6写单个寄存器 / 15写多个线圈 / 16写多个寄存器
+            address: 起始地址
+            values: 写入的值，单个写入时为一个值，多个写入时为列表
+        """
+        slave_address, function_code, address = int(slave_address), int(function_code), int(address)
+        if not 0 <= slave_address <= 247:
+            raise ValueError(f"从站地址超出范围 0~247: {slave_address}")
+        if not 0 <= address <= 0xFFFF:
+            raise ValueError(f"地址超出范围 0~65535: {address}")
+        if function_code in (15, 16):
+            values = list(values)
+            # 一帧最多写入的数量由帧长度限制
+            limit = 1968 if function_code == 15 else 123
+            if not 1 <= len(values) <= limit:
+                raise ValueError(f"写入数量超出范围 1~{limit}: {len(values)}")
+            if address + len(values) > 0x10000:
+                raise ValueError(f"写入的地址范围超过65535: {address}+{len(values)}")
+        if function_code == 5:
+            request = struct.pack('>BBHH', slave_address, function_code, address, 0xFF00 if ModbusHelper._coil(values) else 0x0000)
+        elif function_code == 6:
+            request = struct.pack('>BBHH', slave_address, function_code, address, ModbusHelper._register(values))
+        elif function_code == 15:
+            values = [ModbusHelper._coil(value) for value in values]
+            coil_bytes = bytearray((len(values) + 7) // 8)
+            for i, value in enumerate(values):
+                if value:
+                    coil_bytes[i // 8] |= 1 << (i % 8)
+            request = struct.pack('>BBHHB', slave_address, function_code, address, len(values), len(coil_bytes))
+            request += bytes(coil_bytes)
+        elif function_code == 16:
+            values = [ModbusHelper._register(value) for value in values]
+            request = struct.pack('>BBHHB', slave_address, function_code, address, len(values), len(values) * 2)
+            request += struct.pack(f'>{len(values)}H', *values)
+        else:
+            raise ValueError(f"不支持的写功能码: {function_code}")
+        return request + ModbusHelper.calculate_crc(request)
+    
+    @staticmethod
+    def _register(value):
+        """检查寄存器值的范围"""
+        value = int(value)
+        if not 0 <= value <= 0xFFFF:
+            raise ValueError(f"寄存器值超出范围 0~65535: {value}")
+        return value
+    
+    @staticmethod
+    def _coil(value):
+        """解析线圈值，只接受 true/false、0/1 和 "0"/"1"，"false" 等字符串不会被当作打开"""
+        if isinstance(value, bool):
+            return value
+        if isinstance(value, int) or (isinstance(value, str) and value.strip() in ("0", "1")):
+            if int(value) in (0, 1):
+                return int(value) == 1
+        raise ValueError(f"线圈值只能是 true/false 或 0/1: {value!r}")
     
     @staticmethod
     def format_request(slave_address, function_code, start_address, quantity):
-        """格式化Modbus请求"""
-        request = f'{int(slave_address):02x} {int(function_code):02x} {int(start_address):04x} {int(quantity):04x}'
-        request = bytes.fromhex(request)
-        crc = ModbusHelper.calculate_crc(request)
-        request += crc
-        # 将bytes转换为十六进制字符串
-        return ' '.join(f'{b:02X}' for b in request)
+        """格式化Modbus请求，返回十六进制字符串，用于日志和调试显示"""
+        request = ModbusHelper.build_request(slave_address, function_code, start_address, quantity)
+        return to_hex(request)
 
 
 class DeviceManager:
     """设备管理器类，处理设备通信和数据处理"""
     
     def __init__(self, tcp_client, config, data_processor):
-        """初始化设备管理器"""
+        """初始化设备管理器
+        
+        Args:
+            tcp_client: TCPClient或ServerPool，负责把请求发给串口服务器
+            config: 配置
+            data_processor: 数据处理器
+        """
         self.tcp_client = tcp_client
         self.config = config
         self.data_processor = data_processor
+        # 请求序号，用于对应请求和响应
+        self._seq = itertools.count(1)
+        # 轮询命令列表
+        self.commands = []
+        # 预先编码的请求帧 {(串口, 从站, 功能码, 起始地址, 数量): 请求帧}
+        self.compiled = {}
+        # 等待确认的写命令 {序号: {"event": Event, "result": 响应数据}}
+        self.pending_writes = {}
+        self.pending_writes_lock = threading.Lock()
+        # 写命令的确认在接收线程中直接交给等待的调用方，不经过接收队列
+        self.tcp_client.add_response_handler(self._complete_write)
+        
+        # 解析线程
+        self.parsing = False
+        self.parse_thread = None
     
-    def init_serial(self):
-        """初始化串口"""
-        serial_ports = self.config.get('serial_ports', [])
+    def init_serial(self, tcp_client=None):
+        """初始化串口，只发送该服务器负责的串口
+        
+        Args:
+            tcp_client: 要初始化的服务器连接，默认为设备管理器的TCP客户端
+        """
+        tcp_client = tcp_client or self.tcp_client
+        serial_ports = tcp_client.serial_ports
+        if serial_ports is None:
+            serial_ports = self.config.get('serial_ports', [])
         if not serial_ports:
-            logger.error("未找到串口配置信息")
+            logger.error(f"未找到{tcp_client.connection_name}的串口配置信息")
             return False
         
-        if not self.tcp_client.is_connected_status():
+        if not tcp_client.is_connected_status():
             logger.error("未连接到服务器")
             return False
         
-        # 将列表序列化为JSON字符串
-        serial_ports_json = json.dumps(serial_ports)
-        # 发送JSON字符串
-        self.tcp_client.socket.sendall(serial_ports_json.encode('utf-8'))
+        # 将列表序列化为JSON控制帧并发送
+        with tcp_client.socket_lock:
+            tcp_client.socket.sendall(encode_json(serial_ports))
         
         return True
     
+    @staticmethod
+    def _command_key(json_data):
+        """命令的唯一标识"""
+        return (
+            json_data['serial'],
+            int(json_data['slave_adress']),
+            int(json_data['function_code']),
+            int(json_data['start_address']),
+            int(json_data['quantity'])
+        )
+    
+    def set_commands(self, json_data_list):
+        """设置轮询命令列表，只重新编码新增或修改的命令
+        
+        Returns:
+            tuple: (新增命令数, 删除命令数, 修改命令数)，修改指请求不变但其他字段（如 interval）变化
+        """
+        compiled = {}
+        for json_data in json_data_list:
+            key = self._command_key(json_data)
+            request = self.compiled.get(key)
+            if request is None:
+                request = ModbusHelper.build_request(*key[1:])
+            compiled[key] = request
+        added = len(compiled.keys() - self.compiled.keys())
+        removed = len(self.compiled.keys() - compiled.keys())
+        old_commands = {self._command_key(json_data): json_data for json_data in self.commands}
+        modified = sum(
+            1 for json_data in json_data_list
+            if self._command_key(json_data) in old_commands and old_commands[self._command_key(json_data)] != json_data
+        )
+        self.commands = json_data_list
+        self.compiled = compiled
+        return added, removed, modified
+    
+    def apply_serial_ports(self, close_ports, open_ports):
+        """只关闭和打开发生变化的串口，其余串口继续轮询
+        
+        Args:
+            close_ports: 需要关闭的串口名列表
+            open_ports: 需要打开的串口配置列表
+        """
+        for tcp_client in self.tcp_client.connections():
+            if not tcp_client.is_connected_status():
+                # 未连接的服务器在重连握手时会收到最新的串口列表
+                continue
+            to_close = [name for name in close_ports if self.tcp_client.route(name) is tcp_client]
+            to_open = [port for port in open_ports if self.tcp_client.route(port['name']) is tcp_client]
+            with tcp_client.socket_lock:
+                if to_close:
+                    tcp_client.socket.sendall(encode_json({"command": "close_ports", "ports": to_close}))
+                if to_open:
+                    tcp_client.socket.sendall(encode_json(to_open))
+            if to_close or to_open:
+                logger.info(f"{tcp_client.connection_name}串口变更: 关闭 {to_close}，打开 {[port['name'] for port in to_open]}")
+    
+    def install_schedule(self, tcp_client=None):
+        """把轮询计划下发给串口服务器，由服务器在本地轮询并持续推送结果
+        
+        Args:
+            tcp_client: 要下发的服务器连接，只下发该服务器负责的串口的命令
+        
+        Returns:
+            bool: 是否下发，不是 schedule 模式时不下发
+        """
+        tcp_client = tcp_client or self.tcp_client
+        modbus_config = self.config.get('modbus', {})
+        if modbus_config.get('mode', 'poll') != 'schedule':
+            return False
+        commands = []
+        for i, json_data in enumerate(self.commands):
+            serial = json_data['serial']
+            if self.tcp_client.route(serial) is not tcp_client:
+                continue
+            # 使用预先编码的请求帧
+            key = self._command_key(json_data)
+            request = self.compiled.get(key) or ModbusHelper.build_request(*key[1:])
+            commands.append({
+                "id": i,
+                "serial": serial,
+                "request": request.hex(),
+                "interval": json_data.get('interval', modbus_config.get('poll_interval', 1.0)),
+            })
+        # 没有命令时也下发空计划，停止服务器上原来的轮询
+        schedule = {
+            "request_delay": modbus_config.get('request_delay', 0.5),
+            "commands": commands,
+        }
+        with tcp_client.socket_lock:
+            tcp_client.socket.sendall(encode_json(schedule, MSG_SCHEDULE))
+        logger.info(f"已向{tcp_client.connection_name}下发轮询计划，共 {len(commands)} 条命令")
+        return True
+    
+    def stop_schedule(self, tcp_client):
+        """下发空的轮询计划，停止服务器本地轮询（切换回 poll 模式时使用）"""
+        with tcp_client.socket_lock:
+            tcp_client.socket.sendall(encode_json({"commands": []}, MSG_SCHEDULE))
+        logger.info(f"已停止{tcp_client.connection_name}的轮询计划")
+    
     def send_data(self, data):
         """发送Modbus请求到服务器"""
         serial, slave_address, function_code, start_address, quantity = data
+        # 最高位留给服务器端轮询计划推送的响应
+        seq = next(self._seq) & 0x7FFFFFFF
         
-        # 使用ModbusHelper格式化请求
-        request_hex = ModbusHelper.format_request(slave_address, function_code, start_address, quantity)
+        with tracer.span("backend.encode", seq, serial=serial):
+            # 优先使用预先编码的请求帧，全程以bytes传输
+            key = (serial, int(slave_address), int(function_code), int(start_address), int(quantity))
+            request = self.compiled.get(key)
+            if request is None:
+                request = ModbusHelper.build_request(slave_address, function_code, start_address, quantity)
+            frame = encode_request(seq, serial, request)
         
-        # 发送json格式的内容
-        data = json.dumps({
-            "serial": serial,
-            "request": request_hex,
-            "time": time.strftime('%Y-%m-%d %H:%M:%S', time.localtime()),
-        })
-        self.tcp_client.send(data)
-        return data
+        # 同一串口同一从站的轮询在队列中只保留最新的一条
+        tracer.mark(("send", seq))
+        self.tcp_client.send(frame, key=(serial, int(slave_address)), seq=seq, serial=serial)
+        return request
+    
+    def write(self, serial, slave_address, function_code, address, values, timeout=3):
+        """发送写命令并等待确认，写命令走高优先级通道，确认后立即回读相关寄存器
+        
+        Returns:
+            dict: 写命令的响应，超时返回None（还没有发出的写命令被取消，已发出的不再重发），
+            写命令队列已满时 status 为 rejected
+        """
+        request = ModbusHelper.build_write_request(slave_address, function_code, address, values)
+        seq = next(self._seq) & 0x7FFFFFFF
+        pending = {"event": threading.Event(), "result": None, "start": time.time()}
+        with self.pending_writes_lock:
+            self.pending_writes[seq] = pending
+        
+        if not self.tcp_client.send(encode_request(seq, serial, request), seq=seq, serial=serial, priority=True):
+            with self.pending_writes_lock:
+                self.pending_writes.pop(seq, None)
+            logger.warning(f"写命令队列已满，拒绝写命令: {serial} {to_hex(request)}")
+            return {"status": "rejected", "serial": serial, "message": "写命令队列已满"}
+        logger.info(f"写命令已发送: {serial} {to_hex(request)}")
+        
+        try:
+            if not pending["event"].wait(timeout):
+                # 调用方得到超时结果后不再发送或重连后重发，避免调用方重试时同一个写命令执行两次
+                sent = not self.tcp_client.cancel(seq, serial=serial)
+                logger.warning(
+                    f"写命令等待确认超时{'（已发出）' if sent else '，已取消'}: {serial} {to_hex(request)}"
+                )
+                return None
+            return pending["result"]
+        finally:
+            with self.pending_writes_lock:
+                self.pending_writes.pop(seq, None)
+    
+    def read_back(self, serial, slave_address, address):
+        """写命令确认后，高优先级重新发送覆盖该地址的轮询命令，使数据立即更新"""
+        slave_address = int(slave_address)
+        commands = [
+            json_data for json_data in self.commands
+            if normalize_port(json_data['serial']) == normalize_port(serial)
+            and int(json_data['slave_adress']) == slave_address
+        ]
+        covering = [
+            json_data for json_data in commands
+            if int(json_data['start_address']) <= address < int(json_data['start_address']) + int(json_data['quantity'])
+        ]
+        for json_data in covering or commands:
+            request = ModbusHelper.build_request(
+                slave_address, json_data['function_code'], json_data['start_address'], json_data['quantity']
+            )
+            seq = next(self._seq) & 0x7FFFFFFF
+            self.tcp_client.send(encode_request(seq, serial, request), seq=seq, serial=serial, priority=True)
+    
+    def _complete_write(self, data):
+        """收到写命令的响应，唤醒等待的调用方并触发回读"""
+        with self.pending_writes_lock:
+            pending = self.pending_writes.get(data.get('seq'))
+        if pending is None:
+            return False
+        
+        request = bytes(data['request'])
+        result = {
+            "status": data['status'],
+            "serial": data['serial'],
+            "request": to_hex(request),
+            "latency_ms": round((time.time() - pending["start"]) * 1000, 3),
+        }
+        if data['status'] == 'success':
+            response = bytes(data['response'])
+            result["response"] = to_hex(response)
+            # 从站返回异常响应时功能码最高位为1
+            if len(response) > 1 and response[1] & 0x80:
+                result["status"] = "exception"
+            else:
+                self.read_back(data['serial'], request[0], int.from_bytes(request[2:4], byteorder='big'))
+        else:
+            result["message"] = data.get('message')
+        pending["result"] = result
+        pending["event"].set()
+        return True
     
     def send_json_list(self, json_data_list):
         """发送多个JSON数据到服务器"""
@@ -330,28 +1187,52 @@ class DeviceManager:
         logger.info("所有JSON数据发送完成")
         return len(json_data_list)
     
-    def parse_all_data(self):
-        """解析接收到的所有数据"""
-        while not self.tcp_client.receive_queue.empty():
+    def handle_response(self, data):
+        """解析单条接收到的数据"""
+        if data and data.get('request') is not None and len(data['request']) > 1 \
+                and data['request'][1] in WRITE_FUNCTION_CODES:
+            # 写命令的响应不含寄存器数据，只用于确认
+            self._complete_write(data)
+            return None
+        
+        if not data or data.get('status') != 'success':
+            # 无需解析的数据
+            return None
+        
+        serial = data.get('serial')
+        response = data.get('response')
+        data_json = self.data_processor._parse_response(serial, response, data.get('time'), data.get('seq'))
+        logger.info(f"解析数据: {data_json}")
+        
+        # 发送到数据库的API
+        # 此处调用数据库的API即可，将data_json发送出去
+        return data_json
+    
+    def start_parser(self):
+        """启动解析线程，与轮询并行，数据一到达接收队列就解析"""
+        if self.parse_thread and self.parse_thread.is_alive():
+            return
+        self.parsing = True
+        self.parse_thread = threading.Thread(target=self._parse_thread_func)
+        self.parse_thread.daemon = True
+        self.parse_thread.start()
+        logger.info("解析线程已启动")
+    
+    def stop_parser(self):
+        """停止解析线程"""
+        self.parsing = False
+        if self.parse_thread:
+            self.parse_thread.join(timeout=2)
+            self.parse_thread = None
+    
+    def _parse_thread_func(self):
+        """解析线程函数"""
+        while self.parsing:
+            data = self.tcp_client.receive(timeout=1)
+            if data is None:
+                continue
             try:
-                data = self.tcp_client.receive()
-                if not data or data.get('status') != 'success':
-                    # 无需解析的数据
-                    continue
-                    
-                serial = data.get('serial')
-                response = data.get('response')
-                parsed_data = self.data_processor._parse_response(serial, response)
-                data_json = json.loads(parsed_data)
-                logger.info(f"解析数据: {data_json}")
-                
-                # 发送到数据库的API
-                # 此处调用数据库的API即可，将data_json发送出去
-                
-            except queue.Empty:
-                # 队列为空
-                logger.info("完成一轮数据解析")
-                break
+                self.handle_response(data)
             except Exception as e:
                 logger.error(f"解析数据失败: {e}")
 
@@ -364,72 +1245,214 @@ class Application:
         # 加载配置
         self.config = ConfigLoader.load_config()
         
-        # 创建TCP客户端
-        server_config = self.config.get('server', {})
-        self.tcp_client = TCPClient(
-            host=server_config.get('host', '127.0.0.1'),
-            port=server_config.get('port', 8888)
+        # 创建串口服务器连接池，每个串口服务器节点一个TCP连接
+        self.tcp_client = ServerPool(self.config)
+        
+        # 导入数据处理器，设备拓扑由配置文件决定
+        self.topology = ConfigLoader.load_topology(self.config)
+        self.data_processor = DataProcessor(self.topology)
+        # 数据快照，启动时先恢复上次的值
+        snapshot_config = self.config.get('snapshot', {})
+        self.snapshot = None
+        if snapshot_config.get('enabled', True):
+            self.snapshot = SnapshotStore(
+                self.data_processor,
+                # 快照需要可写，与日志目录一样使用相对于运行目录的路径
+                snapshot_config.get('file', 'data/snapshot.bin'),
+                snapshot_config.get('interval', 10.0)
+            )
+            self.snapshot.load()
+
+        # 创建设备管理器
+        self.device_manager = DeviceManager(
+            self.tcp_client,
+            self.config,
+            self.data_processor
         )
+
+        # 报警规则引擎，只计算引用了变化测点的规则
+        self.alarm_engine = ConfigLoader.load_alarms(self.config, self.data_processor)
         
-        # 导入数据处理器
-        self.data_processor = DataProcessor()
+        # 测点的分钟/小时/天统计，每个样本O(1)更新
+        rollups_config = self.config.get('rollups', {})
+        self.rollup_store = None
+        self.rollup_archive = None
+        if rollups_config.get('enabled', True):
+            # 已结束的小时/天统计归档到磁盘，重启后加载，导出可以覆盖超过内存保留范围的时间
+            archive_config = rollups_config.get('archive', {})
+            archive_enabled = archive_config.get('enabled', True)
+            self.rollup_store = RollupStore(
+                rollups_config.get('resolutions'),
+                archive_config.get('resolutions', ['hour', 'day']) if archive_enabled else ()
+            )
+            if archive_enabled:
+                self.rollup_archive = RollupArchive(
+                    self.rollup_store,
+                    archive_config.get('directory', 'data/rollups'),
+                    archive_config.get('interval', 60.0)
+                )
+                self.rollup_archive.load()
+            self.data_processor.add_listener(self.rollup_store.on_update)
 
         # 创建API服务端
         api_config = self.config.get('api', {})
         self.api_server = APIService(
             host=api_config.get('host', '0.0.0.0'),
             port=api_config.get('port', 5000),
-            data_manager=self.data_processor
+            data_manager=self.data_processor,
+            device_manager=self.device_manager,
+            alarm_engine=self.alarm_engine,
+            rollup_store=self.rollup_store,
+            compression=api_config.get('compression'),
+            export_config=self.config.get('export'),
+            rollup_archive=self.rollup_archive
         )
+        self.api_server.add_stats_source('tcp', self.tcp_client.get_stats)
+        self.api_server.add_stats_source('data_view', self.api_server.data_view.stats)
+        if self.alarm_engine:
+            self.api_server.add_stats_source('alarms', self.alarm_engine.stats)
+        if self.rollup_store:
+            self.api_server.add_stats_source('rollups', self.rollup_store.stats)
+            self.api_server.add_stats_source('export', self.api_server.exporter.stats)
+        if self.rollup_archive:
+            self.api_server.add_stats_source('rollup_archive', self.rollup_archive.stats)
+        if self.snapshot:
+            self.api_server.add_stats_source('snapshot', self.snapshot.stats)
+        
+        # 链路追踪，环境变量 WUST_TRACE 或 tracing.enabled 开启
+        if tracer.configure(self.config.get('tracing'), 'logs/trace_backend.json', 'backend'):
+            self.api_server.add_stats_source('tracing', tracer.stats)
+        
+        # 配置文件监视
+        self.config_watcher = None
+        self.cmd_list_path = None
+    
+    def load_commands(self):
+        """加载命令列表"""
+        # 优先从可执行文件目录加载命令列表
+        cmd_list_path = 'config/cmd_list.json'
+        
+        # 如果是打包环境，检查可执行文件所在目录
+        if getattr(sys, 'frozen', False):
+            exe_dir = os.path.dirname(sys.executable)
+            external_cmd_list = os.path.join(exe_dir, 'config/cmd_list.json')
+            if os.path.exists(external_cmd_list):
+                cmd_list_path = external_cmd_list
+                logger.info(f"使用外部命令列表: {external_cmd_list}")
+            else:
+                # 使用打包内的命令列表
+                cmd_list_path = os.path.join(sys._MEIPASS, 'config/cmd_list.json')
+                logger.info(f"使用内部命令列表: {cmd_list_path}")
 
-        # 创建设备管理器
-        self.device_manager = DeviceManager(
-            self.tcp_client,
-            self.config,
-            self.data_processor
+        # 加载命令列表
+        self.cmd_list_path = cmd_list_path
+        with open(cmd_list_path, 'r', encoding='utf-8') as file:
+            json_data_list = json.load(file)
+            logger.info(f"成功加载命令列表，包含 {len(json_data_list)} 条命令")
+        return json_data_list
+    
+    def reload_commands(self, path):
+        """命令列表变化后重新加载，只重新编码变化的命令"""
+        with open(path, 'r', encoding='utf-8') as file:
+            json_data_list = json.load(file)
+        added, removed, modified = self.device_manager.set_commands(json_data_list)
+        logger.info(
+            f"命令列表已重新加载，共 {len(json_data_list)} 条，新增 {added} 条，删除 {removed} 条，修改 {modified} 条"
         )
+        if (added or removed or modified) and self.config.get('modbus', {}).get('mode', 'poll') == 'schedule':
+            self._reinstall_schedule()
+    
+    def _reinstall_schedule(self):
+        """重新下发轮询计划"""
+        for tcp_client in self.tcp_client.connections():
+            if tcp_client.is_connected_status():
+                self.device_manager.install_schedule(tcp_client)
+    
+    def reload_config(self, path):
+        """config.yaml变化后重新加载，只应用变化的部分"""
+        new_config = ConfigLoader.load_config(path)
+        old_config = self.config
+        
+        # 串口变化：删除和修改的串口先关闭，新增和修改的串口再打开
+        old_ports = {normalize_port(port['name']): port for port in old_config.get('serial_ports', [])}
+        new_ports = {normalize_port(port['name']): port for port in new_config.get('serial_ports', [])}
+        close_ports = [old_ports[name]['name'] for name in old_ports
+                       if name not in new_ports or new_ports[name] != old_ports[name]]
+        open_ports = [new_ports[name] for name in new_ports
+                      if name not in old_ports or new_ports[name] != old_ports[name]]
+        
+        modbus_changed = new_config.get('modbus') != old_config.get('modbus')
+        old_mode = old_config.get('modbus', {}).get('mode', 'poll')
+        for key in ('server', 'servers', 'api', 'queue', 'topology'):
+            if new_config.get(key) != old_config.get(key):
+                logger.warning(f"配置 {key} 已修改，需要重启后生效")
+        
+        # 原地更新，设备管理器等持有的是同一个配置对象
+        old_config['serial_ports'] = new_config.get('serial_ports', [])
+        old_config['modbus'] = new_config.get('modbus', {})
+        
+        if close_ports or open_ports:
+            self.tcp_client.set_serial_ports(old_config['serial_ports'])
+            self.device_manager.apply_serial_ports(close_ports, open_ports)
+        if modbus_changed and old_config['modbus'].get('mode', 'poll') == 'schedule':
+            self._reinstall_schedule()
+        elif old_mode == 'schedule' and old_config['modbus'].get('mode', 'poll') != 'schedule':
+            # 切换回 poll 模式，停止服务器上的轮询计划，由后端逐条发送
+            for tcp_client in self.tcp_client.connections():
+                if tcp_client.is_connected_status():
+                    self.device_manager.stop_schedule(tcp_client)
+        logger.info(f"配置已重新加载: 关闭 {len(close_ports)} 个串口，打开 {len(open_ports)} 个串口")
     
     def run(self):
         """运行应用"""
-        # 连接服务器和RESTful API
-        server_connected = self.tcp_client.connect()
+        self.device_manager.set_commands(self.load_commands())
+        # 初始化串口作为握手，每次连接（包括断线重连）成功后自动执行
+        # poll: 后端逐条发送请求；schedule: 轮询计划下发给串口服务器，由服务器本地轮询
+        # 轮询计划的握手总是注册，运行中切换到 schedule 模式后重连也会下发计划，poll 模式下不下发
+        self.tcp_client.add_handshake(self.device_manager.init_serial)
+        self.tcp_client.add_handshake(self.device_manager.install_schedule)
+        
+        # 连接服务器和RESTful API，连接失败时如果开启了自动重连会在后台继续尝试
+        server_connected = self.tcp_client.connect() or self.tcp_client.is_running()
         api_server = self.api_server.run_in_thread()
         
         if server_connected and api_server:
             try:
-                # 初始化串口
-                self.device_manager.init_serial()
-
-                # 优先从可执行文件目录加载命令列表
-                cmd_list_path = 'config/cmd_list.json'
+                # 解析线程与轮询并行运行，响应到达后立即更新数据
+                self.device_manager.start_parser()
+                if self.snapshot:
+                    self.snapshot.start()
+                if self.rollup_archive:
+                    self.rollup_archive.start()
+                if self.alarm_engine:
+                    self.alarm_engine.start()
                 
-                # 如果是打包环境，检查可执行文件所在目录
-                if getattr(sys, 'frozen', False):
-                    exe_dir = os.path.dirname(sys.executable)
-                    external_cmd_list = os.path.join(exe_dir, 'config/cmd_list.json')
-                    if os.path.exists(external_cmd_list):
-                        cmd_list_path = external_cmd_list
-                        logger.info(f"使用外部命令列表: {external_cmd_list}")
-                    else:
-                        # 使用打包内的命令列表
-                        cmd_list_path = os.path.join(sys._MEIPASS, 'config/cmd_list.json')
-                        logger.info(f"使用内部命令列表: {cmd_list_path}")
-
-                # 加载命令列表
-                with open(cmd_list_path, 'r', encoding='utf-8') as file:
-                    json_data_list = json.load(file)
-                    logger.info(f"成功加载命令列表，包含 {len(json_data_list)} 条命令")
+                # 监视配置文件，修改后自动重新加载
+                reload_config = self.config.get('reload', {})
+                if reload_config.get('enabled', True):
+                    self.config_watcher = ConfigWatcher(reload_config.get('interval', 2.0))
+                    self.config_watcher.watch(ConfigLoader.resolve_path('config/config.yaml'), self.reload_config)
+                    self.config_watcher.watch(self.cmd_list_path, self.reload_commands)
+                    self.config_watcher.start()
                     
-                # 主循环
-                while self.tcp_client.is_connected_status():
+                # 主循环，断线期间继续轮询，有界队列只保留最新的请求
+                while self.tcp_client.is_running():
                     time.sleep(1)
-                    # 发送命令列表
-                    self.device_manager.send_json_list(json_data_list)
-                    # 解析接收到的数据
-                    self.device_manager.parse_all_data()
+                    if self.config.get('modbus', {}).get('mode', 'poll') != 'schedule':
+                        # 发送命令列表
+                        self.device_manager.send_json_list(self.device_manager.commands)
 
             finally:
                 # 断开连接
+                if self.config_watcher:
+                    self.config_watcher.stop()
+                self.device_manager.stop_parser()
+                if self.snapshot:
+                    self.snapshot.stop()
+                if self.rollup_archive:
+                    self.rollup_archive.stop()
+                if self.alarm_engine:
+                    self.alarm_engine.stop()
                 self.tcp_client.disconnect()
         else:
             if not server_connected:
@@ -0,0 +1,105 @@
+"""
+历史数据导出工具
+
+从运行中的后端的 /export 接口下载测点统计，边接收边写入文件，导出大时间范围时内存占用不变。
+
+用法:
+    python backen/export.py --device 3F/302通风柜 --start 2025-01-01 --end 2025-04-01 -o 302.csv
+    python backen/export.py --point 3F/302通风柜/面风速 --resolution day --format ndjson -o 302.ndjson
+    python backen/export.py --url http://192.168.1.10:8899 --device 3F --resolution minute
+"""
+
+import os
+import sys
+import json
+import time
+import argparse
+import http.client
+from urllib.parse import urlencode, urlparse
+
+# 添加上级目录到路径
+sys.path.append(os.path.dirname(os.path.dirname(__file__)))
+from utils.history_export import FORMATS, parse_time
+
+CHUNK_SIZE = 64 * 1024
+
+
+def download(base_url, params, output, timeout=60.0):
+    """请求 /export 并把响应逐块写入文件
+
+    Args:
+        base_url: 后端地址，如 http://127.0.0.1:8899
+        params: 查询参数列表 [(名称, 值), ...]
+        output: 已打开的二进制文件
+        timeout: 单次读取的超时（秒）
+
+    Returns:
+        int: 写入的字节数
+    """
+    parsed = urlparse(base_url)
+    connection = http.client.HTTPConnection(parsed.hostname, parsed.port or 80, timeout=timeout)
+    try:
+        connection.request('GET', f"{parsed.path.rstrip('/')}/export?{urlencode(params)}")
+        response = connection.getresponse()
+        if response.status != 200:
+            body = response.read()
+            try:
+                message = json.loads(body).get('message', body)
+            except ValueError:
+                message = body.decode('utf-8', errors='replace')
+            raise RuntimeError(f"导出失败 ({response.status}): {message}")
+        written = 0
+        while True:
+            data = response.read(CHUNK_SIZE)
+            if not data:
+                break
+            output.write(data)
+            written += len(data)
+        return written
+    finally:
+        connection.close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="导出测点统计")
+    parser.add_argument('--url', default="http://127.0.0.1:8899", help="后端API地址")
+    parser.add_argument('--point', action='append', default=[], help="测点路径，可重复")
+    parser.add_argument('--device', help="设备路径，导出该设备下的所有测点")
+    parser.add_argument('--resolution', default='hour', help="统计粒度 minute/hour/day")
+    parser.add_argument('--start', help="开始时间，秒数或 YYYY-MM-DD[ HH:MM[:SS]]")
+    parser.add_argument('--end', help="结束时间（不包含），格式同 --start")
+    parser.add_argument('--format', choices=sorted(FORMATS), default='csv', help="导出格式")
+    parser.add_argument('-o', '--output', help="输出文件，不指定时写到标准输出")
+    args = parser.parse_args()
+
+    if not args.point and not args.device:
+        parser.error("需要指定 --point 或 --device")
+    params = [('point', point) for point in args.point]
+    if args.device:
+        params.append(('device', args.device))
+    params += [('resolution', args.resolution), ('format', args.format)]
+    try:
+        # 先在本地检查时间格式，统一以秒数发送
+        for name in ('start', 'end'):
+            value = parse_time(getattr(args, name))
+            if value is not None:
+                params.append((name, value))
+    except ValueError as e:
+        parser.error(str(e))
+
+    started = time.perf_counter()
+    try:
+        if args.output:
+            with open(args.output, 'wb') as output:
+                written = download(args.url, params, output)
+        else:
+            written = download(args.url, params, sys.stdout.buffer)
+    except (OSError, RuntimeError) as e:
+        print(e, file=sys.stderr)
+        sys.exit(1)
+    elapsed = time.perf_counter() - started
+    print(f"导出 {written} 字节，用时 {elapsed:.1f} 秒", file=sys.stderr)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,404 @@
+"""
+APIService 压力测试工具
+
+在本进程中启动 DataProcessor + APIService，用合成数据或回放的历史数据持续喂给解析器，
+同时以指定并发请求 /data、/com/<com>/id/<id>、/health，输出各接口的吞吐量和 p50/p95/p99 延迟，
+以及读负载下数据解析的变慢程度（与无读负载时对比）。HTTP请求在单独的子进程中发出，
+负载生成本身不与解析争用GIL，变慢程度只反映API处理请求的开销。
+也可以用 --url 压测已经运行的后端，此时只输出接口延迟和压测结束时 /stats 中的 ingest_latency
+（读取到可见的延迟，滚动窗口，不能区分压测前后），不计算变慢倍数。
+
+用法:
+    python backen/loadtest.py --concurrency 16 --duration 30
+    python backen/loadtest.py --feed replay --replay-file logs/2025-01-01.log --rate 200
+    python backen/loadtest.py --url http://192.168.1.10:5000 --concurrency 32 --json
+"""
+
+import os
+import sys
+import re
+import json
+import time
+import random
+import argparse
+import threading
+import multiprocessing
+import http.client
+from urllib.parse import urlparse
+
+# 添加上级目录到路径
+sys.path.append(os.path.dirname(os.path.dirname(__file__)))
+from utils.Logger import logger
+from utils.metrics import LatencyStats
+from utils.modbus import calculate_crc
+
+# 日志中记录的响应: "接收到服务器数据: COM45 1F 03 3A ..."
+LOG_RESPONSE_PATTERN = re.compile(r'接收到\S*数据: (\S+) ((?:[0-9A-Fa-f]{2} ?)+)$')
+
+
+class SyntheticFeed:
+    """合成数据源，按命令列表为每条轮询命令生成带随机数据和正确CRC的响应帧"""
+
+    def __init__(self, commands, seed=None):
+        """
+        Args:
+            commands: 命令列表，格式与 config/cmd_list.json 一致
+            seed: 随机数种子，指定后每次生成的数据相同
+        """
+        self.commands = [
+            (command['serial'], int(command['slave_adress']), int(command['function_code']), int(command['quantity']))
+            for command in commands
+        ]
+        self.random = random.Random(seed)
+
+    def __iter__(self):
+        while True:
+            for serial, slave, function_code, quantity in self.commands:
+                payload = bytes(self.random.getrandbits(8) for _ in range(quantity * 2))
+                frame = bytes([slave, function_code, len(payload)]) + payload
+                yield serial, frame + calculate_crc(frame)
+
+
+class ReplayFeed:
+    """回放数据源，读取记录的响应后循环回放
+
+    支持两种文件格式：每行一个JSON {"serial": "COM45", "response": "1F 03 ..."}，
+    或者后端日志（"接收到服务器数据: COM45 1F 03 ..." 行）。
+    """
+
+    def __init__(self, path):
+        self.frames = []
+        with open(path, 'r', encoding='utf-8', errors='replace') as file:
+            for line in file:
+                line = line.strip()
+                if not line:
+                    continue
+                if line.startswith('{'):
+                    try:
+                        item = json.loads(line)
+                        self.frames.append((item['serial'], bytes.fromhex(item['response'].replace(' ', ''))))
+                    except (ValueError, KeyError):
+                        pass
+                    continue
+                match = LOG_RESPONSE_PATTERN.search(line)
+                if match:
+                    self.frames.append((match.group(1), bytes.fromhex(match.group(2).replace(' ', ''))))
+        if not self.frames:
+            raise ValueError(f"回放文件中没有可用的响应: {path}")
+        logger.info(f"回放文件 {path} 共 {len(self.frames)} 条响应")
+
+    def __iter__(self):
+        while True:
+            for frame in self.frames:
+                yield frame
+
+
+class IngestDriver:
+    """解析负载，按指定速率把数据源的响应交给数据处理器解析，统计解析耗时"""
+
+    def __init__(self, data_processor, feed, rate=0):
+        """
+        Args:
+            data_processor: 数据处理器
+            feed: 数据源，迭代得到 (串口, 响应帧)
+            rate: 每秒解析的帧数，0表示尽可能快
+        """
+        self.data_processor = data_processor
+        self.feed = iter(feed)
+        self.rate = rate
+        self.running = False
+        self.thread = None
+        self.lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        """开始新的统计阶段"""
+        with self.lock:
+            self.count = 0
+            self.started = time.perf_counter()
+            self.latency = LatencyStats(window=100000)
+
+    def start(self):
+        self.running = True
+        self.thread = threading.Thread(target=self._ingest_thread_func)
+        self.thread.daemon = True
+        self.thread.start()
+
+    def stop(self):
+        self.running = False
+        if self.thread:
+            self.thread.join(timeout=2)
+
+    def _ingest_thread_func(self):
+        interval = 1.0 / self.rate if self.rate else 0
+        next_time = time.perf_counter()
+        while self.running:
+            serial, frame = next(self.feed)
+            start = time.perf_counter()
+            self.data_processor._parse_response(serial, frame, time.time())
+            elapsed = time.perf_counter() - start
+            with self.lock:
+                self.count += 1
+            self.latency.record(elapsed)
+            if interval:
+                next_time += interval
+                delay = next_time - time.perf_counter()
+                if delay > 0:
+                    time.sleep(delay)
+                else:
+                    # 跟不上目标速率时不追赶，避免突发
+                    next_time = time.perf_counter()
+
+    def snapshot(self):
+        """当前阶段的解析速率和耗时"""
+        with self.lock:
+            count = self.count
+            elapsed = time.perf_counter() - self.started
+        return dict(self.latency.snapshot(), frames_per_sec=round(count / elapsed, 1) if elapsed else 0.0)
+
+
+class HttpLoad:
+    """HTTP读负载，每个并发一个线程和一个长连接，按权重随机选择接口"""
+
+    def __init__(self, base_url, targets, concurrency=8, timeout=5.0):
+        """
+        Args:
+            base_url: 后端地址，如 http://127.0.0.1:5000
+            targets: [(接口名, 路径列表, 权重), ...]
+            concurrency: 并发数
+            timeout: 单个请求超时（秒）
+        """
+        parsed = urlparse(base_url)
+        self.host = parsed.hostname
+        self.port = parsed.port or 80
+        self.targets = targets
+        self.concurrency = concurrency
+        self.timeout = timeout
+        self.running = False
+        self.threads = []
+        self.lock = threading.Lock()
+        # 接口名 -> {"latency", "ok", "errors", "bytes"}
+        self.results = {
+            name: {"latency": LatencyStats(window=100000), "ok": 0, "errors": 0, "bytes": 0}
+            for name, _, _ in targets
+        }
+
+    def run(self, duration):
+        """运行指定时长（秒），返回实际运行时间"""
+        self.running = True
+        start = time.perf_counter()
+        for index in range(self.concurrency):
+            thread = threading.Thread(target=self._worker_thread_func, args=(index,))
+            thread.daemon = True
+            thread.start()
+            self.threads.append(thread)
+        time.sleep(duration)
+        self.running = False
+        for thread in self.threads:
+            thread.join(timeout=self.timeout + 1)
+        return time.perf_counter() - start
+
+    def _worker_thread_func(self, index):
+        chooser = random.Random(index)
+        names = [name for name, _, _ in self.targets]
+        paths = {name: paths for name, paths, _ in self.targets}
+        weights = [weight for _, _, weight in self.targets]
+        connection = None
+        while self.running:
+            name = chooser.choices(names, weights)[0]
+            path = chooser.choice(paths[name])
+            result = self.results[name]
+            start = time.perf_counter()
+            try:
+                if connection is None:
+                    connection = http.client.HTTPConnection(self.host, self.port, timeout=self.timeout)
+                connection.request('GET', path)
+                response = connection.getresponse()
+                body = response.read()
+                elapsed = time.perf_counter() - start
+                result["latency"].record(elapsed)
+                with self.lock:
+                    if response.status == 200:
+                        result["ok"] += 1
+                    else:
+                        result["errors"] += 1
+                    result["bytes"] += len(body)
+            except Exception:
+                with self.lock:
+                    result["errors"] += 1
+                if connection is not None:
+                    connection.close()
+                connection = None
+        if connection is not None:
+            connection.close()
+
+    def report(self, elapsed):
+        """各接口的吞吐量和延迟"""
+        report = {}
+        for name, result in self.results.items():
+            latency = result["latency"].snapshot()
+            report[name] = {
+                "requests": result["ok"] + result["errors"],
+                "errors": result["errors"],
+                "req_per_sec": round((result["ok"] + result["errors"]) / elapsed, 1) if elapsed else 0.0,
+                "avg_bytes": round(result["bytes"] / result["ok"]) if result["ok"] else 0,
+                "p50_ms": latency["p50_ms"],
+                "p95_ms": latency["p95_ms"],
+                "p99_ms": latency["p99_ms"],
+                "max_ms": latency["max_ms"],
+            }
+        return report
+
+
+def run_http_load(base_url, targets, concurrency, duration, ready, results):
+    """子进程中运行读负载，开始前设置 ready，结束后把 (运行时间, 报告) 放入 results"""
+    load = HttpLoad(base_url, targets, concurrency)
+    ready.set()
+    elapsed = load.run(duration)
+    results.put((elapsed, load.report(elapsed)))
+
+
+def build_targets(topology, weights):
+    """按拓扑生成被测接口的路径"""
+    device_paths = sorted({
+        f"/com/{port}/id/{slave}" for port, slave in topology.bindings.keys()
+    })
+    targets = []
+    for name, paths in (("data", ["/data"]), ("com", device_paths), ("health", ["/health"])):
+        weight = weights.get(name, 0)
+        if weight > 0 and paths:
+            targets.append((name, paths, weight))
+    return targets
+
+
+def fetch_ingest_latency(base_url, timeout=5.0):
+    """从运行中的后端的 /stats 获取解析延迟"""
+    parsed = urlparse(base_url)
+    connection = http.client.HTTPConnection(parsed.hostname, parsed.port or 80, timeout=timeout)
+    try:
+        connection.request('GET', '/stats')
+        return json.loads(connection.getresponse().read()).get('ingest_latency', {})
+    finally:
+        connection.close()
+
+
+def slowdown(baseline, loaded):
+    """读负载下解析变慢的倍数"""
+    result = {}
+    for key in ("p50_ms", "p95_ms", "p99_ms", "avg_ms"):
+        if baseline.get(key):
+            result[key] = round(loaded.get(key, 0) / baseline[key], 2)
+    if baseline.get("frames_per_sec") and "frames_per_sec" in loaded:
+        result["throughput"] = round(loaded["frames_per_sec"] / baseline["frames_per_sec"], 2)
+    return result
+
+
+def print_report(result):
+    """以表格形式输出结果"""
+    print(f"\n并发 {result['concurrency']}，持续 {result['duration']} 秒，数据源 {result['feed']}")
+    print(f"{'接口':<8}{'请求数':>10}{'错误':>8}{'req/s':>10}{'p50(ms)':>10}{'p95(ms)':>10}{'p99(ms)':>10}{'max(ms)':>10}")
+    for name, item in result["http"].items():
+        print(f"{name:<8}{item['requests']:>10}{item['errors']:>8}{item['req_per_sec']:>10}"
+              f"{item['p50_ms']:>10}{item['p95_ms']:>10}{item['p99_ms']:>10}{item['max_ms']:>10}")
+    ingest = result["ingest"]
+    if "server" in ingest:
+        item = ingest["server"]
+        print(f"\n后端读取到可见的延迟（/stats，滚动窗口）: "
+              f"p50 {item.get('p50_ms')}ms  p95 {item.get('p95_ms')}ms  p99 {item.get('p99_ms')}ms")
+        return
+    print("\n数据解析:")
+    for phase in ("baseline", "loaded"):
+        item = ingest[phase]
+        print(f"  {phase:<9} 帧/秒 {item.get('frames_per_sec', '-')}  "
+              f"p50 {item.get('p50_ms')}ms  p95 {item.get('p95_ms')}ms  p99 {item.get('p99_ms')}ms")
+    print(f"  变慢倍数  {ingest['slowdown']}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="APIService 压力测试")
+    parser.add_argument('--url', help="压测已经运行的后端，如 http://127.0.0.1:5000，不指定时在本进程中启动")
+    parser.add_argument('--port', type=int, default=5099, help="本进程启动API服务时使用的端口")
+    parser.add_argument('--concurrency', type=int, default=8, help="并发数")
+    parser.add_argument('--duration', type=float, default=10.0, help="读负载持续时间（秒）")
+    parser.add_argument('--baseline', type=float, default=5.0, help="无读负载的解析基线时间（秒）")
+    parser.add_argument('--weights', default="data=1,com=4,health=1", help="各接口的请求权重")
+    parser.add_argument('--feed', choices=('synthetic', 'replay'), default='synthetic', help="数据源")
+    parser.add_argument('--replay-file', help="回放文件，NDJSON或后端日志")
+    parser.add_argument('--rate', type=float, default=0, help="每秒解析的帧数，0表示尽可能快")
+    parser.add_argument('--seed', type=int, default=None, help="合成数据的随机数种子")
+    parser.add_argument('--json', action='store_true', help="以JSON格式输出结果")
+    args = parser.parse_args()
+
+    from back import APIService, ConfigLoader
+    from utils.process_data import DataProcessor
+
+    weights = {}
+    for item in args.weights.split(','):
+        name, _, weight = item.partition('=')
+        weights[name.strip()] = float(weight or 1)
+
+    config = ConfigLoader.load_config()
+    topology = ConfigLoader.load_topology(config)
+    targets = build_targets(topology, weights)
+
+    driver = None
+    if args.url:
+        base_url = args.url.rstrip('/')
+    else:
+        data_processor = DataProcessor(topology)
+        if args.feed == 'replay':
+            if not args.replay_file:
+                parser.error("--feed replay 需要指定 --replay-file")
+            feed = ReplayFeed(args.replay_file)
+        else:
+            with open(ConfigLoader.resolve_path('config/cmd_list.json'), 'r', encoding='utf-8') as file:
+                feed = SyntheticFeed(json.load(file), args.seed)
+        api = APIService('127.0.0.1', args.port, data_processor)
+        api.run_in_thread()
+        base_url = f"http://127.0.0.1:{args.port}"
+
+        # 先在没有读负载时测量解析基线
+        driver = IngestDriver(data_processor, feed, args.rate)
+        driver.start()
+        time.sleep(args.baseline)
+        baseline = driver.snapshot()
+
+    # 读负载在子进程中运行（spawn，不复制本进程的线程和锁），子进程启动完成后才开始统计负载阶段
+    context = multiprocessing.get_context('spawn')
+    ready = context.Event()
+    results = context.Queue()
+    process = context.Process(
+        target=run_http_load,
+        args=(base_url, targets, args.concurrency, args.duration, ready, results)
+    )
+    process.daemon = True
+    process.start()
+    ready.wait()
+    if driver:
+        driver.reset()
+    elapsed, report = results.get()
+    process.join()
+
+    if driver:
+        loaded = driver.snapshot()
+        driver.stop()
+        ingest = {"baseline": baseline, "loaded": loaded, "slowdown": slowdown(baseline, loaded)}
+    else:
+        # /stats 的 ingest_latency 是读取到可见的延迟的滚动窗口，压测前后的数据重叠，不计算变慢倍数
+        ingest = {"server": fetch_ingest_latency(base_url)}
+
+    result = {
+        "concurrency": args.concurrency,
+        "duration": round(elapsed, 2),
+        "feed": "external" if args.url else args.feed,
+        "http": report,
+        "ingest": ingest,
+    }
+    if args.json:
+        print(json.dumps(result, ensure_ascii=False, indent=2))
+    else:
+        print_report(result)
+
+
+if __name__ == "__main__":
+    main()
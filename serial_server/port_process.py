@@ -0,0 +1,357 @@
+"""
+串口独立进程模式
+
+每个串口由一个独立的工作进程驱动，主进程通过管道转发请求。某个USB串口驱动卡死或长时间阻塞读
+只影响自己的进程，各串口的帧处理也不再共用一个GIL。主进程监督工作进程：进程崩溃后按退避时间重启，
+有请求等待结果而进程超过 request_timeout 没有任何消息时认为进程卡死，结束后重启；串口本身被拔出时进程退出，
+由端口监视器在设备重新插入后重新打开。
+"""
+
+import os
+import re
+import sys
+import threading
+import time
+import itertools
+import multiprocessing
+
+# 添加上级目录到路径
+sys.path.append(os.path.dirname(os.path.dirname(__file__)))
+from utils.Logger import logger
+from utils.turnaround import TurnaroundTable
+from serial_handler import SerialHandler
+
+# 使用spawn启动工作进程，Windows和Linux行为一致，也避免在多线程进程中fork
+_context = multiprocessing.get_context('spawn')
+
+
+def port_worker_main(conn, port_name, baudrate, timeout, queue_config, turnaround_config, turnaround_entries,
+                     tracing_config):
+    """工作进程入口，在进程内用 SerialHandler 驱动一个串口
+
+    管道消息:
+        主进程 -> 工作进程: ("request", 编号, 请求帧, 是否优先, 客户端, 关联ID) / ("stats", 编号) / ("close",)
+        工作进程 -> 主进程: ("ready", 是否打开成功) / ("response", 编号, 响应) / ("stats", 编号, 统计) /
+                            ("turnaround", {从站: 统计}) / ("closed",)
+    """
+    from utils.tracing import tracer
+
+    if tracing_config:
+        # 追踪文件名中的 {port} 替换为串口名，每个工作进程一个文件
+        path = tracing_config['file'].format(port=re.sub(r'[^\w.-]', '_', port_name))
+        tracer.configure(dict(tracing_config, file=path), path, f"serial_{port_name}")
+
+    turnaround = None
+    if turnaround_config is not None:
+        turnaround = TurnaroundTable(None, **turnaround_config)
+        turnaround.merge(port_name, turnaround_entries or {})
+        turnaround.dirty = False
+
+    handler = SerialHandler(port_name, baudrate, timeout, turnaround=turnaround, **queue_config)
+    send_lock = threading.Lock()
+    stopped = threading.Event()
+
+    def send(message):
+        with send_lock:
+            conn.send(message)
+
+    def reply(txid, response):
+        """事务结束，在 SerialHandler 的工作线程中调用"""
+        try:
+            send(("response", txid, response))
+            if not handler.is_connected and not stopped.is_set():
+                # 串口读写出错（通常是被拔出），通知主进程后退出
+                send(("closed",))
+                stopped.set()
+        except (EOFError, OSError):
+            stopped.set()
+
+    def sync_turnaround():
+        while not stopped.wait(5.0):
+            if turnaround is not None and turnaround.dirty:
+                turnaround.dirty = False
+                try:
+                    send(("turnaround", turnaround.export(port_name)))
+                except (EOFError, OSError):
+                    stopped.set()
+
+    connected = handler.connect()
+    send(("ready", connected))
+    if not connected:
+        conn.close()
+        return
+
+    thread = threading.Thread(target=sync_turnaround)
+    thread.daemon = True
+    thread.start()
+
+    def receive():
+        while not stopped.is_set():
+            try:
+                message = conn.recv()
+            except (EOFError, OSError):
+                # 主进程退出或关闭了管道
+                break
+            if message[0] == "request":
+                # 请求直接放入 SerialHandler 的事务队列，由其工作线程按优先级和客户端轮转执行
+                txid, request, priority, client, cid = message[1:]
+                if not handler.submit(request, lambda response, txid=txid: reply(txid, response),
+                                      priority=priority, client=client, cid=cid):
+                    reply(txid, None)
+            elif message[0] == "stats":
+                send(("stats", message[1], handler.stats()))
+            elif message[0] == "close":
+                break
+        stopped.set()
+
+    receiver = threading.Thread(target=receive)
+    receiver.daemon = True
+    receiver.start()
+    stopped.wait()
+    handler.close()
+    if turnaround is not None:
+        try:
+            send(("turnaround", turnaround.export(port_name)))
+        except (EOFError, OSError):
+            pass
+    tracer.flush()
+    conn.close()
+
+
+class PortProcess:
+    """串口工作进程的代理，接口与 SerialHandler 相同，SerialManager 按配置选择使用
+
+    请求经管道发给工作进程，由进程内的 SerialHandler 排队执行，结果按请求编号返回。
+    """
+
+    def __init__(self, port_name, baudrate, timeout=1, queue_config=None, turnaround=None, tracing=None,
+                 request_timeout=5.0, start_timeout=10.0, restart_delay=1.0, max_restart_delay=30.0):
+        """
+        Args:
+            port_name: 串口名
+            baudrate: 波特率
+            timeout: 读超时（秒）
+            queue_config: 串口事务队列的调度参数，见 SerialHandler
+            turnaround: 主进程的从站响应时间学习表，工作进程学习的结果同步回来统一保存
+            tracing: 工作进程的链路追踪配置，None表示不追踪
+            request_timeout: 有请求等待结果时，工作进程超过该时间（秒）没有任何消息则认为卡死并重启
+            start_timeout: 等待工作进程打开串口的最长时间（秒）
+            restart_delay/max_restart_delay: 崩溃后重启的退避时间（秒），连续崩溃时加倍
+        """
+        self.port_name = port_name
+        self.baudrate = baudrate
+        self.timeout = timeout
+        self.queue_config = queue_config or {}
+        self.turnaround = turnaround
+        self.tracing = tracing
+        self.request_timeout = request_timeout
+        self.start_timeout = start_timeout
+        self.restart_delay = restart_delay
+        self.max_restart_delay = max_restart_delay
+        self.logger = logger
+
+        self.is_connected = False
+        self.process = None
+        self.conn = None
+        self.lock = threading.Lock()
+        self.send_lock = threading.Lock()
+        # 每次关闭加1，旧的监督线程发现代数变化后退出
+        self.generation = 0
+        self.ids = itertools.count(1)
+        # 请求编号 -> {"event": Event, "response": 响应}
+        self.pending = {}
+        # 最近一次收到工作进程消息的时间，排队的请求较多时等待时间可能超过 request_timeout
+        self.last_message = 0.0
+
+        # 统计
+        self.restarts = 0
+        self.hangs = 0
+        self.started_at = None
+
+    def _spawn(self):
+        """启动工作进程并等待串口打开，成功时返回True"""
+        turnaround_config = None
+        turnaround_entries = None
+        if self.turnaround is not None:
+            table = self.turnaround
+            turnaround_config = {
+                "margin": table.margin, "min_timeout": table.min_timeout, "max_timeout": table.max_timeout,
+                "default_timeout": table.default_timeout, "gap_ratio": table.gap_ratio, "min_gap": table.min_gap,
+                "max_gap": table.max_gap, "default_gap": table.default_gap, "min_samples": table.min_samples,
+            }
+            turnaround_entries = table.export(self.port_name)
+        parent_conn, child_conn = _context.Pipe()
+        process = _context.Process(
+            target=port_worker_main,
+            args=(child_conn, self.port_name, self.baudrate, self.timeout, self.queue_config,
+                  turnaround_config, turnaround_entries, self.tracing),
+            name=f"serial-{self.port_name}"
+        )
+        process.daemon = True
+        process.start()
+        # 子进程持有自己的一端，主进程关闭后子进程退出时才能收到EOF
+        child_conn.close()
+        try:
+            ready = parent_conn.recv() if parent_conn.poll(self.start_timeout) else None
+        except (EOFError, OSError):
+            ready = None
+        if ready != ("ready", True):
+            self.logger.error(f"串口{self.port_name}工作进程启动失败: {ready}")
+            self._stop_process(process, parent_conn)
+            return False
+        self.process = process
+        self.conn = parent_conn
+        self.started_at = time.monotonic()
+        self.is_connected = True
+        self.logger.info(f"串口{self.port_name}工作进程已启动，pid {process.pid}")
+        return True
+
+    def connect(self):
+        """启动工作进程并打开串口"""
+        with self.lock:
+            if self.is_connected:
+                self.logger.warning(f"串口{self.port_name}已连接，无需重复连接")
+                return True
+            if not self._spawn():
+                return False
+            generation = self.generation
+        thread = threading.Thread(target=self._supervise_thread_func, args=(generation,))
+        thread.daemon = True
+        thread.start()
+        return True
+
+    @staticmethod
+    def _stop_process(process, conn, graceful=True):
+        """结束工作进程，先请求退出，超时后强制结束"""
+        if graceful:
+            try:
+                conn.send(("close",))
+            except (EOFError, OSError):
+                pass
+            process.join(2)
+        if process.is_alive():
+            process.terminate()
+            process.join(2)
+        if process.is_alive():
+            process.kill()
+            process.join(2)
+        conn.close()
+
+    def close(self):
+        """关闭串口并结束工作进程，等待中的请求全部返回None"""
+        with self.lock:
+            self.generation += 1
+            self.is_connected = False
+            process, conn = self.process, self.conn
+            self.process = self.conn = None
+        if process is not None:
+            with self.send_lock:
+                self._stop_process(process, conn)
+        self._fail_pending()
+        self.logger.info(f"串口{self.port_name}已关闭")
+
+    def _fail_pending(self):
+        with self.lock:
+            pending, self.pending = self.pending, {}
+        for call in pending.values():
+            call["event"].set()
+
+    def _supervise_thread_func(self, generation):
+        """监督线程，接收工作进程的消息，进程崩溃后重启"""
+        delay = self.restart_delay
+        while True:
+            conn = self.conn
+            port_closed = False
+            while True:
+                try:
+                    message = conn.recv()
+                except (EOFError, OSError):
+                    break
+                self.last_message = time.monotonic()
+                if message[0] in ("response", "stats"):
+                    with self.lock:
+                        call = self.pending.pop(message[1], None)
+                    if call is not None:
+                        call["response"] = message[2]
+                        call["event"].set()
+                elif message[0] == "turnaround":
+                    if self.turnaround is not None:
+                        self.turnaround.merge(self.port_name, message[1])
+                elif message[0] == "closed":
+                    port_closed = True
+
+            with self.lock:
+                if self.generation != generation:
+                    return
+                self.is_connected = False
+                process = self.process
+                uptime = time.monotonic() - self.started_at
+            self._fail_pending()
+            if process is not None:
+                self._stop_process(process, conn, graceful=False)
+            if port_closed:
+                # 串口被拔出，由端口监视器重新打开
+                self.logger.warning(f"串口{self.port_name}读写出错，工作进程已退出")
+                return
+
+            self.logger.error(f"串口{self.port_name}工作进程异常退出，退出码 {process.exitcode}，{delay:.1f}秒后重启")
+            # 稳定运行一段时间后再崩溃，退避时间从头计算
+            if uptime > self.max_restart_delay:
+                delay = self.restart_delay
+            time.sleep(delay)
+            delay = min(delay * 2, self.max_restart_delay)
+            with self.lock:
+                if self.generation != generation:
+                    return
+                self.restarts += 1
+                if not self._spawn():
+                    # 串口已无法打开，交给端口监视器处理
+                    return
+
+    def _call(self, message, timeout):
+        """向工作进程发送消息并等待结果"""
+        call = {"event": threading.Event(), "response": None}
+        with self.lock:
+            if not self.is_connected:
+                return None
+            txid = next(self.ids)
+            self.pending[txid] = call
+            conn, process = self.conn, self.process
+        try:
+            with self.send_lock:
+                conn.send((message[0], txid) + message[1:])
+        except (EOFError, OSError):
+            with self.lock:
+                self.pending.pop(txid, None)
+            return None
+        sent = time.monotonic()
+        while not call["event"].wait(timeout):
+            # 工作进程仍在返回其他请求的结果，说明只是排队较长，继续等待
+            if time.monotonic() - max(sent, self.last_message) < timeout:
+                continue
+            with self.lock:
+                self.pending.pop(txid, None)
+            self.hangs += 1
+            self.logger.error(f"串口{self.port_name}工作进程 {timeout} 秒无响应，结束进程后重启")
+            # 结束进程后监督线程收到EOF，按崩溃处理并重启
+            process.kill()
+            return None
+        return call["response"]
+
+    def send_data(self, request, priority=False, client=None, cid=None):
+        """把Modbus请求发给工作进程，等待执行完成后返回响应，参数见 SerialHandler.send_data"""
+        if not self.is_connected:
+            self.logger.warning("串口未连接，无法发送数据")
+            return None
+        return self._call(("request", bytes(request), priority, client, cid), self.request_timeout)
+
+    def stats(self):
+        """工作进程内的事务队列统计，加上进程的监督信息"""
+        stats = self._call(("stats",), self.request_timeout) or {"port": self.port_name}
+        stats["connected"] = self.is_connected
+        stats["process"] = {
+            "pid": self.process.pid if self.process is not None else None,
+            "restarts": self.restarts,
+            "hangs": self.hangs,
+        }
+        return stats
@@ -0,0 +1,402 @@
+"""
+串口事务队列
+
+SerialHandler 驱动一个串口：请求放入事务队列，由单个工作线程逐个在串口上执行。
+串口服务器主进程（server.py）和串口独立进程模式的工作进程（port_process.py）都直接使用本模块，
+导入时没有副作用。
+"""
+
+import os
+import sys
+import threading
+import time
+from collections import OrderedDict, deque
+
+import serial
+
+# 添加上级目录到路径
+sys.path.append(os.path.dirname(os.path.dirname(__file__)))
+from utils.Logger import logger
+from utils.modbus import is_write_request
+from utils.rtu_framer import RtuFramer
+from utils.tracing import tracer
+from utils.metrics import LatencyStats
+
+
+class SerialHandler:
+    """单个串口处理类
+
+    每个串口一个事务队列，由单个工作线程逐个执行，多个客户端共用串口时不会交错读写。
+    写命令走高优先级队列；普通请求按客户端轮转调度，每个客户端每轮最多执行 quota 个事务，
+    排队中的事务数超过 max_pending 时直接拒绝，避免单个客户端占满串口。
+    """
+    # 未启用响应时间学习时，等待完整响应的最长时间（秒）
+    RESPONSE_TIMEOUT = 0.2
+    # 帧间静默的最短判断时间（秒），USB串口按块上报字节，不能只按3.5个字符时间判断
+    MIN_SILENCE = 0.02
+
+    def __init__(self, port_name, baudrate, timeout=1, client_quota=1, client_quotas=None, max_pending=50,
+                 turnaround=None, read_retries=1):
+        """
+        Args:
+            port_name: 串口名
+            baudrate: 波特率
+            timeout: 读超时（秒）
+            client_quota: 每个客户端每轮最多执行的事务数
+            client_quotas: 按客户端IP单独指定的每轮事务数，如 {"127.0.0.1": 4}
+            max_pending: 每个客户端最多排队的事务数
+            turnaround: 从站响应时间学习表，按从站决定读超时和请求间隔
+            read_retries: 读请求的响应CRC错误时立即重发的次数
+        """
+        self.port_name = port_name
+        self.baudrate = baudrate
+        self.timeout = timeout
+        self.serial_port = None
+        self.is_connected = False
+        self.logger = logger
+
+        self.client_quota = client_quota
+        self.client_quotas = client_quotas or {}
+        self.max_pending = max_pending
+        self.condition = threading.Condition()
+        # 高优先级事务（写命令）
+        self.priority_queue = deque()
+        # 客户端 -> 排队的事务，按轮转顺序排列
+        self.client_queues = OrderedDict()
+        # 当前轮到的客户端及本轮剩余的事务数
+        self.current_client = None
+        self.current_remaining = 0
+        # 串口读写锁，保证同一时间只有一个事务在串口上执行
+        self.io_lock = threading.Lock()
+        # 每次打开串口启动新的工作线程，旧线程发现代数变化后退出
+        self.generation = 0
+        self.turnaround = turnaround
+        # 上一次事务结束后，串口可以开始下一次事务的时间
+        self.ready_at = 0.0
+        # 响应帧重组，只把校验通过的帧交给下游
+        self.framer = RtuFramer()
+        # 功能码未知的响应在线路静默这么久后按CRC判断是否完整（3.5个字符时间，每个字符11位）
+        self.silence = max(self.MIN_SILENCE, 38.5 / int(baudrate))
+        self.read_retries = read_retries
+
+        # 统计
+        self.queue_wait = LatencyStats()
+        self.client_stats = {}
+        self.retries = 0
+        self.invalid_responses = 0
+
+    def connect(self):
+        """连接串口"""
+        try:
+            if self.is_connected:
+                self.logger.warning(f"串口{self.port_name}已连接，无需重复连接")
+                return True
+            self.serial_port = serial.Serial(
+                port=self.port_name,
+                baudrate=self.baudrate,
+                timeout=self.timeout
+            )
+            with self.condition:
+                self.is_connected = True
+                self.generation += 1
+                generation = self.generation
+            worker = threading.Thread(target=self._worker_thread_func, args=(generation,))
+            worker.daemon = True
+            worker.start()
+            self.logger.info(f"成功连接到{self.port_name}，波特率{self.baudrate}")
+            return True
+        except Exception as e:
+            self.logger.error(f"串口{self.port_name}连接失败: {e}")
+            self.is_connected = False
+            return False
+
+    def close(self):
+        """关闭串口，排队中的事务全部返回None"""
+        with self.condition:
+            self.is_connected = False
+            self.generation += 1
+            pending = list(self.priority_queue)
+            for queue in self.client_queues.values():
+                pending.extend(queue)
+            self.priority_queue.clear()
+            self.client_queues.clear()
+            self.condition.notify_all()
+        for transaction in pending:
+            self._finish(transaction)
+        if self.serial_port is not None:
+            try:
+                self.serial_port.close()
+            except Exception as e:
+                self.logger.error(f"关闭串口{self.port_name}错误: {e}")
+            self.serial_port = None
+        self.logger.info(f"串口{self.port_name}已关闭")
+
+    def _client_stats(self, client):
+        stats = self.client_stats.get(client)
+        if stats is None:
+            stats = self.client_stats[client] = {"served": 0, "rejected": 0, "queue_wait": LatencyStats(200)}
+        return stats
+
+    def _quota(self, client):
+        """客户端每轮可执行的事务数"""
+        host = str(client).rsplit(':', 1)[0]
+        return self.client_quotas.get(client, self.client_quotas.get(host, self.client_quota))
+
+    def _next_transaction(self):
+        """按优先级和客户端轮转选出下一个事务，调用方需持有 condition"""
+        if self.priority_queue:
+            return self.priority_queue.popleft()
+        while self.client_queues:
+            client, queue = next(iter(self.client_queues.items()))
+            if not queue:
+                del self.client_queues[client]
+                continue
+            if self.current_client != client or self.current_remaining <= 0:
+                self.current_client = client
+                self.current_remaining = self._quota(client)
+            transaction = queue.popleft()
+            self.current_remaining -= 1
+            if not queue:
+                del self.client_queues[client]
+                self.current_client = None
+            elif self.current_remaining <= 0:
+                # 本轮配额用完，排到队尾
+                self.client_queues.move_to_end(client)
+            return transaction
+        return None
+
+    def _worker_thread_func(self, generation):
+        """工作线程，逐个执行排队的事务"""
+        while True:
+            with self.condition:
+                transaction = None
+                while self.generation == generation:
+                    transaction = self._next_transaction()
+                    if transaction is not None:
+                        break
+                    self.condition.wait()
+                if transaction is None:
+                    return
+                wait = time.monotonic() - transaction["enqueued"]
+                self.queue_wait.record(wait)
+                stats = self._client_stats(transaction["client"])
+                stats["served"] += 1
+                stats["queue_wait"].record(wait)
+            now = time.time()
+            tracer.add("serial.queue_wait", now - wait, now, transaction["cid"], port=self.port_name)
+            try:
+                transaction["response"] = self._transact(transaction["request"], transaction["cid"])
+            finally:
+                self._finish(transaction)
+
+    def _finish(self, transaction):
+        """事务结束（执行完成或串口关闭），唤醒等待方并调用回调"""
+        transaction["event"].set()
+        callback = transaction.get("callback")
+        if callback is not None:
+            try:
+                callback(transaction["response"])
+            except Exception as e:
+                self.logger.error(f"串口{self.port_name}事务回调出错: {e}")
+
+    def _transact(self, request, cid=None):
+        """在串口上执行一次请求-响应事务，收到校验通过的响应帧后立即返回，不再固定等待
+
+        读到的字节经过帧重组器，上一次事务的残留字节和线路噪声被丢弃；收到的帧CRC错误时，
+        读请求在从站需要的间隔后立即重发（最多 read_retries 次），不等到超时，也不把错误的数据交给后端。
+
+        Args:
+            request: 请求帧
+            cid: 链路追踪的关联ID
+
+        Returns:
+            bytes: 校验通过的响应帧，没有有效响应时返回None
+        """
+        with self.io_lock:
+            if not self.is_connected:
+                return None
+            slave = request[0] if request else None
+            retries = 0 if is_write_request(request) else self.read_retries
+            try:
+                for attempt in range(retries + 1):
+                    if attempt:
+                        self.retries += 1
+                        self.logger.warning(f"串口{self.port_name}从站{slave}响应校验失败，第{attempt}次重发")
+                    frame, received = self._exchange(request, slave, cid)
+                    if frame is not None or not self.framer.corrupted:
+                        # 有效响应，或者从站没有响应（重发也只是再等一次超时）
+                        break
+                if frame is None:
+                    if received:
+                        self.invalid_responses += 1
+                    return None
+                return frame
+            except Exception as e:
+                # 读写出错通常是USB串口被拔出，关闭后由端口监视器在设备重新出现时重新打开
+                self.logger.error(f"发送请求失败: {e}")
+                self.close()
+                return None
+
+    def _exchange(self, request, slave, cid):
+        """发送一次请求并等待响应帧，调用方需持有 io_lock
+
+        Returns:
+            tuple: (校验通过的响应帧或None, 是否收到了字节)
+        """
+        if self.turnaround:
+            timeout = self.turnaround.timeout(self.port_name, slave)
+        else:
+            timeout = self.RESPONSE_TIMEOUT
+        # 与上一次事务之间保持从站需要的间隔
+        delay = self.ready_at - time.monotonic()
+        if delay > 0:
+            time.sleep(delay)
+        # 丢弃上一次超时后才到达的残留数据，避免被当作本次的响应
+        self.serial_port.reset_input_buffer()
+        self.framer.expect(request)
+        write_start = time.time()
+        self.serial_port.write(request)
+        start = time.monotonic()
+        tracer.add("serial.write", write_start, time.time(), cid, port=self.port_name)
+        self.logger.info(f"成功发送请求: {request.hex()}")
+
+        # 接收数据，直到重组出完整的响应帧或超时；CRC错误且没有剩余候选字节时不再等待
+        frame = None
+        received = 0
+        deadline = start + timeout
+        first_byte = None
+        last_byte = None
+        while True:
+            waiting = self.serial_port.in_waiting
+            if waiting > 0:
+                last_byte = time.monotonic()
+                if first_byte is None:
+                    first_byte = last_byte
+                data = self.serial_port.read(waiting)
+                received += len(data)
+                frame = self.framer.feed(data)
+                if frame is not None or (self.framer.corrupted and not self.framer.buffer):
+                    break
+            elif last_byte is not None and self.framer.buffer and time.monotonic() - last_byte >= self.silence:
+                # 线路静默，长度未知的帧（如功能码0x2B）按CRC判断是否完整
+                frame = self.framer.flush()
+                if frame is not None:
+                    break
+            if time.monotonic() >= deadline:
+                break
+            time.sleep(0.002)
+        self.framer.finish()
+        elapsed = time.monotonic() - start
+        if tracer.enabled:
+            # 等待响应: 写完到收到第一个字节；读取: 第一个字节到完整帧
+            offset = time.time() - time.monotonic()
+            read_start = first_byte if first_byte is not None else start + elapsed
+            tracer.add("serial.wait", start + offset, read_start + offset, cid, port=self.port_name)
+            tracer.add("serial.read", read_start + offset, start + elapsed + offset, cid,
+                       port=self.port_name, bytes=received, complete=frame is not None)
+
+        if self.turnaround:
+            if frame is not None:
+                self.turnaround.record(self.port_name, slave, elapsed)
+            elif not received:
+                self.turnaround.record_timeout(self.port_name, slave)
+            self.ready_at = time.monotonic() + self.turnaround.gap(self.port_name, slave)
+        return frame, received > 0
+
+    def send_data(self, request, priority=False, client=None, cid=None):
+        """把Modbus请求放入事务队列，等待执行完成后返回响应
+
+        Args:
+            request: 请求帧
+            priority: 是否高优先级，在当前事务结束后优先执行
+            client: 发起请求的客户端，用于轮转调度和统计
+            cid: 链路追踪的关联ID
+        """
+        queued = self._enqueue(request, priority, client, cid)
+        if queued is None:
+            return None
+        transaction, queue, wait_timeout = queued
+        if not transaction["event"].wait(wait_timeout):
+            with self.condition:
+                index = next((i for i, item in enumerate(queue) if item is transaction), None)
+                if index is not None:
+                    # 仍在排队（串口卡住或队列积压），撤回事务，不再执行
+                    del queue[index]
+                    self.logger.warning(f"串口{self.port_name}事务排队超过{wait_timeout:.1f}秒，放弃执行")
+                    return None
+            # 已经开始执行，最多再等一次完整事务的时间
+            transaction["event"].wait(self.timeout * (self.read_retries + 1))
+        return transaction["response"]
+
+    def submit(self, request, callback, priority=False, client=None, cid=None):
+        """把Modbus请求放入事务队列，不等待执行，参数见 send_data
+
+        事务执行完成或串口关闭时在工作线程中调用 callback(响应)，多个请求可以同时排队，
+        仍然按优先级和客户端轮转调度。
+
+        Returns:
+            bool: 是否入队，串口未连接或排队事务过多时返回False，不调用 callback
+        """
+        return self._enqueue(request, priority, client, cid, callback) is not None
+
+    def _enqueue(self, request, priority, client, cid, callback=None):
+        """放入事务队列
+
+        Returns:
+            tuple: (事务, 所在的队列, 最长等待时间)，拒绝时返回None
+        """
+        if not self.is_connected:
+            self.logger.warning("串口未连接，无法发送数据")
+            return None
+        transaction = {
+            "request": bytes(request),
+            "client": client,
+            "cid": cid,
+            "enqueued": time.monotonic(),
+            "event": threading.Event(),
+            "response": None,
+            "callback": callback,
+        }
+        with self.condition:
+            # 持有 condition 时再检查一次，close 之后放入队列的事务不会再有工作线程执行
+            if not self.is_connected:
+                self.logger.warning("串口未连接，无法发送数据")
+                return None
+            if priority:
+                queue = self.priority_queue
+            else:
+                queue = self.client_queues.get(client)
+                if queue is None:
+                    queue = self.client_queues[client] = deque()
+                if len(queue) >= self.max_pending:
+                    self._client_stats(client)["rejected"] += 1
+                    self.logger.warning(f"串口{self.port_name}客户端{client}排队事务过多，拒绝请求")
+                    return None
+            # 最长等待时间: 前面排队的事务和正在执行的事务各按一次完整事务（含重发）的读超时计算
+            ahead = len(self.priority_queue) + sum(len(item) for item in self.client_queues.values()) + 1
+            wait_timeout = ahead * self.timeout * (self.read_retries + 1)
+            queue.append(transaction)
+            self.condition.notify()
+        return transaction, queue, wait_timeout
+
+    def stats(self):
+        """事务队列统计"""
+        with self.condition:
+            return {
+                "port": self.port_name,
+                "connected": self.is_connected,
+                "priority_queued": len(self.priority_queue),
+                "queued": {str(client): len(queue) for client, queue in self.client_queues.items()},
+                "queue_wait": self.queue_wait.snapshot(),
+                "framing": dict(
+                    self.framer.stats(), retries=self.retries, invalid_responses=self.invalid_responses
+                ),
+                "clients": {
+                    str(client): {
+                        "served": stats["served"],
+                        "rejected": stats["rejected"],
+                        "queue_wait": stats["queue_wait"].snapshot(),
+                    }
+                    for client, stats in self.client_stats.items()
+                },
+            }
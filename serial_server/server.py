@@ -10,87 +10,316 @@ import yaml
 # 添加上级目录到路径
 sys.path.append(os.path.dirname(os.path.dirname(__file__)))
 from utils.Logger import logger
+from utils.protocol import (
+    FRAME_MAGIC, MSG_JSON, MSG_REQUEST, MSG_SCHEDULE, MSG_TRANSPORT, SCHEDULE_SEQ_FLAG, STATUS_SUCCESS, STATUS_ERROR,
+    FrameReader, encode_frame, encode_json, decode_request, encode_response, to_hex
+)
+from utils.modbus import calculate_crc, check_crc, is_write_request
+from utils.turnaround import TurnaroundTable
+from utils.tracing import tracer
+from utils.shm_transport import accept_server_channel
+from serial_handler import SerialHandler
+from port_process import PortProcess
 import serial.tools.list_ports
+import struct
+
+class ResponseCache:
+    """相同请求合并与短时响应缓存
+
+    同一串口上相同的请求帧正在执行时，后来的请求等待并共用这一次串口事务的结果；
+    ttl大于0时，结果在ttl秒内直接返回，不再占用总线。
+    """
+    def __init__(self, ttl=0):
+        self.ttl = ttl
+        self.lock = threading.Lock()
+        # (串口, 请求帧) -> {"event": Event, "response": 响应}
+        self.in_flight = {}
+        # (串口, 请求帧) -> (时间, 响应)
+        self.cache = {}
+        # 串口 -> 写命令计数，执行期间发生过写命令的读结果不缓存
+        self.generations = {}
+        self.hits = 0
+        self.misses = 0
+        self.shared = 0
+
+    def get_or_execute(self, serial, request, execute):
+        """返回缓存或正在执行的结果，都没有时调用execute执行事务"""
+        key = (serial, bytes(request))
+        with self.lock:
+            if self.ttl > 0:
+                cached = self.cache.get(key)
+                if cached and time.monotonic() - cached[0] < self.ttl:
+                    self.hits += 1
+                    return cached[1]
+            call = self.in_flight.get(key)
+            if call is not None:
+                # 相同请求正在执行，等待共用结果
+                self.shared += 1
+                leader = False
+            else:
+                self.misses += 1
+                call = {"event": threading.Event(), "response": None}
+                self.in_flight[key] = call
+                leader = True
+            generation = self.generations.get(serial, 0)
+
+        if not leader:
+            call["event"].wait()
+            return call["response"]
+
+        try:
+            call["response"] = execute()
+        finally:
+            with self.lock:
+                if self.in_flight.get(key) is call:
+                    self.in_flight.pop(key)
+                if (self.ttl > 0 and call["response"] is not None
+                        and self.generations.get(serial, 0) == generation):
+                    now = time.monotonic()
+                    # 插入时清除过期的缓存，不再轮询的请求不会一直占用内存
+                    for expired in [k for k, (at, _) in self.cache.items() if now - at >= self.ttl]:
+                        del self.cache[expired]
+                    self.cache[key] = (now, call["response"])
+            call["event"].set()
+        return call["response"]
+
+    def invalidate(self, serial):
+        """写命令后清除该串口的缓存
+
+        正在执行的读请求可能读到写之前的值：计数加一使其结果不再缓存，
+        并且之后到达的相同请求不再共用这次结果，重新读取。
+        """
+        with self.lock:
+            self.generations[serial] = self.generations.get(serial, 0) + 1
+            for key in [key for key in self.cache if key[0] == serial]:
+                del self.cache[key]
+            for key in [key for key in self.in_flight if key[0] == serial]:
+                del self.in_flight[key]
+
+    def stats(self):
+        """获取命中统计"""
+        with self.lock:
+            return {
+                "ttl": self.ttl,
+                "hits": self.hits,
+                "misses": self.misses,
+                "shared": self.shared,
+                "cached": len(self.cache),
+            }
 
 class SerialManager:
     """串口管理类，用于管理多个串口连接"""
     def __init__(self):
         self.serial_ports = {}  # 存储所有串口对象 {port_name: SerialHandler}
-        
-class SerialHandler:
-    """单个串口处理类"""
-    def __init__(self, port_name, baudrate, timeout=1):
-        self.port_name = port_name
-        self.baudrate = baudrate
-        self.timeout = timeout
-        self.serial_port = None
-        self.is_connected = False
-        self.logger = logger
-
-    def connect(self):
-        """连接串口"""
-        try:
-            if self.is_connected:
-                self.logger.warning(f"串口{self.port_name}已连接，无需重复连接")
-                return True
-            self.serial_port = serial.Serial(
-                port=self.port_name,
-                baudrate=self.baudrate,
-                timeout=self.timeout
+        # 多个客户端的相同请求合并执行
+        self.response_cache = ResponseCache()
+        # 串口热插拔监视
+        self.port_watcher = PortWatcher(self)
+        # 串口事务队列的调度参数，见 SerialHandler
+        self.queue_config = {}
+        # 从站响应时间学习，None表示使用固定的等待时间
+        self.turnaround = None
+        # 串口隔离方式: thread 所有串口在本进程中，process 每个串口一个工作进程
+        self.isolation = "thread"
+        # 独立进程模式的参数，见 PortProcess
+        self.process_config = {}
+
+    def create_handler(self, port_name, port_config):
+        """按串口配置创建串口处理对象"""
+        if self.isolation == "process":
+            return PortProcess(
+                port_name,
+                port_config.get('baudrate', 9600),
+                port_config.get('timeout', 1),
+                queue_config=self.queue_config,
+                turnaround=self.turnaround,
+                **self.process_config
             )
-            self.is_connected = True
-            self.logger.info(f"成功连接到{self.port_name}，波特率{self.baudrate}")
-            return True
-        except Exception as e:
-            self.logger.error(f"串口{self.port_name}连接失败: {e}")
-            self.is_connected = False
-            return False
-
-    def send_data(self, request):
-        """发送Modbus请求，并返回响应"""
-        if not self.is_connected:
-            self.logger.warning("串口未连接，无法发送数据")
-            return None
-        try:
-            self.serial_port.write(request)
-            self.logger.info(f"成功发送请求: {request.hex()}")
-
-            # 接收数据
-            time.sleep(0.2)  # 等待数据到达
-            data = None
-            if self.serial_port.in_waiting > 0:
-                data = self.serial_port.read(self.serial_port.in_waiting)
-            return data
-        except Exception as e:
-            self.logger.error(f"发送请求失败: {e}")
-            return None
+        return SerialHandler(
+            port_name,
+            port_config.get('baudrate', 9600),
+            port_config.get('timeout', 1),
+            turnaround=self.turnaround,
+            **self.queue_config
+        )
 
-def handle_client(client_socket, client_address):
+    def stats(self):
+        """各串口的事务队列统计，同一串口可能以多个名称登记，只统计一次"""
+        result = {}
+        seen = set()
+        for name, handler in list(self.serial_ports.items()):
+            if id(handler) in seen:
+                continue
+            seen.add(id(handler))
+            result[name] = handler.stats()
+        return result
+        
+
+class PollScheduler:
+    """轮询计划执行类
+
+    后端一次性下发轮询计划，串口服务器在本地按计划轮询，每个串口一个线程互不等待，
+    结果以带命令编号的响应帧持续推送给后端。
+    """
+    def __init__(self, send_func, client=None):
+        """
+        Args:
+            send_func: 向后端发送数据的函数
+            client: 下发计划的客户端，串口事务按客户端轮转调度
+        """
+        self.send_func = send_func
+        self.client = client
+        self.running = False
+        self.threads = []
+
+    def start(self, schedule):
+        """按串口拆分命令并启动轮询线程"""
+        self.running = True
+        request_delay = schedule.get('request_delay', 0.5)
+        if serial_manager.turnaround:
+            # 串口对象已按从站学习到的间隔控制请求节奏，不再使用统一的请求间隔
+            request_delay = 0
+        default_interval = schedule.get('interval', 1.0)
+
+        commands_by_port = {}
+        for command in schedule.get('commands', []):
+            commands_by_port.setdefault(command['serial'], []).append({
+                "id": command['id'],
+                "request": bytes.fromhex(command['request']),
+                "interval": command.get('interval', default_interval),
+                "next_due": 0.0,
+            })
+
+        for serial, commands in commands_by_port.items():
+            thread = threading.Thread(target=self._poll_port, args=(serial, commands, request_delay))
+            thread.daemon = True
+            thread.start()
+            self.threads.append(thread)
+        logger.info(f"轮询计划已启动: {len(commands_by_port)} 个串口")
+        return list(commands_by_port.keys())
+
+    def stop(self):
+        """停止轮询"""
+        self.running = False
+        for thread in self.threads:
+            thread.join(timeout=2)
+        self.threads = []
+
+    def _poll_port(self, serial, commands, request_delay):
+        """单个串口的轮询线程"""
+        while self.running:
+            now = time.monotonic()
+            due = [command for command in commands if command['next_due'] <= now]
+            if not due:
+                time.sleep(max(0.0, min(command['next_due'] for command in commands) - now))
+                continue
+
+            for command in due:
+                if not self.running:
+                    break
+                command['next_due'] = time.monotonic() + command['interval']
+                seq = SCHEDULE_SEQ_FLAG | command['id']
+                response, error = execute_modbus_request(serial, command['request'], self.client, seq)
+                if error:
+                    frame = encode_response(seq, STATUS_ERROR, time.time(), serial, command['request'], error.encode('utf-8'))
+                else:
+                    frame = encode_response(seq, STATUS_SUCCESS, time.time(), serial, command['request'], response)
+                try:
+                    self.send_func(frame)
+                except Exception as e:
+                    logger.error(f"推送轮询结果失败: {e}")
+                    self.running = False
+                    break
+                time.sleep(request_delay)
+
+def handle_client(client_socket, client_address, transport_config=None):
     print(f"连接到客户端: {client_address}")
+    # 串口事务按客户端轮转调度
+    client = f"{client_address[0]}:{client_address[1]}"
+    # 第一个字节是帧头则使用二进制帧协议，否则按旧的JSON格式处理
+    reader = None
+    # 轮询线程和本线程都会向客户端发送数据
+    send_lock = threading.Lock()
+    scheduler = None
+
+    def send(data):
+        with send_lock:
+            client_socket.sendall(data)
+
     while True:
         try:
             # 接收原始数据
-            raw_data = client_socket.recv(1024)
+            raw_data = client_socket.recv(4096)
             if not raw_data:
                 break
-                
-            # 尝试解码为UTF-8
-            data_str = raw_data.decode('utf-8')
             
-            # 判断数据类型并处理
-            response = process_data(data_str)
+            if reader is None and raw_data[0] != FRAME_MAGIC:
+                # 旧的JSON客户端，尝试解码为UTF-8
+                data_str = raw_data.decode('utf-8')
+                response = process_data(data_str, client)
+                client_socket.sendall(response.encode('utf-8'))
+                continue
             
-            # 发送响应
-            client_socket.sendall(response.encode('utf-8'))
+            if reader is None:
+                reader = FrameReader()
+            for msg_type, payload in reader.feed(raw_data):
+                if msg_type == MSG_TRANSPORT:
+                    # 同机的后端请求改用共享内存，确认后本连接的收发都走共享内存，TCP连接只用作门铃
+                    channel, reply = accept_server_channel(
+                        client_socket, json.loads(bytes(payload).decode('utf-8')), transport_config
+                    )
+                    send(encode_json(reply))
+                    if channel is not None:
+                        client_socket = channel
+                        logger.info(f"客户端 {client} 已切换为共享内存传输")
+                    continue
+                if msg_type == MSG_SCHEDULE:
+                    # 新的轮询计划替换旧的
+                    if scheduler:
+                        scheduler.stop()
+                    scheduler = PollScheduler(send, client)
+                    ports = scheduler.start(json.loads(bytes(payload).decode('utf-8')))
+                    send(encode_json({
+                        "status": "schedule_success",
+                        "message": f"轮询计划已启动，共 {len(ports)} 个串口",
+                        "ports": ports
+                    }))
+                    continue
+                send(process_frame(msg_type, payload, client))
             
         except Exception as e:
             print(f"处理客户端数据出错: {e}")
             break
             
+    if scheduler:
+        scheduler.stop()
     client_socket.close()
     print(f"{client_address} 已断开连接")
 
-def process_data(data_str):
+def process_frame(msg_type, payload, client=None):
+    """
+    处理二进制协议帧，Modbus请求和响应全程保持原始字节
+    """
+    if msg_type == MSG_REQUEST:
+        received = time.time()
+        seq, serial, request = decode_request(payload)
+        tracer.add("server.receive", received, time.time(), seq, serial=serial)
+        with tracer.span("server.execute", seq, serial=serial):
+            response, error = execute_modbus_request(serial, request, client, seq)
+        if error:
+            return encode_response(seq, STATUS_ERROR, time.time(), serial, request, error.encode('utf-8'))
+        return encode_response(seq, STATUS_SUCCESS, time.time(), serial, request, response)
+    
+    if msg_type == MSG_JSON:
+        response = process_data(bytes(payload).decode('utf-8'), client)
+    else:
+        response = json.dumps({
+            "status": "error",
+            "message": f"未知的帧类型: {msg_type}"
+        })
+    return encode_frame(MSG_JSON, response.encode('utf-8'))
+
+def process_data(data_str, client=None):
     """
     根据不同的数据格式进行处理
     """
@@ -103,9 +332,21 @@ def process_data(data_str):
         if isinstance(data, list) and len(data) > 0 and "name" in data[0]:
             # 是串口配置列表
             return process_serial_ports(data)
+        elif isinstance(data, dict) and data.get("command") == "close_ports":
+            # 配置修改后关闭删除或修改的串口
+            return close_serial_ports(data.get("ports", []))
+        elif isinstance(data, dict) and data.get("command") == "stats":
+            # 运行统计
+            return json.dumps({
+                "status": "stats",
+                "response_cache": serial_manager.response_cache.stats(),
+                "serial_ports": serial_manager.stats(),
+                "turnaround": serial_manager.turnaround.stats() if serial_manager.turnaround else {},
+                "tracing": tracer.stats()
+            })
         elif isinstance(data, dict) and "serial" in data and "request" in data:
             # 是Modbus请求
-            return process_modbus_request(data)
+            return process_modbus_request(data, client)
             # return test_response(data)
         else:
             # 未知数据格式
@@ -125,6 +366,124 @@ def process_data(data_str):
             "message": f"处理数据错误: {str(e)}"
         })
 
+class PortWatcher:
+    """串口热插拔监视类
+
+    缓存系统串口枚举结果，定时检查串口列表是否变化（Linux下读取 /sys/class/tty，其他系统重新枚举），
+    有变化时只重新打开受影响的串口，其余串口不受影响继续轮询。
+    """
+    SYSFS_TTY = '/sys/class/tty'
+
+    def __init__(self, manager, interval=2.0):
+        """
+        Args:
+            manager: 串口管理器
+            interval: 检查间隔（秒）
+        """
+        self.manager = manager
+        self.interval = interval
+        self.lock = threading.Lock()
+        self.signature = None
+        self.available_ports = []
+        # 客户端使用的串口名 -> 串口配置
+        self.watched = {}
+        self.running = False
+
+    def _signature(self):
+        """获取串口列表的特征值，用于判断是否有串口插拔"""
+        if os.path.isdir(self.SYSFS_TTY):
+            return tuple(sorted(
+                name for name in os.listdir(self.SYSFS_TTY)
+                if os.path.exists(os.path.join(self.SYSFS_TTY, name, 'device'))
+            ))
+        return tuple(sorted(port.device for port in serial.tools.list_ports.comports()))
+
+    def enumerate(self, force=False):
+        """获取系统串口列表，串口没有变化时直接返回缓存
+
+        Returns:
+            tuple: (串口列表, 是否有变化)
+        """
+        with self.lock:
+            signature = self._signature()
+            if not force and signature == self.signature:
+                return self.available_ports, False
+            self.signature = signature
+            self.available_ports = list(serial.tools.list_ports.comports())
+
+        # 记录所有可用的串口信息
+        logger.info("系统可用串口:")
+        for port in self.available_ports:
+            logger.info(f"端口: {port.device}, 描述: {port.description}")
+        return self.available_ports, True
+
+    def watch(self, client_name, port_config):
+        """登记需要监视的串口"""
+        self.watched[client_name] = port_config
+
+    def start(self):
+        """启动监视线程"""
+        self.running = True
+        thread = threading.Thread(target=self._watch_thread_func)
+        thread.daemon = True
+        thread.start()
+
+    def _watch_thread_func(self):
+        """监视线程函数"""
+        while self.running:
+            time.sleep(self.interval)
+            try:
+                available_ports, changed = self.enumerate()
+                disconnected = any(
+                    handler is None or not handler.is_connected
+                    for handler in (self.manager.serial_ports.get(name) for name in self.watched)
+                )
+                if changed or disconnected:
+                    self.reconcile(available_ports)
+            except Exception as e:
+                logger.error(f"串口监视出错: {e}")
+
+    def reconcile(self, available_ports):
+        """根据最新的串口列表，关闭已拔出的串口，重新打开重新插入的串口"""
+        devices = {port.device for port in available_ports}
+        for client_name, port_config in list(self.watched.items()):
+            handler = self.manager.serial_ports.get(client_name)
+            found_port = match_serial_port(port_config, available_ports)
+
+            if found_port is None:
+                if handler is not None and handler.is_connected and handler.port_name not in devices:
+                    logger.warning(f"串口已拔出: {client_name}({handler.port_name})")
+                    handler.close()
+                continue
+
+            if handler is not None and handler.is_connected and handler.port_name == found_port.device:
+                continue
+
+            if handler is not None:
+                handler.close()
+            new_handler = self.manager.create_handler(found_port.device, port_config)
+            if new_handler.connect():
+                # 客户端仍然使用原来的串口名访问
+                self.manager.serial_ports[client_name] = new_handler
+                self.manager.serial_ports[found_port.device] = new_handler
+                logger.info(f"串口重新打开: {client_name} -> {found_port.device}({found_port.description})")
+
+def match_serial_port(port_config, available_ports):
+    """
+    按描述匹配串口，描述没找到时按串口名匹配
+    """
+    config_name = port_config.get('config_name', port_config['name'])
+    config_desc = port_config.get('description', '')
+    if config_desc:
+        config_desc = config_desc.upper()
+        for port in available_ports:
+            if config_desc in port.description.upper():
+                return port
+    for port in available_ports:
+        if port.device == config_name:
+            return port
+    return None
+
 def find_serial_ports(config_ports):
     """
     根据配置的串口信息查找实际的串口
@@ -135,37 +494,20 @@ def find_serial_ports(config_ports):
     Returns:
         list: 更新后的串口配置列表
     """
-    available_ports = list(serial.tools.list_ports.comports())
+    # 使用缓存的枚举结果，串口没有插拔时不重新枚举
+    available_ports, _ = serial_manager.port_watcher.enumerate()
     updated_ports = []
     
-    # 记录所有可用的串口信息
-    logger.info("系统可用串口:")
-    for port in available_ports:
-        logger.info(f"端口: {port.device}, 描述: {port.description}")
-    
     for port_config in config_ports:
         config_name = port_config['name']      # 配置的串口名 (如 COM5)
         config_desc = port_config.get('description', '')  # 配置的描述 (如 'A')
         
-        # 首先尝试通过描述匹配
-        found_port = None
-        if config_desc:
-            for port in available_ports:
-                if config_desc.upper() in port.description.upper():
-                    found_port = port
-                    break
-        
-        # 如果通过描述没找到，使用配置的名称
-        if not found_port:
-            for port in available_ports:
-                if port.device == config_name:
-                    found_port = port
-                    break
-        
+        found_port = match_serial_port(port_config, available_ports)
         if found_port:
-            # 更新配置中的串口名称为实际找到的串口
+            # 更新配置中的串口名称为实际找到的串口，保留配置的串口名用于热插拔后重新匹配
             new_config = port_config.copy()
             new_config['name'] = found_port.device
+            new_config['config_name'] = config_name
             new_config['actual_description'] = found_port.description
             updated_ports.append(new_config)
             logger.info(f"串口匹配成功 - 配置: {config_name}({config_desc}) -> 实际: {found_port.device}({found_port.description})")
@@ -183,11 +525,15 @@ def process_serial_ports(serial_ports):
     updated_ports = find_serial_ports(serial_ports)
     for port_config in updated_ports:
         port_name = port_config['name']
-        baudrate = port_config.get('baudrate', 9600)
-        timeout = port_config.get('timeout', 1)
         
-        # 创建串口处理对象
-        serial_handler = SerialHandler(port_name, baudrate, timeout)
+        # 后端断线重连后会再次发送串口列表，已打开的串口直接复用
+        existing = serial_manager.serial_ports.get(port_name)
+        if existing is not None and existing.is_connected:
+            continue
+        
+        # 创建串口处理对象，无论是否打开成功都登记监视，设备插入后自动打开
+        serial_manager.port_watcher.watch(port_name, port_config)
+        serial_handler = serial_manager.create_handler(port_name, port_config)
         if serial_handler.connect():
             serial_manager.serial_ports[port_name] = serial_handler
     
@@ -198,20 +544,64 @@ def process_serial_ports(serial_ports):
         "initialized_ports": [port["name"] for port in updated_ports]
     })
 
-def process_modbus_request(request_data):
+def close_serial_ports(port_names):
     """
-    处理Modbus请求
+    关闭指定的串口并取消监视，其余串口继续工作
     """
-    serial = request_data.get('serial')
-    request = request_data.get('request')
-    timestamp = request_data.get('time')
+    names = {port_name.replace(' ', '').upper() for port_name in port_names}
+    closed = []
+    for client_name, port_config in list(serial_manager.port_watcher.watched.items()):
+        config_name = port_config.get('config_name', client_name)
+        if config_name.replace(' ', '').upper() not in names and client_name.replace(' ', '').upper() not in names:
+            continue
+        serial_manager.port_watcher.watched.pop(client_name, None)
+        handler = serial_manager.serial_ports.pop(client_name, None)
+        if handler is not None:
+            serial_manager.serial_ports.pop(handler.port_name, None)
+            handler.close()
+        serial_manager.response_cache.invalidate(client_name)
+        closed.append(client_name)
+    logger.info(f"已关闭串口: {closed}")
     
+    return json.dumps({
+        "status": "close_success",
+        "message": f"已关闭 {len(closed)} 个串口",
+        "closed_ports": closed
+    })
+
+def execute_modbus_request(serial, request_bytes, client=None, cid=None):
+    """
+    在指定串口上执行一次Modbus事务，client 为发起请求的客户端，用于串口事务的轮转调度，
+    cid 为链路追踪的关联ID
+
+    Returns:
+        tuple: (响应bytes, None) 或 (None, 错误信息)
+    """
     # 检查请求的串口是否已初始化
     if serial not in serial_manager.serial_ports:
-        return json.dumps({
-            "status": "error",
-            "message": f"串口 {serial} 未初始化或不存在"
-        })
+        return None, f"串口 {serial} 未初始化或不存在"
+    
+    serial_handler = serial_manager.serial_ports[serial]
+    if is_write_request(request_bytes):
+        # 写命令走高优先级通道，不合并也不缓存，并清除该串口的缓存
+        response = serial_handler.send_data(request_bytes, priority=True, client=client, cid=cid)
+        serial_manager.response_cache.invalidate(serial)
+    else:
+        # 多个客户端的相同读请求共用一次串口事务
+        response = serial_manager.response_cache.get_or_execute(
+            serial, request_bytes, lambda: serial_handler.send_data(request_bytes, client=client, cid=cid)
+        )
+    if response is None:
+        return None, f"串口 {serial} 没有响应数据"
+    return response, None
+
+def process_modbus_request(request_data, client=None):
+    """
+    处理JSON格式的Modbus请求（兼容旧客户端，请求和响应使用十六进制字符串）
+    """
+    serial = request_data.get('serial')
+    request = request_data.get('request')
+    timestamp = request_data.get('time')
     
     # 如果请求是bytes类型，不需要转换，如果是字符串，则需要转换为bytes
     if isinstance(request, str):
@@ -231,29 +621,118 @@ def process_modbus_request(request_data):
             "message": f"请求类型错误，应为字符串或bytes，实际为 {type(request)}"
         })
 
-    serial_handler = serial_manager.serial_ports[serial]
-    # 发送Modbus请求
-    response = serial_handler.send_data(request_bytes)
-    if response is None:
+    response, error = execute_modbus_request(serial, request_bytes, client)
+    if error:
         return json.dumps({
             "status": "error",
-            "message": f"串口 {serial} 没有响应数据"
+            "message": error
         })
-    
-    # 将bytes转换为十六进制字符串以便JSON序列化
-    response_hex = ' '.join([f'{b:02X}' for b in response])
-    request_hex = ' '.join([f'{b:02X}' for b in request_bytes])
-   
 
-    # 返回响应
+    # 返回响应，JSON客户端需要十六进制字符串
     return json.dumps({
         "status": "success",
         "serial": serial,
-        "request": request_hex,
-        "response": response_hex,
+        "request": to_hex(request_bytes),
+        "response": to_hex(response),
         "time": time.strftime('%Y-%m-%d %H:%M:%S', time.localtime())
     })
 
+# MBAP头中长度字段的范围: 单元标识(1) + PDU(1-253)
+MBAP_MIN_LENGTH = 2
+MBAP_MAX_LENGTH = 254
+
+def handle_modbus_tcp_client(client_socket, client_address, gateway_config):
+    """
+    Modbus TCP网关客户端处理，MBAP请求转换为RTU帧后经对应串口发送
+
+    与后端轮询共用同一个SerialHandler，事务在串口上逐个执行，调试工具接入时不需要停止轮询
+    """
+    logger.info(f"Modbus TCP客户端接入: {client_address}")
+    units = {int(unit): serial for unit, serial in (gateway_config.get('units') or {}).items()}
+    default_serial = gateway_config.get('default_serial')
+    buffer = bytearray()
+    try:
+        while True:
+            raw_data = client_socket.recv(4096)
+            if not raw_data:
+                break
+            buffer += raw_data
+            # MBAP头: 事务标识(2) + 协议标识(2) + 长度(2) + 单元标识(1)
+            while len(buffer) >= 7:
+                transaction_id, protocol_id, length, unit_id = struct.unpack_from('>HHHB', buffer, 0)
+                if not MBAP_MIN_LENGTH <= length <= MBAP_MAX_LENGTH:
+                    # 长度包含单元标识和PDU，超出范围时无法确定下一帧的开始，断开连接
+                    logger.warning(f"Modbus TCP客户端 {client_address} MBAP长度无效: {length}，断开连接")
+                    return
+                if len(buffer) < 6 + length:
+                    break
+                pdu = bytes(buffer[7:6 + length])
+                del buffer[:6 + length]
+                if protocol_id != 0:
+                    continue
+                response_pdu = process_modbus_tcp_pdu(
+                    unit_id, pdu, units.get(unit_id, default_serial), f"{client_address[0]}:{client_address[1]}"
+                )
+                client_socket.sendall(
+                    struct.pack('>HHHB', transaction_id, 0, len(response_pdu) + 1, unit_id) + response_pdu
+                )
+    except Exception as e:
+        logger.error(f"Modbus TCP客户端 {client_address} 处理出错: {e}")
+    finally:
+        client_socket.close()
+        logger.info(f"Modbus TCP客户端 {client_address} 已断开连接")
+
+def process_modbus_tcp_pdu(unit_id, pdu, serial, client=None):
+    """
+    执行一次Modbus TCP请求，返回响应PDU，出错时返回Modbus异常响应
+    """
+    function_code = pdu[0]
+    if not serial:
+        # 异常码0x0A: 网关路径不可用
+        return bytes([function_code | 0x80, 0x0A])
+
+    request = bytes([unit_id]) + pdu
+    request += calculate_crc(request)
+    response, error = execute_modbus_request(serial, request, client)
+    if error or not check_crc(response) or response[0] != unit_id:
+        # 异常码0x0B: 网关目标设备无响应
+        logger.warning(f"Modbus TCP网关 {serial} 单元 {unit_id} 无有效响应: {error or to_hex(response)}")
+        return bytes([function_code | 0x80, 0x0B])
+    # 去掉RTU地址和CRC，剩下的就是PDU
+    return bytes(response[1:-2])
+
+def start_modbus_tcp_gateway(gateway_config):
+    """
+    启动Modbus TCP网关监听线程
+    """
+    host = gateway_config.get('host', '0.0.0.0')
+    port = gateway_config.get('port', 502)
+
+    gateway_socket = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+    gateway_socket.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+    gateway_socket.bind((host, port))
+    gateway_socket.listen(5)
+
+    def accept_loop():
+        while True:
+            try:
+                client_socket, client_address = gateway_socket.accept()
+                client_thread = threading.Thread(
+                    target=handle_modbus_tcp_client,
+                    args=(client_socket, client_address, gateway_config)
+                )
+                client_thread.daemon = True
+                client_thread.start()
+            except Exception as e:
+                logger.error(f"Modbus TCP网关接受连接错误: {e}")
+                break
+
+    thread = threading.Thread(target=accept_loop)
+    thread.daemon = True
+    thread.start()
+    print(f"Modbus TCP网关已启动，监听 {host} 端口 {port}...")
+    return gateway_socket
+
 def test_response(request_data):
     """
     模拟串口返回数据
@@ -302,11 +781,55 @@ def start_serve():
     _server_socket.settimeout(1.0)
 
     print(f"服务器已启动，监听 {host} 端口 {port}...")
+
+    # 链路追踪，环境变量 WUST_TRACE 或 tracing.enabled 开启
+    tracer.configure(config.get('tracing'), 'logs/trace_server.json', 'serial_server')
+
+    # 响应缓存时间，0表示只合并相同的并发请求，不缓存
+    serial_manager.response_cache.ttl = config.get('serial_server', {}).get('cache_ttl', 0)
+
+    # 串口热插拔监视
+    serial_manager.port_watcher.interval = config.get('serial_server', {}).get('port_scan_interval', 2.0)
+    serial_manager.port_watcher.start()
+
+    # 串口事务队列：按客户端轮转调度，每个客户端每轮执行的事务数和最多排队的事务数
+    serial_server_config = config.get('serial_server', {})
+
+    # 从站响应时间学习，按从站决定读超时和请求间隔
+    turnaround_config = dict(serial_server_config.get('turnaround', {}))
+    if turnaround_config.pop('enabled', True):
+        save_interval = turnaround_config.pop('save_interval', 30.0)
+        serial_manager.turnaround = TurnaroundTable(
+            turnaround_config.pop('file', 'data/turnaround.json'), **turnaround_config
+        )
+        serial_manager.turnaround.load()
+        serial_manager.turnaround.start(save_interval)
+    serial_manager.queue_config = {
+        "client_quota": serial_server_config.get('client_quota', 1),
+        "client_quotas": serial_server_config.get('client_quotas', {}),
+        "max_pending": serial_server_config.get('max_pending', 50),
+        "read_retries": serial_server_config.get('read_retries', 1),
+    }
+
+    # 串口隔离：process 模式下每个串口由独立的工作进程驱动，崩溃或卡死后自动重启
+    isolation_config = dict(serial_server_config.get('isolation', {}))
+    serial_manager.isolation = isolation_config.pop('mode', 'thread')
+    if tracer.enabled:
+        # 每个工作进程写自己的追踪文件
+        isolation_config['tracing'] = dict(config.get('tracing') or {}, file='logs/trace_serial_{port}.json')
+    serial_manager.process_config = isolation_config
+
+    # Modbus TCP网关，供SCADA和调试工具接入
+    gateway_config = config.get('modbus_tcp', {})
+    if gateway_config.get('enabled', False):
+        start_modbus_tcp_gateway(gateway_config)
     
     while True:
         try:
             client_socket, client_address = _server_socket.accept()
-            client_thread = threading.Thread(target=handle_client, args=(client_socket, client_address))
+            client_thread = threading.Thread(
+                target=handle_client, args=(client_socket, client_address, server_config.get('transport'))
+            )
             client_thread.daemon = True
             client_thread.start()
         except socket.timeout:
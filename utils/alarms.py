@@ -0,0 +1,299 @@
+import os
+import sys
+import threading
+import time
+import operator
+from collections import deque
+
+# 添加上级目录到路径
+sys.path.append(os.path.dirname(os.path.dirname(__file__)))
+import yaml
+from utils.Logger import logger
+
+# 默认报警规则文件（项目根目录下的 config/alarms.yaml）
+DEFAULT_ALARMS_PATH = os.path.join(
+    os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'config', 'alarms.yaml'
+)
+
+_OPERATORS = {
+    '<': operator.lt,
+    '<=': operator.le,
+    '>': operator.gt,
+    '>=': operator.ge,
+    '==': operator.eq,
+    '!=': operator.ne,
+}
+
+
+class Condition:
+    """单个测点的判断条件
+
+    op 为比较运算符或 outside（value 为 [下限, 上限]，超出范围为真）。
+    hysteresis 为回差：条件成立后，测点需要越过阈值 hysteresis 才视为恢复，避免在阈值附近反复报警。
+    """
+
+    def __init__(self, path, point, op, value, hysteresis=0):
+        if op != 'outside' and op not in _OPERATORS:
+            raise ValueError(f"未知的比较运算符: {op}")
+        self.path = path
+        # 数据树中的测点对象，计算时直接读取，不再按路径查找
+        self.point = point
+        self.op = op
+        self.value = value
+        self.hysteresis = hysteresis
+
+    def check(self, value, active):
+        """判断条件是否成立
+
+        Args:
+            value: 测点的当前值
+            active: 条件当前是否处于成立状态，成立时按回差放宽恢复的阈值
+        """
+        if value is None:
+            return False
+        hysteresis = self.hysteresis if active else 0
+        if self.op == 'outside':
+            low, high = self.value
+            return value < low + hysteresis or value > high - hysteresis
+        if self.op in ('<', '<='):
+            return _OPERATORS[self.op](value, self.value + hysteresis)
+        if self.op in ('>', '>='):
+            return _OPERATORS[self.op](value, self.value - hysteresis)
+        return _OPERATORS[self.op](value, self.value)
+
+
+class AlarmRule:
+    """展开到具体设备的报警规则，所有条件同时成立并持续 on_delay 秒后报警"""
+
+    def __init__(self, key, rule_id, name, level, message, conditions, on_delay=0):
+        self.key = key
+        self.rule_id = rule_id
+        self.name = name
+        self.level = level
+        self.message = message
+        self.conditions = conditions
+        self.on_delay = on_delay
+
+        # 条件成立状态及开始成立的时间
+        self.matched = False
+        self.matched_since = None
+        self.active = False
+        self.active_since = None
+
+    @property
+    def paths(self):
+        return [condition.path for condition in self.conditions]
+
+
+class AlarmEngine:
+    """增量报警规则引擎
+
+    规则按引用的测点建立索引，数据处理器每解析一帧只重新计算引用了变化测点的规则，
+    计算量与变化的测点数成正比，与规则总数无关。延时报警的规则放在等待列表中，
+    由后台线程只检查等待列表。
+    """
+
+    def __init__(self, data_processor, config, history_size=500, tick_interval=0.5):
+        """
+        Args:
+            data_processor: 数据处理器，读取测点的当前值并注册更新监听
+            config: 报警规则配置，格式见 config/alarms.yaml
+            history_size: 保留的报警事件数
+            tick_interval: 检查延时报警的间隔（秒）
+        """
+        self.data_processor = data_processor
+        self.lock = threading.Lock()
+        self.rules = {}
+        # 测点路径 -> [规则, ...]
+        self.index = {}
+        # 等待延时到达的规则 key -> 规则
+        self.pending = {}
+        # 当前报警的规则 key -> 规则
+        self.active = {}
+        self.history = deque(maxlen=history_size)
+        self.tick_interval = tick_interval
+        self.running = False
+
+        # 计数
+        self.evaluations = 0
+        self.raised = 0
+        self.cleared = 0
+
+        for item in config.get('rules', []):
+            for rule in self._expand(item):
+                self.rules[rule.key] = rule
+                for path in rule.paths:
+                    self.index.setdefault(path, []).append(rule)
+
+        # 启动时按当前值（可能来自快照）计算一次
+        now = time.time()
+        with self.lock:
+            for rule in self.rules.values():
+                self._evaluate(rule, now)
+        data_processor.add_listener(self.on_update)
+
+    @staticmethod
+    def load(data_processor, path=None):
+        """从YAML文件加载报警规则"""
+        path = path or DEFAULT_ALARMS_PATH
+        with open(path, 'r', encoding='utf-8') as file:
+            config = yaml.safe_load(file) or {}
+        engine = AlarmEngine(data_processor, config)
+        logger.info(f"成功加载报警规则 {path}，展开为 {len(engine.rules)} 条规则")
+        return engine
+
+    def _expand(self, item):
+        """把规则展开到具体测点
+
+        device_type 指定时对该类型的每个设备各生成一条规则，条件中的 point 为设备下的测点名；
+        否则条件中的 point 为完整的测点路径（以 / 分隔）。
+        """
+        points = self.data_processor.points
+        if item.get('device_type'):
+            prefixes = [
+                "/".join(device.path) for device in self.data_processor.topology.devices
+                if device.type == item['device_type'] and device.name is not None
+            ]
+        else:
+            prefixes = [None]
+
+        rules = []
+        for prefix in prefixes:
+            conditions = []
+            for condition in item.get('conditions', []):
+                path = condition['point'] if prefix is None else f"{prefix}/{condition['point']}"
+                if path not in points:
+                    logger.warning(f"报警规则 {item['id']} 引用了不存在的测点: {path}")
+                    conditions = None
+                    break
+                conditions.append(Condition(
+                    path, points[path], condition['op'], condition['value'], condition.get('hysteresis', 0)
+                ))
+            if not conditions:
+                continue
+            key = item['id'] if prefix is None else f"{item['id']}:{prefix}"
+            rules.append(AlarmRule(
+                key, item['id'], item.get('name', item['id']), item.get('level', 'warning'),
+                item.get('message', ''), conditions, item.get('on_delay', 0)
+            ))
+        return rules
+
+    def on_update(self, updates, timestamp):
+        """数据更新监听，只计算引用了变化测点的规则
+
+        Args:
+            updates: [(测点路径, 值, 是否变化), ...]
+            timestamp: 更新时间
+        """
+        rules = {}
+        for path, _, changed in updates:
+            if changed:
+                for rule in self.index.get(path, ()):
+                    rules[rule.key] = rule
+        if not rules and not self.pending:
+            return
+        with self.lock:
+            for rule in rules.values():
+                self._evaluate(rule, timestamp)
+            self._check_pending(timestamp)
+
+    def _evaluate(self, rule, now):
+        """重新计算一条规则，调用方需持有锁"""
+        self.evaluations += 1
+        # 从未收到过数据的测点还是初始值，不参与报警
+        point_times = self.data_processor.point_times
+        matched = all(
+            id(condition.point) in point_times and condition.check(condition.point["value"], rule.matched)
+            for condition in rule.conditions
+        )
+        if matched and not rule.matched:
+            rule.matched = True
+            rule.matched_since = now
+            if rule.on_delay > 0:
+                self.pending[rule.key] = rule
+            else:
+                self._raise(rule, now)
+        elif not matched and rule.matched:
+            rule.matched = False
+            rule.matched_since = None
+            self.pending.pop(rule.key, None)
+            if rule.active:
+                self._clear(rule, now)
+
+    def _check_pending(self, now):
+        """延时到达后报警，调用方需持有锁"""
+        for key, rule in list(self.pending.items()):
+            if now - rule.matched_since >= rule.on_delay:
+                del self.pending[key]
+                self._raise(rule, now)
+
+    def _values(self, rule):
+        return {condition.path: condition.point["value"] for condition in rule.conditions}
+
+    def _raise(self, rule, now):
+        rule.active = True
+        rule.active_since = now
+        self.active[rule.key] = rule
+        self.raised += 1
+        event = self._event(rule, "raised", now)
+        self.history.append(event)
+        logger.warning(f"报警: {rule.name} {rule.key} {event['values']}")
+
+    def _clear(self, rule, now):
+        rule.active = False
+        rule.active_since = None
+        self.active.pop(rule.key, None)
+        self.cleared += 1
+        self.history.append(self._event(rule, "cleared", now))
+        logger.info(f"报警恢复: {rule.name} {rule.key}")
+
+    def _event(self, rule, state, now):
+        return {
+            "key": rule.key,
+            "id": rule.rule_id,
+            "name": rule.name,
+            "level": rule.level,
+            "message": rule.message,
+            "state": state,
+            "time": now,
+            "values": self._values(rule),
+        }
+
+    def start(self):
+        """启动检查延时报警的线程，测点值不再变化时延时报警也能按时触发"""
+        self.running = True
+        thread = threading.Thread(target=self._tick_thread_func)
+        thread.daemon = True
+        thread.start()
+
+    def stop(self):
+        self.running = False
+
+    def _tick_thread_func(self):
+        while self.running:
+            time.sleep(self.tick_interval)
+            if self.pending:
+                with self.lock:
+                    self._check_pending(time.time())
+
+    def get_active(self):
+        """当前的报警列表"""
+        with self.lock:
+            return [self._event(rule, "active", rule.active_since) for rule in self.active.values()]
+
+    def get_history(self, limit=100):
+        """最近的报警事件，最新的在前"""
+        with self.lock:
+            return list(self.history)[-limit:][::-1]
+
+    def stats(self):
+        with self.lock:
+            return {
+                "rules": len(self.rules),
+                "indexed_points": len(self.index),
+                "active": len(self.active),
+                "pending": len(self.pending),
+                "evaluations": self.evaluations,
+                "raised": self.raised,
+                "cleared": self.cleared,
+            }
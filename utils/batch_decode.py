@@ -0,0 +1,239 @@
+"""
+批量解析，用于回放抓包数据和断线后补录历史数据
+
+把同一设备类型的多个响应帧叠成二维 uint8 数组（每行一帧），用大端视图一次取出所有寄存器，
+再除以换算向量，得到每个测点一列的数组，不再逐帧解析和更新字典。
+字段布局与 DataProcessor 的 parse_* 方法一致。
+
+需要 NumPy（可选依赖，只有批量解析使用），未安装时调用会抛出 RuntimeError。
+"""
+
+import os
+import sys
+
+# 添加上级目录到路径
+sys.path.append(os.path.dirname(os.path.dirname(__file__)))
+from utils.modbus import _CRC_TABLE
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+# 设备类型 -> [(测点, 寄存器序号, 类型, 除数, 小数位数), ...]，寄存器序号从响应数据区开始计算
+# 类型: bool 非0为真，int 原始值，float 原始值除以除数，小数位数不为None时四舍五入
+LAYOUTS = {
+    "ventilation_hood": [
+        ("运行状态", 0, "bool", 1, None),
+        ("强排开关", 3, "bool", 1, None),
+        ("报警信息", 5, "int", 1, None),
+        ("视窗高度", 6, "int", 1, None),
+        ("阀门开度", 7, "int", 1, None),
+        ("面风速", 8, "float", 100, 2),
+        ("排风速", 9, "int", 1, None),
+    ],
+    "exhaust_fan": [
+        ("运行状态", 2, "bool", 1, None),
+        ("排风频率", 3, "int", 1, None),
+        ("排风转速", 11, "int", 1, None),
+        ("管道压力", 13, "int", 1, None),
+        ("管道压力设定", 15, "int", 1, None),
+    ],
+    "clean_room": [
+        ("湿度", 0, "float", 10, None),
+        ("温度", 1, "float", 10, None),
+    ],
+}
+
+# 解析所需的最少数据字节数，与 parse_* 方法的长度检查一致
+MIN_DATA_BYTES = {
+    "ventilation_hood": 52,
+    "exhaust_fan": 32,
+    "clean_room": 4,
+}
+
+_HEADER = 3
+
+# 压差换算表，寄存器值 -> 压差(Pa)，首次使用时生成
+_pressure_table = None
+
+
+def _require_numpy():
+    if np is None:
+        raise RuntimeError("批量解析需要安装 numpy")
+
+
+def stack_frames(frames):
+    """把等长的响应帧叠成二维数组
+
+    Args:
+        frames: bytes 列表，或已经是 (帧数, 帧长) 的 uint8 数组
+
+    Returns:
+        numpy.ndarray: (帧数, 帧长) 的 uint8 数组
+    """
+    _require_numpy()
+    if isinstance(frames, np.ndarray):
+        if frames.ndim != 2 or frames.dtype != np.uint8:
+            raise ValueError("响应帧数组必须是二维 uint8 数组")
+        return frames
+    frames = list(frames)
+    if not frames:
+        return np.zeros((0, 0), dtype=np.uint8)
+    length = len(frames[0])
+    if any(len(frame) != length for frame in frames):
+        raise ValueError("批量解析的响应帧长度必须相同")
+    return np.frombuffer(b''.join(bytes(frame) for frame in frames), dtype=np.uint8).reshape(len(frames), length)
+
+
+def crc_valid(frames):
+    """逐列计算所有帧的CRC16，返回每帧CRC是否正确"""
+    _require_numpy()
+    count, length = frames.shape
+    if length < 4:
+        return np.zeros(count, dtype=bool)
+    table = np.array(_CRC_TABLE, dtype=np.uint16)
+    crc = np.full(count, 0xFFFF, dtype=np.uint16)
+    for column in range(length - 2):
+        crc = (crc >> 8) ^ table[(crc ^ frames[:, column]) & 0xFF]
+    received = frames[:, length - 2].astype(np.uint16) | (frames[:, length - 1].astype(np.uint16) << 8)
+    return crc == received
+
+
+def decode_batch(device_type, frames, device=None, check_crc=True):
+    """批量解析同一设备类型的响应帧
+
+    Args:
+        device_type: 设备类型，见 LAYOUTS，以及 differential_pressure
+        frames: 等长的响应帧，见 stack_frames
+        device: 拓扑中的设备，differential_pressure 需要按通道得到各洁净室的压差
+        check_crc: 是否校验CRC
+
+    Returns:
+        tuple: ({测点: 数组}, 有效帧的布尔数组)，无效帧对应位置的值没有意义
+    """
+    frames = stack_frames(frames)
+    count, length = frames.shape
+    valid = np.ones(count, dtype=bool)
+    if count == 0:
+        return {}, valid
+    # 功能码为读寄存器且数据长度足够
+    valid &= frames[:, 1] == 3
+    if check_crc:
+        valid &= crc_valid(frames)
+
+    if device_type == "differential_pressure":
+        if device is None:
+            raise ValueError("批量解析压差变送器需要指定设备")
+        channels = min(len(device.channels), (length - _HEADER) // 2)
+        valid &= frames[:, 2] >= channels * 2
+        registers = _registers(frames, channels)
+        pressure = _pressure_lookup()[registers]
+        return {room: pressure[:, i] for i, room in enumerate(device.channels[:channels])}, valid
+
+    layout = LAYOUTS.get(device_type)
+    if layout is None:
+        raise ValueError(f"未知的设备类型: {device_type}")
+    data_bytes = MIN_DATA_BYTES[device_type]
+    if length < _HEADER + data_bytes:
+        raise ValueError(f"{device_type} 响应帧长度不足: {length}")
+    valid &= frames[:, 2] >= data_bytes
+    registers = _registers(frames, data_bytes // 2)
+
+    columns = {}
+    # 需要换算的测点一次取出并除以除数向量
+    scaled = [field for field in layout if field[2] == "float"]
+    if scaled:
+        values = registers[:, [field[1] for field in scaled]] / np.array([field[3] for field in scaled], dtype=np.float64)
+        for i, (point, _, _, _, digits) in enumerate(scaled):
+            columns[point] = values[:, i] if digits is None else np.round(values[:, i], digits)
+    for point, index, kind, _, _ in layout:
+        if kind == "int":
+            columns[point] = registers[:, index].astype(np.int64)
+        elif kind == "bool":
+            columns[point] = registers[:, index] != 0
+    return columns, valid
+
+
+def _pressure_lookup():
+    """寄存器值到压差的换算表
+
+    原始值/150 得到电流(mA)，4-20mA 线性映射到 -60~60Pa 后保留1位小数。寄存器只有65536种取值，
+    直接用 parse_differential_pressure 相同的公式和 round 生成换算表，查表结果与逐帧解析完全一致
+    （numpy.round 在 .x5 处的舍入方式与 round 不同）。
+    """
+    global _pressure_table
+    if _pressure_table is None:
+        _pressure_table = np.array(
+            [round((value / 150 - 4) * (60 - (-60)) / (20 - 4) + (-60), 1) for value in range(65536)],
+            dtype=np.float64
+        )
+    return _pressure_table
+
+
+def _registers(frames, count):
+    """数据区前 count 个寄存器，大端无符号16位"""
+    data = np.ascontiguousarray(frames[:, _HEADER:_HEADER + count * 2])
+    return data.view('>u2').astype(np.uint16)
+
+
+class BatchDecoder:
+    """按设备分组批量解析回放或补录的响应
+
+    逐条记录只做分组，解析按 (设备, 帧长) 批量进行，结果按设备返回列式数组。
+    """
+
+    def __init__(self, topology):
+        """
+        Args:
+            topology: 设备拓扑，按 (串口, 从站ID) 查找设备
+        """
+        _require_numpy()
+        self.topology = topology
+
+    def decode(self, records, check_crc=True):
+        """批量解析
+
+        Args:
+            records: 可迭代的 (时间戳, 串口, 响应帧)
+            check_crc: 是否校验CRC
+
+        Returns:
+            dict: {设备路径: {"time": 时间数组, 测点: 数组, ...}}，只包含有效帧，按时间排序
+            未知设备和无效帧的数量在 "_skipped" 中
+        """
+        groups = {}
+        skipped = 0
+        for timestamp, port, frame in records:
+            if len(frame) < _HEADER:
+                skipped += 1
+                continue
+            device = self.topology.lookup(port, frame[0])
+            if device is None:
+                skipped += 1
+                continue
+            group = groups.get((id(device), len(frame)))
+            if group is None:
+                group = groups[(id(device), len(frame))] = (device, [], [])
+            group[1].append(timestamp)
+            group[2].append(frame)
+
+        parts = {}
+        for device, times, frames in groups.values():
+            try:
+                columns, valid = decode_batch(device.type, frames, device, check_crc)
+            except ValueError:
+                skipped += len(frames)
+                continue
+            skipped += int(len(frames) - valid.sum())
+            columns = {point: column[valid] for point, column in columns.items()}
+            columns["time"] = np.asarray(times, dtype=np.float64)[valid]
+            parts.setdefault("/".join(device.path), []).append(columns)
+
+        result = {}
+        for path, items in parts.items():
+            merged = {key: np.concatenate([item[key] for item in items]) for key in items[0]}
+            order = np.argsort(merged["time"], kind="stable")
+            result[path] = {key: column[order] for key, column in merged.items()}
+        result["_skipped"] = skipped
+        return result
@@ -0,0 +1,70 @@
+import os
+import sys
+import threading
+import time
+
+# 添加上级目录到路径
+sys.path.append(os.path.dirname(os.path.dirname(__file__)))
+from utils.Logger import logger
+
+
+class ConfigWatcher:
+    """配置文件监视类，定时检查文件修改时间，文件变化后调用对应的回调函数"""
+
+    def __init__(self, interval=2.0):
+        """
+        Args:
+            interval: 检查间隔（秒）
+        """
+        self.interval = interval
+        # 文件路径 -> [修改时间, 回调函数]
+        self.files = {}
+        self.running = False
+        self.thread = None
+
+    @staticmethod
+    def _mtime(path):
+        try:
+            return os.path.getmtime(path)
+        except OSError:
+            return None
+
+    def watch(self, path, callback):
+        """登记需要监视的文件，callback 参数为文件路径"""
+        self.files[path] = [self._mtime(path), callback]
+
+    def start(self):
+        """启动监视线程"""
+        if self.thread and self.thread.is_alive():
+            return
+        self.running = True
+        self.thread = threading.Thread(target=self._watch_thread_func)
+        self.thread.daemon = True
+        self.thread.start()
+        logger.info(f"配置文件监视已启动: {list(self.files.keys())}")
+
+    def stop(self):
+        """停止监视"""
+        self.running = False
+
+    def check(self):
+        """检查一次所有文件，返回发生变化的文件列表"""
+        changed = []
+        for path, entry in self.files.items():
+            mtime = self._mtime(path)
+            if mtime is None or mtime == entry[0]:
+                continue
+            entry[0] = mtime
+            changed.append(path)
+            try:
+                entry[1](path)
+            except Exception as e:
+                # 配置写了一半或格式错误时保留旧配置，下次修改后再重新加载
+                logger.error(f"重新加载配置 {path} 失败: {e}")
+        return changed
+
+    def _watch_thread_func(self):
+        """监视线程函数"""
+        while self.running:
+            time.sleep(self.interval)
+            self.check()
@@ -0,0 +1,189 @@
+import gzip
+import json
+import threading
+import zlib
+from collections import OrderedDict
+
+# 支持的压缩方式，按优先顺序
+ENCODINGS = ("gzip", "deflate")
+
+
+def parse_accept_encoding(header):
+    """解析 Accept-Encoding 请求头
+
+    Args:
+        header: 请求头的值，如 "gzip, deflate;q=0.5, br"
+
+    Returns:
+        str: 选择的压缩方式，客户端不支持压缩时返回None
+    """
+    accepted = {}
+    for item in (header or "").split(","):
+        parts = item.strip().split(";")
+        name = parts[0].strip().lower()
+        if not name:
+            continue
+        quality = 1.0
+        for param in parts[1:]:
+            key, _, value = param.strip().partition("=")
+            if key == "q":
+                try:
+                    quality = float(value)
+                except ValueError:
+                    quality = 0.0
+        accepted[name] = quality
+    best = None
+    for encoding in ENCODINGS:
+        quality = accepted.get(encoding, accepted.get("*", 0.0))
+        if quality > 0 and (best is None or quality > best[1]):
+            best = (encoding, quality)
+    return best[0] if best else None
+
+
+class DataView:
+    """/data 接口的测点选择、字段裁剪和压缩
+
+    按楼层、设备、测点名选择数据树的一部分，value 模式只返回测点的值，full 模式返回值和单位、显示等属性。
+    选择结果（测点路径列表）只与查询参数有关，数据树结构不变，计算一次后缓存；
+    编码和压缩后的响应体按 (查询参数, 模式, 压缩方式) 缓存，数据版本号变化后才重新生成，
+    多个前端轮询同一份数据时只编码、压缩一次。
+    """
+
+    def __init__(self, data_processor, cache_size=128, min_compress_size=512, compress_level=6):
+        """
+        Args:
+            data_processor: 数据处理器
+            cache_size: 缓存的响应体个数
+            min_compress_size: 小于该字节数的响应不压缩
+            compress_level: 压缩级别 1-9
+        """
+        self.data_processor = data_processor
+        self.cache_size = cache_size
+        self.min_compress_size = min_compress_size
+        self.compress_level = compress_level
+        self.lock = threading.Lock()
+        # 查询参数 -> [测点路径, ...]
+        self.selections = OrderedDict()
+        # (查询参数, 模式, 压缩方式) -> (数据版本号, 响应体, 是否压缩, 压缩前字节数)
+        self.bodies = OrderedDict()
+
+        # 计数
+        self.hits = 0
+        self.misses = 0
+        self.bytes_raw = 0
+        self.bytes_sent = 0
+
+    def select(self, floors=(), devices=(), points=()):
+        """按楼层、设备、测点名选择测点
+
+        Args:
+            floors: 楼层名，如 ["3F"]
+            devices: 设备名或设备路径，如 ["302通风柜"] 或 ["3F/302通风柜"]
+            points: 测点名，如 ["面风速"]
+
+        Returns:
+            list: 选中的测点路径，条件为空表示不限制
+        """
+        key = (tuple(floors), tuple(devices), tuple(points))
+        with self.lock:
+            paths = self.selections.get(key)
+            if paths is not None:
+                self.selections.move_to_end(key)
+                return paths
+        device_prefixes = tuple(device.rstrip("/") + "/" for device in devices if "/" in device)
+        device_names = {device for device in devices if "/" not in device}
+        paths = []
+        for path in self.data_processor.points:
+            parts = path.split("/")
+            if floors and parts[0] not in floors:
+                continue
+            if devices and not (path.startswith(device_prefixes) or device_names.intersection(parts[:-1])):
+                continue
+            if points and parts[-1] not in points:
+                continue
+            paths.append(path)
+        with self.lock:
+            self.selections[key] = paths
+            while len(self.selections) > self.cache_size:
+                self.selections.popitem(last=False)
+        return paths
+
+    def _build(self, paths, mode):
+        """按选中的测点生成嵌套的数据，调用方需持有数据锁"""
+        points = self.data_processor.points
+        result = {}
+        for path in paths:
+            parts = path.split("/")
+            node = result
+            for part in parts[:-1]:
+                node = node.setdefault(part, {})
+            point = points[path]
+            node[parts[-1]] = point["value"] if mode == "value" else dict(point)
+        return result
+
+    def _compress(self, body, encoding):
+        if encoding == "gzip":
+            return gzip.compress(body, compresslevel=self.compress_level, mtime=0)
+        return zlib.compress(body, self.compress_level)
+
+    def render(self, floors=(), devices=(), points=(), mode="full", accept_encoding=None):
+        """生成响应体
+
+        Args:
+            floors/devices/points: 选择条件，见 select
+            mode: value 只返回值，full 返回完整的测点属性
+            accept_encoding: 请求的 Accept-Encoding 头
+
+        Returns:
+            tuple: (响应体 bytes, 压缩方式或None)
+        """
+        if mode not in ("value", "full"):
+            raise ValueError(f"未知的数据模式: {mode}")
+        selection = (tuple(floors), tuple(devices), tuple(points))
+        encoding = parse_accept_encoding(accept_encoding)
+        key = (selection, mode, encoding)
+        # 版本号只增不减，读到的旧值最多导致多生成一次
+        version = self.data_processor.version
+        with self.lock:
+            cached = self.bodies.get(key)
+            if cached is not None and cached[0] == version:
+                self.bodies.move_to_end(key)
+                self.hits += 1
+                self.bytes_raw += cached[3]
+                self.bytes_sent += len(cached[1])
+                return cached[1], encoding if cached[2] else None
+            self.misses += 1
+
+        unfiltered = not (floors or devices or points)
+        paths = None if unfiltered else self.select(floors, devices, points)
+        with self.data_processor.data_lock:
+            version = self.data_processor.version
+            if unfiltered and mode == "full":
+                body = json.dumps(self.data_processor.data, ensure_ascii=False)
+            else:
+                data = self._build(self.data_processor.points if paths is None else paths, mode)
+                body = json.dumps(data, ensure_ascii=False)
+        body = body.encode("utf-8")
+        raw_size = len(body)
+        compressed = encoding is not None and raw_size >= self.min_compress_size
+        if compressed:
+            body = self._compress(body, encoding)
+
+        with self.lock:
+            self.bodies[key] = (version, body, compressed, raw_size)
+            self.bodies.move_to_end(key)
+            while len(self.bodies) > self.cache_size:
+                self.bodies.popitem(last=False)
+            self.bytes_raw += raw_size
+            self.bytes_sent += len(body)
+        return body, encoding if compressed else None
+
+    def stats(self):
+        with self.lock:
+            return {
+                "cached_bodies": len(self.bodies),
+                "hits": self.hits,
+                "misses": self.misses,
+                "bytes_raw": self.bytes_raw,
+                "bytes_sent": self.bytes_sent,
+            }
@@ -0,0 +1,248 @@
+"""
+历史数据导出
+
+按时间窗口分块遍历测点统计（见 utils/rollups.py，早于内存保留范围的桶从 utils/rollup_archive.py 的归档读取），
+逐块编码为 CSV 或 NDJSON，由生成器直接写入HTTP响应或文件。
+每块只查询该时间窗口内的桶，内存占用只与一块的大小有关，与导出的时间范围无关。
+导出以低优先级运行：每块之间让出CPU，同时进行的导出数量有上限，不影响轮询解析和其他接口的延迟。
+"""
+
+import csv
+import io
+import json
+import threading
+import time
+
+# 导出格式 -> MIME类型
+FORMATS = {
+    "csv": "text/csv",
+    "ndjson": "application/x-ndjson",
+}
+
+COLUMNS = ("time", "start", "point", "count", "min", "max", "avg", "last")
+
+
+def parse_time(value):
+    """解析时间参数
+
+    Args:
+        value: 秒数，或本地时间 "YYYY-MM-DD"、"YYYY-MM-DD HH:MM"、"YYYY-MM-DD HH:MM:SS"（也可用T分隔）
+
+    Returns:
+        float: 时间戳（秒），value 为空时返回None
+    """
+    if value is None or value == "":
+        return None
+    try:
+        return float(value)
+    except ValueError:
+        pass
+    text = str(value).strip().replace("T", " ")
+    for pattern in ("%Y-%m-%d %H:%M:%S", "%Y-%m-%d %H:%M", "%Y-%m-%d"):
+        try:
+            return time.mktime(time.strptime(text, pattern))
+        except ValueError:
+            continue
+    raise ValueError(f"无法解析的时间: {value}")
+
+
+class ExportStream:
+    """一次导出的响应体，可迭代得到编码后的字节块
+
+    关闭（WSGI服务器在响应结束或客户端断开时调用 close）或迭代结束时释放导出名额。
+    """
+
+    def __init__(self, exporter, chunks):
+        self.exporter = exporter
+        self.chunks = chunks
+        self.released = False
+
+    def __iter__(self):
+        return self
+
+    def __next__(self):
+        try:
+            return next(self.chunks)
+        except StopIteration:
+            self.close()
+            raise
+
+    def close(self):
+        if self.released:
+            return
+        self.released = True
+        self.chunks.close()
+        self.exporter._release()
+
+
+class HistoryExporter:
+    """测点统计的流式导出"""
+
+    def __init__(self, rollup_store, chunk_buckets=240, pause=0.01, max_concurrent=2, archive=None):
+        """
+        Args:
+            rollup_store: 测点滚动统计
+            chunk_buckets: 每块包含的时间桶个数，如小时粒度时 240 表示每次查询10天
+            pause: 每块之间让出CPU的时间（秒）
+            max_concurrent: 同时进行的导出数量上限
+            archive: 测点统计归档（RollupArchive），早于内存中最早的桶的数据从归档读取
+        """
+        self.rollup_store = rollup_store
+        self.archive = archive
+        self.chunk_buckets = max(1, int(chunk_buckets))
+        self.pause = pause
+        self.slots = threading.BoundedSemaphore(max(1, int(max_concurrent)))
+        self.lock = threading.Lock()
+
+        # 计数
+        self.active = 0
+        self.exports = 0
+        self.rejected = 0
+        self.rows = 0
+        self.bytes = 0
+
+    def resolution_seconds(self, resolution):
+        seconds = self.rollup_store.stats()["resolutions"].get(resolution)
+        if seconds is None:
+            raise ValueError(f"未知的统计粒度: {resolution}")
+        return seconds
+
+    def iter_rows(self, paths, resolution, start=None, end=None):
+        """按时间窗口分块生成导出行
+
+        Args:
+            paths: 测点路径列表
+            resolution: 统计粒度
+            start: 开始时间（秒），包含，None表示从最早的数据开始
+            end: 结束时间（秒），不包含，None表示到最新的数据
+
+        Yields:
+            list: 一个时间窗口内的行 [{"start", "point", "count", "min", "max", "avg", "last"}, ...]，
+            按时间、测点排序
+        """
+        seconds = self.resolution_seconds(resolution)
+        window = seconds * self.chunk_buckets
+        span = self._span(paths, resolution)
+        if span is None:
+            return
+        # 时间范围限制在已有数据内，很早的开始时间（如0）不会遍历大量空的时间窗口
+        start = span[0] if start is None else max(start, span[0])
+        end = span[1] + seconds if end is None else min(end, span[1] + seconds)
+        # 每个测点内存中最早的桶之前的数据从归档读取，之后的从内存读取，两者不重复
+        cutoffs = {}
+        if self.archive is not None and resolution in self.rollup_store.archive_resolutions:
+            for path in paths:
+                memory = self.rollup_store.span(path, resolution)
+                cutoffs[path] = memory[0] if memory else end
+        archive_end = max(cutoffs.values(), default=start)
+        chunk_start = start
+        while chunk_start < end:
+            chunk_end = min(chunk_start + window, end)
+            rows = []
+            if chunk_start < archive_end:
+                for path, bucket in self.archive.read(resolution, cutoffs, chunk_start, min(chunk_end, archive_end)):
+                    if bucket[0] < cutoffs[path]:
+                        rows.append(self._row(path, bucket))
+            for path in paths:
+                for bucket in self.rollup_store.query(path, resolution, chunk_start, chunk_end):
+                    bucket["point"] = path
+                    rows.append(bucket)
+            chunk_start = chunk_end
+            if rows:
+                rows.sort(key=lambda row: row["start"])
+                yield rows
+                # 低优先级: 每块之间让出CPU，轮询解析和其他请求线程优先运行，空的时间窗口不等待
+                time.sleep(self.pause)
+
+    @staticmethod
+    def _row(path, bucket):
+        start, count, total, minimum, maximum, last = bucket
+        return {
+            "start": start,
+            "count": count,
+            "min": minimum,
+            "max": maximum,
+            "avg": round(total / count, 4),
+            "last": last,
+            "point": path,
+        }
+
+    def _span(self, paths, resolution):
+        """测点在该粒度上最早和最晚的桶开始时间（归档按月份估计），都没有数据时返回None"""
+        spans = [self.rollup_store.span(path, resolution) for path in paths]
+        if self.archive is not None and resolution in self.rollup_store.archive_resolutions:
+            archived = self.archive.span(resolution)
+            if archived is not None:
+                # 归档的结束为下个月的开始，作为最晚的桶开始时间时再减去一个桶
+                spans.append((archived[0], archived[1] - self.resolution_seconds(resolution)))
+        spans = [span for span in spans if span is not None]
+        if not spans:
+            return None
+        return min(span[0] for span in spans), max(span[1] for span in spans)
+
+    def iter_encoded(self, paths, resolution, start=None, end=None, fmt="csv"):
+        """按块生成编码后的字节
+
+        CSV 以 UTF-8 BOM 开头，Excel 打开时中文测点名不乱码；NDJSON 每行一个JSON对象。
+        """
+        if fmt not in FORMATS:
+            raise ValueError(f"未知的导出格式: {fmt}")
+        if fmt == "csv":
+            header = io.StringIO()
+            csv.writer(header).writerow(COLUMNS)
+            yield self._count(("\ufeff" + header.getvalue()).encode("utf-8"), 0)
+        for rows in self.iter_rows(paths, resolution, start, end):
+            for row in rows:
+                row["time"] = time.strftime("%Y-%m-%d %H:%M:%S", time.localtime(row["start"]))
+            if fmt == "csv":
+                buffer = io.StringIO()
+                writer = csv.writer(buffer)
+                writer.writerows([row[column] for column in COLUMNS] for row in rows)
+                text = buffer.getvalue()
+            else:
+                text = "".join(
+                    json.dumps({column: row[column] for column in COLUMNS}, ensure_ascii=False) + "\n"
+                    for row in rows
+                )
+            yield self._count(text.encode("utf-8"), len(rows))
+
+    def _count(self, data, rows):
+        with self.lock:
+            self.rows += rows
+            self.bytes += len(data)
+        return data
+
+    def open(self, paths, resolution, start=None, end=None, fmt="csv"):
+        """开始一次导出
+
+        Returns:
+            ExportStream，达到同时导出数量上限时返回None
+        Raises:
+            ValueError: 统计粒度或格式错误
+        """
+        self.resolution_seconds(resolution)
+        if fmt not in FORMATS:
+            raise ValueError(f"未知的导出格式: {fmt}")
+        if not self.slots.acquire(blocking=False):
+            with self.lock:
+                self.rejected += 1
+            return None
+        with self.lock:
+            self.active += 1
+            self.exports += 1
+        return ExportStream(self, self.iter_encoded(paths, resolution, start, end, fmt))
+
+    def _release(self):
+        with self.lock:
+            self.active -= 1
+        self.slots.release()
+
+    def stats(self):
+        with self.lock:
+            return {
+                "active": self.active,
+                "exports": self.exports,
+                "rejected": self.rejected,
+                "rows": self.rows,
+                "bytes": self.bytes,
+            }
@@ -0,0 +1,53 @@
+import threading
+from collections import deque
+
+
+class LatencyStats:
+    """延迟统计类，记录次数、最近值、平均值、最大值以及最近窗口内的分位数"""
+
+    def __init__(self, window=1000):
+        """初始化延迟统计
+
+        Args:
+            window: 计算分位数时保留的最近样本数
+        """
+        self.lock = threading.Lock()
+        self.count = 0
+        self.total = 0.0
+        self.last = 0.0
+        self.max = 0.0
+        self.samples = deque(maxlen=window)
+
+    def record(self, seconds):
+        """记录一次延迟（秒）"""
+        with self.lock:
+            self.count += 1
+            self.total += seconds
+            self.last = seconds
+            if seconds > self.max:
+                self.max = seconds
+            self.samples.append(seconds)
+
+    def snapshot(self):
+        """获取统计结果，单位为毫秒"""
+        with self.lock:
+            samples = sorted(self.samples)
+            count = self.count
+            avg = self.total / count if count else 0.0
+            last = self.last
+            max_value = self.max
+
+        def percentile(p):
+            if not samples:
+                return 0.0
+            return samples[min(len(samples) - 1, int(len(samples) * p))]
+
+        return {
+            "count": count,
+            "last_ms": round(last * 1000, 3),
+            "avg_ms": round(avg * 1000, 3),
+            "max_ms": round(max_value * 1000, 3),
+            "p50_ms": round(percentile(0.50) * 1000, 3),
+            "p95_ms": round(percentile(0.95) * 1000, 3),
+            "p99_ms": round(percentile(0.99) * 1000, 3),
+        }
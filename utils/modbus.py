@@ -0,0 +1,84 @@
+"""
+Modbus RTU 公共函数，后端和串口服务器共用
+"""
+
+
+def _build_crc_table():
+    """预先计算CRC16(Modbus)查找表"""
+    table = []
+    for value in range(256):
+        crc = value
+        for _ in range(8):
+            if crc & 0x0001:
+                crc = (crc >> 1) ^ 0xA001
+            else:
+                crc = crc >> 1
+        table.append(crc)
+    return table
+
+
+_CRC_TABLE = _build_crc_table()
+
+
+def crc16(data):
+    """计算CRC16(Modbus)，返回整数"""
+    crc = 0xFFFF
+    for byte in data:
+        crc = (crc >> 8) ^ _CRC_TABLE[(crc ^ byte) & 0xFF]
+    return crc
+
+
+def calculate_crc(data):
+    """计算CRC校验码，返回小端序的2个字节"""
+    return crc16(data).to_bytes(2, byteorder='little')
+
+
+def check_crc(frame):
+    """校验RTU帧末尾的CRC"""
+    if len(frame) < 4:
+        return False
+    return crc16(frame[:-2]) == int.from_bytes(frame[-2:], byteorder='little')
+
+
+# 写功能码：写单个线圈、写单个寄存器、写多个线圈、写多个寄存器
+WRITE_FUNCTION_CODES = (5, 6, 15, 16)
+
+
+def is_write_request(frame):
+    """判断RTU请求帧是否为写命令"""
+    return len(frame) > 1 and frame[1] in WRITE_FUNCTION_CODES
+
+
+# 响应长度固定的功能码 -> 完整帧长度: 读异常状态、诊断、获取通信事件计数器、写单个/多个线圈和寄存器、屏蔽写寄存器
+FIXED_RESPONSE_LENGTHS = {0x07: 5, 0x08: 8, 0x0B: 8, 5: 8, 6: 8, 15: 8, 16: 8, 0x16: 10}
+
+# 响应第3个字节为数据字节数的功能码: 读线圈/离散输入/寄存器、获取通信事件记录、报告从站ID、读写文件记录、读写多个寄存器
+BYTE_COUNT_FUNCTION_CODES = (1, 2, 3, 4, 0x0C, 0x11, 0x14, 0x15, 0x17)
+
+
+def expected_response_length(frame):
+    """根据已收到的响应帧头计算完整RTU响应帧的长度
+
+    Returns:
+        int: 完整帧长度，已收到的字节不足以判断或功能码未知（如0x2B）时返回None，
+        未知功能码的帧由 RtuFramer.flush 在线路静默后按CRC判断
+    """
+    if len(frame) < 2:
+        return None
+    function_code = frame[1]
+    if function_code & 0x80:
+        # 异常响应: 地址 + 功能码 + 异常码 + CRC
+        return 5
+    if function_code in FIXED_RESPONSE_LENGTHS:
+        return FIXED_RESPONSE_LENGTHS[function_code]
+    if function_code in BYTE_COUNT_FUNCTION_CODES:
+        if len(frame) < 3:
+            return None
+        # 读命令响应: 地址 + 功能码 + 字节数 + 数据 + CRC
+        return 5 + frame[2]
+    if function_code == 0x18:
+        if len(frame) < 4:
+            return None
+        # 读FIFO队列: 地址 + 功能码 + 字节数(2) + 数据 + CRC
+        return 6 + int.from_bytes(frame[2:4], byteorder='big')
+    return None
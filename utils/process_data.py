@@ -5,13 +5,20 @@ import sys
 sys.path.append(os.path.dirname(os.path.dirname(__file__)))
 import time
 from utils.Logger import logger
+from utils.topology import DeviceTopology
+from utils.protocol import to_hex
+from utils.modbus import check_crc
+from utils.metrics import LatencyStats
+from utils.tracing import tracer
 import traceback
 import json
 import threading
 
 class DataGen:
-    def __init__(self):
+    def __init__(self, topology=None):
         self.serial_manager = None
+        # 设备拓扑，未指定时加载默认的 config/topology.yaml
+        self.topology = topology or DeviceTopology.load()
         self.data = self._initialize_data()
 
     def _generate_random_value(self, value_type):
@@ -54,189 +61,234 @@ class DataGen:
         }
 
     def _initialize_data(self):
-        """初始化完整的数据结构"""
-        return {
-            "2F": {
-                "First":{
-                    "201通风柜": self._create_ventilation_hood(),
-                    "202通风柜": self._create_ventilation_hood(),
-                    "204通风柜": self._create_ventilation_hood(),
-                    "205通风柜": self._create_ventilation_hood(),
-                    "206通风柜": self._create_ventilation_hood(),
-                    "排风机": self._create_exhaust_fan()
-                },
-                "Second":{
-                    "更衣室": self._create_clean_room(),
-                    "缓冲间": self._create_clean_room(),
-                    "洁净走廊": self._create_clean_room(),
-                    "生物医学实验室2": self._create_clean_room(),
-                    "生物医学实验室1": self._create_clean_room(),
-                }
-            },
-            "3F": {
-                "307通风柜1": self._create_ventilation_hood(),
-                "307通风柜2": self._create_ventilation_hood(),
-                "307通风柜3": self._create_ventilation_hood(),
-                "307通风柜4": self._create_ventilation_hood(),
-                "305通风柜": self._create_ventilation_hood(),
-                "304通风柜": self._create_ventilation_hood(),
-                "302通风柜": self._create_ventilation_hood(),
-            }
+        """按设备拓扑初始化完整的数据结构"""
+        templates = {
+            "ventilation_hood": self._create_ventilation_hood,
+            "exhaust_fan": self._create_exhaust_fan,
+            "clean_room": self._create_clean_room,
         }
+        return self.topology.build(templates)
 
 class DataProcessor:
-    def __init__(self):
+    def __init__(self, topology=None):
         self.logger = logger
         # 存储各个串口和指令的数据
         self.port_data = {}
-        self.dataGen = DataGen()
+        self.dataGen = DataGen(topology)
+        self.topology = self.dataGen.topology
         self.data = self.dataGen.data
         self.data_lock = threading.Lock()
+        # 从串口读到数据到数据可被API查询的延迟
+        self.ingest_latency = LatencyStats()
+        # 测点路径 -> 测点对象，数据树结构不变，只需计算一次
+        self.points = self._collect_points(self.data, [])
+        # id(测点对象) -> 最近一次更新时间
+        self.point_times = {}
+        # 数据版本号，每次更新加1，快照据此判断是否需要保存
+        self.version = 0
+        # id(测点对象) -> 测点路径
+        self.point_paths = {id(point): path for path, point in self.points.items()}
+        # 数据更新监听，如报警规则引擎
+        self.listeners = []
+        # CRC错误而丢弃的响应数，从站返回的异常响应数
+        self.crc_errors = 0
+        self.exception_responses = 0
+
+        # 设备类型 -> 解析方法
+        self.decoders = {
+            "ventilation_hood": self.parse_ventilation_hood,
+            "exhaust_fan": self.parse_exhaust_fan,
+            "clean_room": self.parse_clean_room,
+            "differential_pressure": self.parse_differential_pressure,
+        }
 
     def get_comid_data(self, com, device_id_str):
         """获取指定串口和ID的数据"""
+        device_id = int(device_id_str)
+        device = self.topology.lookup(com, device_id)
+        if device is None:
+            self.logger.warning(f"未知的设备ID: {hex(device_id)}")
+            return json.dumps({"message": "未知的设备ID"})
         with self.data_lock:
-            # 根据设备ID选择解析方法
-            device_id = int(device_id_str)  # 将16进制字符串转换为10进制整数
-            if device_id == 88:  
-                # 洁净走廊
-                return json.dumps(self.data["2F"]["Second"]["洁净走廊"])
-            elif 145 <= device_id <= 149:  
-                # 洁净室
-                return json.dumps(self.data["2F"]["Second"])
-            elif device_id == 2:  
-                # 0x02，排风机数据
-                return json.dumps(self.data["2F"]["First"]["排风机"])
-            elif 21 <= device_id <= 25:  
-                # 0x15-0x19，2F的通风柜数据
-                return json.dumps(self.data["2F"]["First"])
-            elif 31 <= device_id <= 37:  
-                # 0x1F-0x25，3F的通风柜数据
-                return json.dumps(self.data["3F"])
-            else:
-                self.logger.warning(f"未知的设备ID: {hex(device_id)}")
-                return json.dumps({"message": "未知的设备ID"})
+            return json.dumps(device.view_data)
 
     def get_all_data(self):
         """获取当前数据"""
         with self.data_lock:
             return self.data
 
-    def _parse_response(self, port_name, response_hex: str):
+    @classmethod
+    def _collect_points(cls, node, path):
+        """遍历数据树，返回 {测点路径: 测点对象}"""
+        points = {}
+        for key, child in node.items():
+            if not isinstance(child, dict):
+                continue
+            if "value" in child:
+                points["/".join(path + [key])] = child
+            else:
+                points.update(cls._collect_points(child, path + [key]))
+        return points
+
+    def add_listener(self, listener):
+        """注册数据更新监听，每解析一帧调用一次
+
+        Args:
+            listener: listener(updates, timestamp)，updates 为 [(测点路径, 值, 是否变化), ...]
+        """
+        self.listeners.append(listener)
+
+    def export(self):
+        """导出所有测点的当前值，供快照使用
+
+        Returns:
+            tuple: (数据版本号, [(测点路径, 值, 更新时间), ...])
+        """
+        with self.data_lock:
+            return self.version, [
+                (path, point["value"], self.point_times.get(id(point), 0.0))
+                for path, point in self.points.items()
+            ]
+
+    def restore(self, records):
+        """从快照恢复测点的值，恢复的测点标记为 stale，收到新数据后清除标记
+
+        Returns:
+            int: 恢复的测点数
+        """
+        count = 0
+        with self.data_lock:
+            for path, value, timestamp in records:
+                point = self.points.get(path)
+                # 从未收到过数据的测点仍使用初始值
+                if point is None or not timestamp:
+                    continue
+                point["value"] = value
+                point["stale"] = True
+                self.point_times[id(point)] = timestamp
+                count += 1
+        return count
+
+    def get_stats(self):
+        """获取数据处理的统计信息"""
+        return {
+            "ingest_latency": self.ingest_latency.snapshot(),
+            "crc_errors": self.crc_errors,
+            "exception_responses": self.exception_responses
+        }
+
+    def _parse_response(self, port_name, response, read_time=None, cid=None):
         """解析响应数据
         Args:
             port_name: 串口名称
-            response_hex: 接收到的十六进制数据
-        后续可根据port_name来选择解析方法
+            response: 接收到的响应帧，bytes/memoryview，兼容十六进制字符串
+            read_time: 串口服务器读到响应的时间戳，用于统计读取到可见的延迟
+            cid: 链路追踪的关联ID（请求序号）
+        根据 (串口, 从站ID) 在设备拓扑中查找设备，再按设备类型选择解析方法
+        Returns:
+            dict: 解析结果
         """
+        with tracer.span("backend.parse", cid, serial=port_name):
+            return self._parse_response_bytes(port_name, response, read_time)
+
+    def _parse_response_bytes(self, port_name, response, read_time):
+        """解析响应数据，参数见 _parse_response"""
+        mydict = {}
         try:
-            # 获取命令的第一个字节并转换为十进制
-            device_id = int(response_hex.split()[0], 16)  # 将16进制字符串转换为10进制整数
-            mydict = {}
-            
-            # 根据设备ID选择解析方法
-            if device_id == 88:  # 0x58 = 88
-                mydict = self.parse_modbus_response_ID88(response_hex)
-            elif 145 <= device_id <= 149:  # 0x91-0x95
-                # 计算对应的洁净室索引（0-4）
-                room_index = device_id - 145
-                mydict = self.parse_modbus_response_ID145(response_hex, room_index)
-            elif device_id == 2:  # 0x02，排风机数据
-                mydict = self.parse_modbus_response_ID2(response_hex)
-            elif 21 <= device_id <= 25:  # 0x15-0x19，2F的通风柜数据
-                mydict = self.parse_modbus_response_ventilation_hood(response_hex, "2F", device_id - 21)
-            elif 31 <= device_id <= 37:  # 0x1F-0x25，3F的通风柜数据
-                mydict = self.parse_modbus_response_ventilation_hood(response_hex, "3F", device_id - 31)
+            if isinstance(response, str):
+                data_bytes = bytes.fromhex(response.replace(" ", ""))
             else:
+                data_bytes = response
+            # 串口服务器只转发校验通过的帧，这里再校验一次，兼容旧版服务器和回放数据
+            if not check_crc(data_bytes):
+                self.crc_errors += 1
+                self.logger.warning(f"{port_name} 响应CRC校验失败，丢弃: {to_hex(data_bytes)}")
+                return {"message": "CRC校验失败", "portname": port_name}
+            # 异常响应（功能码最高位为1）CRC正确但没有数据区，不能交给解析方法
+            if data_bytes[1] & 0x80:
+                self.exception_responses += 1
+                self.logger.warning(f"{port_name} 从站{data_bytes[0]}返回异常响应，异常码{data_bytes[2]}")
+                return {"message": f"异常响应，异常码{data_bytes[2]}", "portname": port_name}
+            # 响应的第一个字节是从站ID
+            device_id = data_bytes[0]
+
+            device = self.topology.lookup(port_name, device_id)
+            if device is None:
                 self.logger.warning(f"未知的设备ID: {hex(device_id)}")
-            # logger.info(f"解析: {device_id}")
+            else:
+                values = self.decoders[device.type](data_bytes, device)
+                if values:
+                    # 只在更新数据时短暂持有锁，测点引用已在加载拓扑时预先计算
+                    now = time.time()
+                    updates = []
+                    with self.data_lock:
+                        for key, value in values.items():
+                            point = device.refs[key]
+                            if self.listeners:
+                                # 第一个真实样本（或快照恢复后的第一个样本）总是算作变化，
+                                # 即使它与初始占位值相同，引用它的规则也要计算一次
+                                changed = (point["value"] != value or id(point) not in self.point_times
+                                           or "stale" in point)
+                                updates.append((self.point_paths[id(point)], value, changed))
+                            point["value"] = value
+                            if "stale" in point:
+                                del point["stale"]
+                            self.point_times[id(point)] = now
+                        self.version += 1
+                    # 监听在锁外调用，不阻塞接口查询
+                    for listener in self.listeners:
+                        try:
+                            listener(updates, now)
+                        except Exception as e:
+                            self.logger.error(f"数据更新监听出错: {e}")
+                    if read_time:
+                        # 服务器与后端不在同一台机器时包含两者的时钟偏差
+                        self.ingest_latency.record(max(0.0, time.time() - read_time))
+                    mydict = dict(values)
+                else:
+                    mydict = {"message": "数据长度不足"}
+
             mydict["portname"] = port_name
             mydict["设备ID"] = device_id
             mydict["解析时间"] = time.strftime('%Y-%m-%d %H:%M:%S', time.localtime())
-            mydict["原始数据"] = response_hex
-            return json.dumps(mydict)
+            # 原始数据仅供人工查看，此处才转换为十六进制
+            mydict["原始数据"] = to_hex(data_bytes)
+            return mydict
             
         except Exception as e:
             self.logger.error(f"数据解析错误: {e}\n{traceback.format_exc()}")
-            return json.dumps(mydict)  # 即使发生错误也返回当前数据
-
-    def parse_modbus_response_ID88(self, response_hex: str) -> dict:
-        """解析Modbus响应数据，提取洁净室压差值"""
-        try:
-            data_bytes = bytes.fromhex(response_hex.replace(" ", ""))
-            
-            
-            # 先获取房间列表并计算所有压差值，避免长时间持有锁
-            pressure_updates = {}
-            with self.data_lock:
-                clean_rooms = list(self.data["2F"]["Second"].keys())
-            # 在锁外进行数据解析
-            for i, room in enumerate(clean_rooms):
-                start_index = 3 + i * 2
-                if start_index + 2 <= len(data_bytes):
-                    # 将原始值转换为电流值(mA)
-                    current_ma = int.from_bytes(data_bytes[start_index:start_index+2], byteorder='big') / 150
-                    # 将4-20mA线性映射到-60到60Pa
-                    pressure_value = (current_ma - 4) * (60 - (-60)) / (20 - 4) + (-60)
-                    # 四舍五入到1位小数
-                    pressure_value = round(pressure_value, 1)
-                    pressure_updates[room] = pressure_value
-            # 只在更新数据时短暂持有锁
-            with self.data_lock:
-                for room, pressure in pressure_updates.items():
-                    self.data["2F"]["Second"][room]["压差"]["value"] = pressure
-                    
-                    # logger.info(f"data_bytes: {pressure}")
-                    # logger.info({room: self.data["2F"]["Second"][room]["压差"], "pressure": pressure})
-            
-            return pressure_updates
+            return mydict  # 即使发生错误也返回当前数据
 
-        except Exception as e:
-            logger.error(f"Modbus数据解析错误: {e}")
+    def parse_differential_pressure(self, data_bytes: bytes, device) -> dict:
+        """解析压差变送器数据，按通道顺序得到各洁净室的压差值"""
+        if len(data_bytes) < 5:
             return None
-        
+        # 数据区由字节数决定，不能读到CRC
+        data_end = min(3 + data_bytes[2], len(data_bytes) - 2)
+        pressure_updates = {}
+        for i, room in enumerate(device.channels):
+            start_index = 3 + i * 2
+            if start_index + 2 <= data_end:
+                # 将原始值转换为电流值(mA)
+                current_ma = int.from_bytes(data_bytes[start_index:start_index+2], byteorder='big') / 150
+                # 将4-20mA线性映射到-60到60Pa
+                pressure_value = (current_ma - 4) * (60 - (-60)) / (20 - 4) + (-60)
+                # 四舍五入到1位小数
+                pressure_updates[room] = round(pressure_value, 1)
+        return pressure_updates
 
-    def parse_modbus_response_ID145(self, response_hex: str, room_index: int) -> dict:
-        """解析Modbus响应数据，提取单个洁净室的温度和湿度值
-        Args:
-            response_hex: 接收到的十六进制数据
-            room_index: 洁净室索引（0-4）
-        """
-        try:
-            data_bytes = bytes.fromhex(response_hex.replace(" ", ""))
-            
-            # 先获取房间名
-            with self.data_lock:
-                clean_rooms = list(self.data["2F"]["Second"].keys())
-                if room_index >= len(clean_rooms):
-                    return {"message": "房间索引超出范围"}
-                room = clean_rooms[room_index]
-            
-            # 在锁外进行数据解析
-            if len(data_bytes) >= 7:  # 确保有足够的数据（3字节头 + 4字节数据）
-                # 解析湿度值（前2个字节）并除以10
-                humid_value = int.from_bytes(data_bytes[3:5], byteorder='big') / 10.0
-                # 解析温度值（后2个字节）并除以10
-                temp_value = int.from_bytes(data_bytes[5:7], byteorder='big') / 10.0
-                
-                # 只在更新数据时短暂持有锁
-                with self.data_lock:
-                    self.data["2F"]["Second"][room]["湿度"]["value"] = humid_value
-                    self.data["2F"]["Second"][room]["温度"]["value"] = temp_value
-                
-                print(f"更新 {room} 数据: 温度={temp_value}℃, 湿度={humid_value}%")
-                return {
-                    "湿度": humid_value,
-                    "温度": temp_value
-                }
-            else:
-                return {"message": "数据长度不足"}
-
-        except Exception as e:
-            self.logger.error(f"Modbus数据解析错误: {e}\n{traceback.format_exc()}")
+    def parse_clean_room(self, data_bytes: bytes, device) -> dict:
+        """解析单个洁净室的温度和湿度值"""
+        if len(data_bytes) < 7:  # 确保有足够的数据（3字节头 + 4字节数据）
             return None
+        return {
+            # 解析湿度值（前2个字节）并除以10
+            "湿度": int.from_bytes(data_bytes[3:5], byteorder='big') / 10.0,
+            # 解析温度值（后2个字节）并除以10
+            "温度": int.from_bytes(data_bytes[5:7], byteorder='big') / 10.0
+        }
 
-    def parse_modbus_response_ID2(self, response_hex: str):
+    def parse_exhaust_fan(self, data_bytes: bytes, device) -> dict:
         """解析排风机数据
         协议地址对应关系：
         40003: 启动指示 -> 运行状态
@@ -245,34 +297,18 @@ class DataProcessor:
         40014: 管道压力 -> 管道压力
         40016: 管道压力设定 -> 管道压力设定
         """
-        try:
-            data_bytes = bytes.fromhex(response_hex.replace(" ", ""))
-            start_index = 3  # 跳过Modbus协议头
-            
-            # 在锁外进行数据解析
-            if len(data_bytes) >= start_index + 32:  # 确保有足够的数据到40016
-                fan_values = {
-                    "运行状态": bool(int.from_bytes(data_bytes[start_index+4:start_index+6], byteorder='big')),
-                    "排风频率": int.from_bytes(data_bytes[start_index+6:start_index+8], byteorder='big'),
-                    "排风转速": int.from_bytes(data_bytes[start_index+22:start_index+24], byteorder='big'),
-                    "管道压力": int.from_bytes(data_bytes[start_index+26:start_index+28], byteorder='big'),
-                    "管道压力设定": int.from_bytes(data_bytes[start_index+30:start_index+32], byteorder='big')
-                }
-                
-                # 只在更新数据时短暂持有锁
-                with self.data_lock:
-                    for key, value in fan_values.items():
-                        self.data["2F"]["First"]["排风机"][key]["value"] = value
-                
-                return fan_values
-            else:
-                return {"message": "数据长度不足"}
-
-        except Exception as e:
-            self.logger.error(f"排风机数据解析错误: {e}\n{traceback.format_exc()}")
+        start_index = 3  # 跳过Modbus协议头
+        if len(data_bytes) < start_index + 32:  # 确保有足够的数据到40016
             return None
+        return {
+            "运行状态": bool(int.from_bytes(data_bytes[start_index+4:start_index+6], byteorder='big')),
+            "排风频率": int.from_bytes(data_bytes[start_index+6:start_index+8], byteorder='big'),
+            "排风转速": int.from_bytes(data_bytes[start_index+22:start_index+24], byteorder='big'),
+            "管道压力": int.from_bytes(data_bytes[start_index+26:start_index+28], byteorder='big'),
+            "管道压力设定": int.from_bytes(data_bytes[start_index+30:start_index+32], byteorder='big')
+        }
 
-    def parse_modbus_response_ventilation_hood(self, response_hex: str, floor: str, hood_index: int):
+    def parse_ventilation_hood(self, data_bytes: bytes, device) -> dict:
         """解析通风柜数据
         协议地址对应关系：
         40020: 运行状态
@@ -283,58 +319,20 @@ class DataProcessor:
         40025: 排风速
         40026: 面风速
         """
-        try:
-            data_bytes = bytes.fromhex(response_hex.replace(" ", ""))
-            start_index = 3  # 跳过Modbus协议头
-            
-            # 在锁外进行数据解析
-            if len(data_bytes) >= start_index + 52:  # 确保有足够的数据
-                # self.logger.info(f"通风柜数据: {data_bytes}")
-                # self.logger.info(f"视窗高度解析之前: {data_bytes[start_index+12:start_index+14]}")
-                
-                
-                hood_values = {
-                    "运行状态": bool(int.from_bytes(data_bytes[start_index+0:start_index+2], byteorder='big')),
-                    "强排开关": bool(int.from_bytes(data_bytes[start_index+6:start_index+8], byteorder='big')),
-                    "报警信息": int.from_bytes(data_bytes[start_index+10:start_index+12], byteorder='big'),
-                    "视窗高度": int.from_bytes(data_bytes[start_index+12:start_index+14], byteorder='big'),
-                    "阀门开度": int.from_bytes(data_bytes[start_index+14:start_index+16], byteorder='big'),
-                    "排风速": int.from_bytes(data_bytes[start_index+18:start_index+20], byteorder='big'),
-                    "面风速": round(int.from_bytes(data_bytes[start_index+16:start_index+18], byteorder='big') * 0.01, 2) # 面风速的单位是0.01m/s
-                }
-                # self.logger.info(f"视窗高度解析之后: {hood_values['视窗高度']}")
-                
-                # 只在更新数据时短暂持有锁
-                if floor == "2F":
-                    floor_keys = list(self.data[floor]["First"].keys())
-                    with self.data_lock:
-                        if 0 <= hood_index < len(floor_keys):
-                            hood_key = floor_keys[hood_index]
-                            hood_data = self.data[floor]["First"][hood_key]
-                        
-                        for key, value in hood_values.items():
-                            hood_data[key]["value"] = value
-                        self.data[floor]["First"][hood_key] = hood_data
-                elif floor == "3F":
-                    floor_keys = list(self.data[floor].keys())
-                    with self.data_lock:
-                        if 0 <= hood_index < len(floor_keys):
-                            hood_key = floor_keys[hood_index]
-                            hood_data = self.data[floor][hood_key]
-                        
-                        for key, value in hood_values.items():
-                            hood_data[key]["value"] = value
-                        self.data[floor][hood_key] = hood_data
-                
-                return hood_values
-            else:
-                return {"message": "数据长度不足"}
-
-        except Exception as e:
-            self.logger.error(f"通风柜数据解析错误: {e}\n{traceback.format_exc()}")
+        start_index = 3  # 跳过Modbus协议头
+        if len(data_bytes) < start_index + 52:  # 确保有足够的数据
             return None
+        return {
+            "运行状态": bool(int.from_bytes(data_bytes[start_index+0:start_index+2], byteorder='big')),
+            "强排开关": bool(int.from_bytes(data_bytes[start_index+6:start_index+8], byteorder='big')),
+            "报警信息": int.from_bytes(data_bytes[start_index+10:start_index+12], byteorder='big'),
+            "视窗高度": int.from_bytes(data_bytes[start_index+12:start_index+14], byteorder='big'),
+            "阀门开度": int.from_bytes(data_bytes[start_index+14:start_index+16], byteorder='big'),
+            "排风速": int.from_bytes(data_bytes[start_index+18:start_index+20], byteorder='big'),
+            "面风速": round(int.from_bytes(data_bytes[start_index+16:start_index+18], byteorder='big') * 0.01, 2) # 面风速的单位是0.01m/s
+        }
 
 if __name__ == "__main__":
     dp = DataProcessor()
-    dp._parse_response("1F 03 3A 00 00 00 00 00 00 00 00 00 00 00 08 02 28 00 00 00 00 00 00 00 00 00 00 00 00 00 00 00 00 00 00 00 34 00 00 00 00 00 00 00 00 00 00 03 24 00 00 00 00 00 00 00 00 00 00 00 00 46 A8")
+    print(dp._parse_response("COM45", bytes.fromhex("1F 03 3A 00 00 00 00 00 00 00 00 00 00 00 08 02 28 00 00 00 00 00 00 00 00 00 00 00 00 00 00 00 00 00 00 00 34 00 00 00 00 00 00 00 00 00 00 03 24 00 00 00 00 00 00 00 00 00 00 00 00 46 A8")))
     
\ No newline at end of file
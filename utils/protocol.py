@@ -0,0 +1,149 @@
+"""
+后端与串口服务器之间的二进制帧协议
+
+帧格式: 帧头(1字节 0xA5) + 帧类型(1字节) + 负载长度(4字节, 大端) + 负载
+
+帧类型:
+    MSG_JSON      控制消息，负载为UTF-8编码的JSON（串口初始化列表、初始化结果、错误信息）
+    MSG_REQUEST   Modbus请求，负载为 序号(4) + 串口名长度(1) + 串口名 + 请求帧
+    MSG_RESPONSE  Modbus响应，负载为 序号(4) + 状态(1) + 时间戳(8) + 串口名长度(1) + 串口名
+                  + 请求帧长度(2) + 请求帧 + 响应帧（状态非0时为UTF-8错误信息）
+    MSG_SCHEDULE  轮询计划，负载为UTF-8编码的JSON，串口服务器收到后在本地按计划轮询，
+                  结果以MSG_RESPONSE帧持续推送，序号为 SCHEDULE_SEQ_FLAG | 命令编号
+    MSG_TRANSPORT 传输方式协商，负载为UTF-8编码的JSON，同机部署时改用共享内存传输（见 utils/shm_transport.py）
+
+Modbus帧始终以原始字节传输，只有在日志或调试接口中才转换为十六进制字符串。
+"""
+
+import struct
+import json
+
+FRAME_MAGIC = 0xA5
+
+MSG_JSON = 0x01
+MSG_REQUEST = 0x02
+MSG_RESPONSE = 0x03
+MSG_SCHEDULE = 0x04
+MSG_TRANSPORT = 0x05
+
+# 轮询计划推送的响应序号带有该标志位，与后端逐条请求的序号区分
+SCHEDULE_SEQ_FLAG = 0x80000000
+
+STATUS_SUCCESS = 0
+STATUS_ERROR = 1
+
+_HEADER = struct.Struct('>BBI')
+_REQUEST_HEAD = struct.Struct('>IB')
+_RESPONSE_HEAD = struct.Struct('>IBdB')
+_LENGTH16 = struct.Struct('>H')
+
+
+def to_hex(data):
+    """将字节转换为十六进制字符串，仅用于日志和调试显示"""
+    return bytes(data).hex(' ').upper()
+
+
+def encode_frame(msg_type, payload):
+    """封装一帧数据"""
+    return _HEADER.pack(FRAME_MAGIC, msg_type, len(payload)) + payload
+
+
+def encode_json(data, msg_type=MSG_JSON):
+    """封装JSON控制消息"""
+    return encode_frame(msg_type, json.dumps(data).encode('utf-8'))
+
+
+def encode_request(seq, serial, request):
+    """封装Modbus请求帧"""
+    port = serial.encode('utf-8')
+    return encode_frame(MSG_REQUEST, _REQUEST_HEAD.pack(seq, len(port)) + port + bytes(request))
+
+
+def decode_request(payload):
+    """解析Modbus请求帧
+
+    Returns:
+        tuple: (序号, 串口名, 请求帧memoryview)
+    """
+    view = memoryview(payload)
+    seq, port_len = _REQUEST_HEAD.unpack_from(view, 0)
+    offset = _REQUEST_HEAD.size
+    serial = bytes(view[offset:offset + port_len]).decode('utf-8')
+    return seq, serial, view[offset + port_len:]
+
+
+def encode_response(seq, status, timestamp, serial, request, response):
+    """封装Modbus响应帧"""
+    port = serial.encode('utf-8')
+    request = bytes(request)
+    payload = b''.join((
+        _RESPONSE_HEAD.pack(seq, status, timestamp, len(port)),
+        port,
+        _LENGTH16.pack(len(request)),
+        request,
+        bytes(response),
+    ))
+    return encode_frame(MSG_RESPONSE, payload)
+
+
+def decode_response(payload):
+    """解析Modbus响应帧，请求帧和响应帧以memoryview返回，不做拷贝
+
+    Returns:
+        dict: 与原JSON格式字段一致的响应数据
+    """
+    view = memoryview(payload)
+    seq, status, timestamp, port_len = _RESPONSE_HEAD.unpack_from(view, 0)
+    offset = _RESPONSE_HEAD.size
+    serial = bytes(view[offset:offset + port_len]).decode('utf-8')
+    offset += port_len
+    request_len, = _LENGTH16.unpack_from(view, offset)
+    offset += _LENGTH16.size
+    request = view[offset:offset + request_len]
+    response = view[offset + request_len:]
+
+    if status != STATUS_SUCCESS:
+        return {
+            "status": "error",
+            "seq": seq,
+            "serial": serial,
+            "request": request,
+            "message": bytes(response).decode('utf-8', errors='replace'),
+            "time": timestamp,
+        }
+    return {
+        "status": "success",
+        "seq": seq,
+        "serial": serial,
+        "request": request,
+        "response": response,
+        "time": timestamp,
+    }
+
+
+class FrameReader:
+    """TCP字节流分帧器，处理半包和粘包"""
+
+    def __init__(self):
+        self.buffer = bytearray()
+
+    def feed(self, data):
+        """写入收到的字节，返回其中所有完整的帧
+
+        Returns:
+            list: [(帧类型, 负载), ...]
+        """
+        self.buffer += data
+        frames = []
+        while len(self.buffer) >= _HEADER.size:
+            magic, msg_type, length = _HEADER.unpack_from(self.buffer, 0)
+            if magic != FRAME_MAGIC:
+                # 帧头错误，丢弃一个字节后重新同步
+                del self.buffer[0]
+                continue
+            end = _HEADER.size + length
+            if len(self.buffer) < end:
+                break
+            frames.append((msg_type, self.buffer[_HEADER.size:end]))
+            del self.buffer[:end]
+        return frames
@@ -0,0 +1,191 @@
+import threading
+import time
+import queue
+import itertools
+from collections import OrderedDict, deque
+
+# 队列满时的处理策略
+POLICY_BLOCK = 'block'              # 阻塞等待，形成反压
+POLICY_DROP_OLDEST = 'drop_oldest'  # 丢弃最旧的数据
+POLICY_REPLACE = 'replace'          # 相同key只保留最新的一条，新key在队列满时丢弃最旧的数据
+
+POLICIES = (POLICY_BLOCK, POLICY_DROP_OLDEST, POLICY_REPLACE)
+
+
+class BoundedQueue:
+    """有界队列，接口与queue.Queue保持一致，支持多种溢出策略并统计计数"""
+
+    def __init__(self, maxsize=1000, policy=POLICY_BLOCK, block_timeout=None, priority_maxsize=100):
+        """初始化有界队列
+
+        Args:
+            maxsize: 队列最大长度，0表示不限制
+            policy: 队列满时的处理策略，见 POLICIES
+            block_timeout: block 策略下最长等待时间（秒），超时后丢弃新数据，None表示一直等待
+            priority_maxsize: 高优先级通道的最大长度，满时拒绝新数据，0表示不限制
+        """
+        if policy not in POLICIES:
+            raise ValueError(f"未知的队列策略: {policy}")
+        self.maxsize = maxsize
+        self.priority_maxsize = priority_maxsize
+        self.policy = policy
+        self.block_timeout = block_timeout
+
+        # key -> item，按入队顺序排列，无key的数据使用自增序号作为key
+        self.items = OrderedDict()
+        # 高优先级数据（如写命令），总是先于普通数据取出，不受溢出策略影响，满时直接拒绝
+        self.priority_items = deque()
+        self._auto_key = itertools.count()
+        self.mutex = threading.Lock()
+        self.not_empty = threading.Condition(self.mutex)
+        self.not_full = threading.Condition(self.mutex)
+
+        # 计数
+        self.put_count = 0
+        self.get_count = 0
+        self.dropped = 0
+        self.replaced = 0
+        self.blocked = 0
+        self.high_water = 0
+
+    def _full(self):
+        return 0 < self.maxsize <= len(self.items)
+
+    def put(self, item, key=None, priority=False):
+        """放入数据
+
+        Args:
+            item: 数据
+            key: 去重的key，如 (串口, 从站ID)，只在 replace 策略下生效
+            priority: 是否放入高优先级通道
+
+        Returns:
+            bool: 数据是否入队
+        """
+        with self.not_full:
+            self.put_count += 1
+            if priority:
+                if 0 < self.priority_maxsize <= len(self.priority_items):
+                    # 不丢弃已排队的写命令，由调用方立即得到失败结果
+                    self.dropped += 1
+                    return False
+                self.priority_items.append(item)
+                self.not_empty.notify()
+                return True
+
+            if self.policy == POLICY_REPLACE and key is not None and key in self.items:
+                # 保留原来的排队位置，只替换为最新的数据
+                self.items[key] = item
+                self.replaced += 1
+                return True
+
+            if self._full():
+                if self.policy == POLICY_BLOCK:
+                    self.blocked += 1
+                    deadline = None if self.block_timeout is None else time.monotonic() + self.block_timeout
+                    while self._full():
+                        remaining = None if deadline is None else deadline - time.monotonic()
+                        if remaining is not None and remaining <= 0:
+                            self.dropped += 1
+                            return False
+                        self.not_full.wait(remaining)
+                else:
+                    self.items.popitem(last=False)
+                    self.dropped += 1
+
+            if key is None or self.policy != POLICY_REPLACE:
+                key = ('_auto', next(self._auto_key))
+            self.items[key] = item
+            self.high_water = max(self.high_water, len(self.items))
+            self.not_empty.notify()
+            return True
+
+    def get(self, block=True, timeout=None):
+        """取出数据，行为与queue.Queue.get一致，队列为空时抛出queue.Empty"""
+        with self.not_empty:
+            if not block:
+                if not self._has_items():
+                    raise queue.Empty
+            elif timeout is None:
+                while not self._has_items():
+                    self.not_empty.wait()
+            else:
+                deadline = time.monotonic() + timeout
+                while not self._has_items():
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0:
+                        raise queue.Empty
+                    self.not_empty.wait(remaining)
+            if self.priority_items:
+                self.get_count += 1
+                return self.priority_items.popleft()
+            _, item = self.items.popitem(last=False)
+            self.get_count += 1
+            self.not_full.notify()
+            return item
+
+    def _has_items(self):
+        return bool(self.items) or bool(self.priority_items)
+
+    def get_nowait(self):
+        """非阻塞取出数据"""
+        return self.get(block=False)
+
+    def clear(self):
+        """清空队列，返回被清除的数据条数"""
+        with self.mutex:
+            count = len(self.items) + len(self.priority_items)
+            self.items.clear()
+            self.priority_items.clear()
+            self.not_full.notify_all()
+            return count
+
+    def remove(self, match):
+        """移除满足条件的数据（如调用方已放弃的请求）
+
+        Args:
+            match: 判断函数，match(item) 为True的数据被移除
+
+        Returns:
+            int: 移除的条数
+        """
+        with self.mutex:
+            kept = deque(item for item in self.priority_items if not match(item))
+            removed = len(self.priority_items) - len(kept)
+            self.priority_items = kept
+            for key in [key for key, item in self.items.items() if match(item)]:
+                del self.items[key]
+                removed += 1
+            if removed:
+                self.not_full.notify_all()
+            return removed
+
+    def contains(self, key):
+        """队列中是否已有指定key的数据"""
+        with self.mutex:
+            return key in self.items
+
+    def qsize(self):
+        with self.mutex:
+            return len(self.items) + len(self.priority_items)
+
+    def empty(self):
+        with self.mutex:
+            return not self._has_items()
+
+    def stats(self):
+        """获取队列计数"""
+        with self.mutex:
+            return {
+                "size": len(self.items),
+                "priority_size": len(self.priority_items),
+                "priority_maxsize": self.priority_maxsize,
+                "maxsize": self.maxsize,
+                "policy": self.policy,
+                "put": self.put_count,
+                "get": self.get_count,
+                "dropped": self.dropped,
+                "replaced": self.replaced,
+                "blocked": self.blocked,
+                "high_water": self.high_water,
+            }
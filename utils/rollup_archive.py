@@ -0,0 +1,228 @@
+"""
+测点统计归档
+
+内存中的 RollupStore 每个粒度只保留 retention 个桶，重启后清空。归档把已结束的小时/天桶追加写入磁盘，
+按粒度和月份分文件，历史数据导出从归档和内存合并读取，时间范围不受 retention 和运行时长限制；
+未结束的桶单独保存，重启后先加载归档中最近的桶和未结束的桶，统计从中断处继续。
+
+目录结构: {目录}/{粒度}/{YYYY-MM}.csv，每行: 开始时间,样本数,总和,最小值,最大值,最后值,测点路径
+          {目录}/open.json，保存时未结束的桶
+"""
+
+import csv
+import json
+import os
+import sys
+import threading
+import time
+
+# 添加上级目录到路径
+sys.path.append(os.path.dirname(os.path.dirname(__file__)))
+from utils.Logger import logger
+
+
+def _month(timestamp):
+    """时间戳所在的本地月份，如 2025-01"""
+    return time.strftime("%Y-%m", time.localtime(timestamp))
+
+
+def _month_start(month):
+    """月份第一天0点的时间戳"""
+    return time.mktime(time.strptime(month, "%Y-%m"))
+
+
+def _next_month_start(month):
+    year, number = map(int, month.split("-"))
+    year, number = (year + 1, 1) if number == 12 else (year, number + 1)
+    return _month_start(f"{year:04d}-{number:02d}")
+
+
+def _number(text):
+    value = float(text)
+    return int(value) if value.is_integer() and "." not in text else value
+
+
+class RollupArchive:
+    """测点统计的磁盘归档，后台线程定期写入已结束的桶，解析线程不受影响"""
+
+    def __init__(self, rollup_store, directory, interval=60.0):
+        """
+        Args:
+            rollup_store: 测点滚动统计，归档的粒度由其 archive_resolutions 决定
+            directory: 归档目录
+            interval: 写入间隔（秒）
+        """
+        self.rollup_store = rollup_store
+        self.directory = directory
+        self.interval = interval
+        self.running = False
+        self.thread = None
+        # 写入失败的桶留到下次写入 [(粒度, 测点路径, 桶), ...]
+        self.pending = []
+        self.lock = threading.Lock()
+
+        # 计数
+        self.save_count = 0
+        self.archived_buckets = 0
+        self.last_save_time = None
+        self.last_save_ms = 0.0
+        self.loaded_buckets = 0
+
+    def _path(self, resolution, month):
+        return os.path.join(self.directory, resolution, f"{month}.csv")
+
+    def _months(self, resolution):
+        """已有归档文件的月份，按时间排序"""
+        try:
+            names = os.listdir(os.path.join(self.directory, resolution))
+        except FileNotFoundError:
+            return []
+        return sorted(name[:-4] for name in names if name.endswith(".csv"))
+
+    def read(self, resolution, paths=None, start=None, end=None):
+        """读取归档中的桶，只打开与时间范围重叠的月份文件，逐行读取
+
+        Args:
+            resolution: 粒度名称
+            paths: 测点路径集合，None表示所有测点
+            start: 开始时间（秒），包含
+            end: 结束时间（秒），不包含
+
+        Yields:
+            tuple: (测点路径, [开始时间, 样本数, 总和, 最小值, 最大值, 最后值])，同一文件内按写入顺序
+        """
+        first = None if start is None else _month(start)
+        last = None if end is None else _month(end - 1)
+        for month in self._months(resolution):
+            if (first is not None and month < first) or (last is not None and month > last):
+                continue
+            try:
+                with open(self._path(resolution, month), newline="", encoding="utf-8") as file:
+                    for row in csv.reader(file):
+                        if len(row) != 7 or (paths is not None and row[6] not in paths):
+                            continue
+                        bucket_start = _number(row[0])
+                        if (start is not None and bucket_start < start) or (end is not None and bucket_start >= end):
+                            continue
+                        yield row[6], [bucket_start, int(row[1])] + [_number(text) for text in row[2:6]]
+            except OSError as e:
+                logger.error(f"读取统计归档 {month} 失败: {e}")
+
+    def span(self, resolution):
+        """归档覆盖的时间范围
+
+        Returns:
+            tuple: (最早月份的开始, 最晚月份的结束)，没有归档时返回None
+        """
+        months = self._months(resolution)
+        if not months:
+            return None
+        return _month_start(months[0]), _next_month_start(months[-1])
+
+    def load(self):
+        """启动时加载每个归档粒度最近 retention 个桶的时间范围和未结束的桶
+
+        Returns:
+            int: 加载的桶数
+        """
+        loaded = 0
+        now = time.time()
+        for name, seconds, retention in self.rollup_store.resolutions:
+            if name not in self.rollup_store.archive_resolutions:
+                continue
+            series = {}
+            for path, bucket in self.read(name, start=now - seconds * retention):
+                series.setdefault(path, {})[bucket[0]] = bucket
+            for path, buckets in series.items():
+                loaded += self.rollup_store.restore(name, path, [buckets[key] for key in sorted(buckets)])
+        open_path = os.path.join(self.directory, "open.json")
+        if os.path.exists(open_path):
+            try:
+                with open(open_path, encoding="utf-8") as file:
+                    saved = json.load(file)
+                for name, path, bucket in saved.get("buckets", []):
+                    loaded += self.rollup_store.restore(name, path, [bucket], archived=False)
+            except (OSError, ValueError, TypeError) as e:
+                logger.error(f"加载未结束的统计 {open_path} 失败: {e}")
+        self.loaded_buckets = loaded
+        if loaded:
+            logger.info(f"已从 {self.directory} 加载 {loaded} 个统计桶")
+        return loaded
+
+    def save(self):
+        """追加写入已结束的桶，并保存未结束的桶（先写临时文件再替换）
+
+        Returns:
+            int: 追加的桶数
+        """
+        with self.lock:
+            start = time.perf_counter()
+            pending = self.pending + self.rollup_store.take_finished()
+            self.pending = []
+            files = {}
+            for name, path, bucket in pending:
+                files.setdefault((name, _month(bucket[0])), []).append([*bucket, path])
+            for (name, month), rows in files.items():
+                try:
+                    os.makedirs(os.path.join(self.directory, name), exist_ok=True)
+                    with open(self._path(name, month), "a", newline="", encoding="utf-8") as file:
+                        csv.writer(file).writerows(rows)
+                except OSError as e:
+                    # 没写入的桶留到下次
+                    logger.error(f"写入统计归档 {name}/{month} 失败: {e}")
+                    self.pending += [(name, row[6], row[:6]) for row in rows]
+                    continue
+                self.archived_buckets += len(rows)
+
+            os.makedirs(self.directory, exist_ok=True)
+            open_path = os.path.join(self.directory, "open.json")
+            temp_path = open_path + ".tmp"
+            with open(temp_path, "w", encoding="utf-8") as file:
+                json.dump({"time": time.time(), "buckets": self.rollup_store.open_buckets()}, file,
+                          ensure_ascii=False)
+            os.replace(temp_path, open_path)
+
+            self.save_count += 1
+            self.last_save_time = time.time()
+            self.last_save_ms = round((time.perf_counter() - start) * 1000, 3)
+            return len(pending) - len(self.pending)
+
+    def start(self):
+        """启动定期写入线程"""
+        if self.thread and self.thread.is_alive():
+            return
+        self.running = True
+        self.thread = threading.Thread(target=self._save_thread_func)
+        self.thread.daemon = True
+        self.thread.start()
+
+    def stop(self):
+        """停止写入线程并写入最后一次"""
+        self.running = False
+        try:
+            self.save()
+        except Exception as e:
+            logger.error(f"写入统计归档失败: {e}")
+
+    def _save_thread_func(self):
+        """写入线程函数"""
+        while self.running:
+            time.sleep(self.interval)
+            try:
+                self.save()
+            except Exception as e:
+                logger.error(f"写入统计归档失败: {e}")
+
+    def stats(self):
+        """获取归档统计"""
+        with self.lock:
+            pending = len(self.pending)
+        return {
+            "directory": self.directory,
+            "save_count": self.save_count,
+            "archived_buckets": self.archived_buckets,
+            "pending": pending,
+            "last_save_time": self.last_save_time,
+            "last_save_ms": self.last_save_ms,
+            "loaded_buckets": self.loaded_buckets,
+        }
@@ -0,0 +1,220 @@
+import bisect
+import threading
+import time
+from collections import deque
+
+# 默认的统计粒度: 名称 -> (秒数, 保留的桶数)
+DEFAULT_RESOLUTIONS = {
+    "minute": {"seconds": 60, "retention": 1440},
+    "hour": {"seconds": 3600, "retention": 720},
+    "day": {"seconds": 86400, "retention": 366},
+}
+
+# 桶的字段下标: [开始时间, 样本数, 总和, 最小值, 最大值, 最后值]
+_START, _COUNT, _SUM, _MIN, _MAX, _LAST = range(6)
+
+
+class _Starts:
+    """桶开始时间的只读序列视图，用于对按时间排序的桶二分查找"""
+
+    def __init__(self, buckets):
+        self.buckets = buckets
+
+    def __len__(self):
+        return len(self.buckets)
+
+    def __getitem__(self, index):
+        return self.buckets[index][_START]
+
+
+class RollupStore:
+    """测点的滚动统计
+
+    每个测点在每个统计粒度（分钟/小时/天）上按时间桶保存 最小值/最大值/平均值/最后值，
+    每个样本只更新各粒度的最后一个桶，复杂度 O(1)；报表查询只遍历桶，不需要扫描原始数据。
+    小时和天按本地时间对齐。布尔值按 0/1 统计（平均值即运行时间占比），非数值测点不统计。
+    """
+
+    def __init__(self, resolutions=None, archive_resolutions=()):
+        """
+        Args:
+            resolutions: 统计粒度 {名称: {"seconds": 秒数, "retention": 保留的桶数}}，默认见 DEFAULT_RESOLUTIONS
+            archive_resolutions: 需要归档的粒度，这些粒度的桶结束后交给 RollupArchive 写入磁盘
+        """
+        resolutions = resolutions or DEFAULT_RESOLUTIONS
+        self.resolutions = [
+            (name, int(item["seconds"]), int(item["retention"])) for name, item in resolutions.items()
+        ]
+        self.archive_resolutions = set(archive_resolutions)
+        self.lock = threading.Lock()
+        # (测点路径, 粒度名称) -> deque([桶, ...])
+        self.series = {}
+        # 已结束、等待归档的桶 [(粒度名称, 测点路径, 桶), ...]
+        self.finished = []
+        # 最后一个桶是从归档加载的序列，该桶结束时不再重复归档
+        self.archived_last = set()
+        self.samples = 0
+        self.out_of_order = 0
+
+    @staticmethod
+    def _bucket_start(timestamp, seconds, offset):
+        """按本地时间对齐的桶开始时间"""
+        return (int(timestamp + offset) // seconds) * seconds - offset
+
+    def on_update(self, updates, timestamp):
+        """数据更新监听，每个样本更新各粒度的当前桶
+
+        Args:
+            updates: [(测点路径, 值, 是否变化), ...]
+            timestamp: 更新时间
+        """
+        offset = time.localtime(timestamp).tm_gmtoff
+        starts = [
+            (name, self._bucket_start(timestamp, seconds, offset), retention)
+            for name, seconds, retention in self.resolutions
+        ]
+        with self.lock:
+            for path, value, _ in updates:
+                if isinstance(value, bool):
+                    value = int(value)
+                elif not isinstance(value, (int, float)):
+                    continue
+                self.samples += 1
+                for name, start, retention in starts:
+                    buckets = self.series.get((path, name))
+                    if buckets is None:
+                        buckets = self.series[(path, name)] = deque(maxlen=retention)
+                    if buckets and buckets[-1][_START] == start:
+                        bucket = buckets[-1]
+                        bucket[_COUNT] += 1
+                        bucket[_SUM] += value
+                        if value < bucket[_MIN]:
+                            bucket[_MIN] = value
+                        if value > bucket[_MAX]:
+                            bucket[_MAX] = value
+                        bucket[_LAST] = value
+                    elif not buckets or start > buckets[-1][_START]:
+                        if buckets and name in self.archive_resolutions:
+                            self._finish(path, name, buckets[-1])
+                        buckets.append([start, 1, value, value, value, value])
+                    else:
+                        # 比当前桶更早的样本（如时钟回拨）不再统计
+                        self.out_of_order += 1
+
+    def _finish(self, path, resolution, bucket):
+        """桶结束，等待归档（调用时持有锁）"""
+        key = (path, resolution)
+        if key in self.archived_last:
+            self.archived_last.discard(key)
+        else:
+            self.finished.append((resolution, path, bucket))
+
+    def take_finished(self):
+        """取出等待归档的桶
+
+        Returns:
+            list: [(粒度名称, 测点路径, [开始时间, 样本数, 总和, 最小值, 最大值, 最后值]), ...]
+        """
+        with self.lock:
+            finished, self.finished = self.finished, []
+            return finished
+
+    def open_buckets(self):
+        """归档粒度上还没有结束、也不在归档中的桶，重启后用 restore 恢复
+
+        Returns:
+            list: [(粒度名称, 测点路径, 桶), ...]
+        """
+        with self.lock:
+            return [
+                (name, path, list(buckets[-1]))
+                for (path, name), buckets in self.series.items()
+                if buckets and name in self.archive_resolutions and (path, name) not in self.archived_last
+            ]
+
+    def restore(self, resolution, path, buckets, archived=True):
+        """加载归档或未结束的桶，追加到序列末尾，不晚于已有最后一个桶的跳过
+
+        Args:
+            resolution: 粒度名称
+            path: 测点路径
+            buckets: 按时间排序的桶
+            archived: 这些桶是否已在归档中
+
+        Returns:
+            int: 加载的桶数
+        """
+        retention = {name: retention for name, _, retention in self.resolutions}.get(resolution)
+        if retention is None:
+            return 0
+        restored = 0
+        with self.lock:
+            series = self.series.get((path, resolution))
+            if series is None:
+                series = self.series[(path, resolution)] = deque(maxlen=retention)
+            for bucket in buckets:
+                if series and bucket[_START] <= series[-1][_START]:
+                    continue
+                series.append(list(bucket))
+                restored += 1
+            if restored:
+                if archived:
+                    self.archived_last.add((path, resolution))
+                else:
+                    self.archived_last.discard((path, resolution))
+        return restored
+
+    def query(self, path, resolution, start=None, end=None):
+        """查询一个测点在指定粒度上的统计
+
+        Args:
+            path: 测点路径
+            resolution: 粒度名称
+            start: 开始时间（秒），包含
+            end: 结束时间（秒），不包含
+
+        Returns:
+            list: [{"start", "count", "min", "max", "avg", "last"}, ...]，按时间排序
+        """
+        with self.lock:
+            # 桶按开始时间排序，二分查找范围后只复制范围内的桶，分块导出时每次查询的开销与块大小相关
+            series = self.series.get((path, resolution), ())
+            starts = _Starts(series)
+            first = 0 if start is None else bisect.bisect_left(starts, start)
+            last = len(series) if end is None else bisect.bisect_left(starts, end)
+            buckets = [list(series[index]) for index in range(first, last)]
+        return [
+            {
+                "start": bucket[_START],
+                "count": bucket[_COUNT],
+                "min": bucket[_MIN],
+                "max": bucket[_MAX],
+                "avg": round(bucket[_SUM] / bucket[_COUNT], 4),
+                "last": bucket[_LAST],
+            }
+            for bucket in buckets
+        ]
+
+    def span(self, path, resolution):
+        """测点在指定粒度上最早和最晚的桶开始时间
+
+        Returns:
+            tuple: (最早, 最晚)，没有数据时返回None
+        """
+        with self.lock:
+            buckets = self.series.get((path, resolution))
+            return (buckets[0][_START], buckets[-1][_START]) if buckets else None
+
+    def paths(self):
+        """已有统计数据的测点路径"""
+        with self.lock:
+            return sorted({path for path, _ in self.series})
+
+    def stats(self):
+        with self.lock:
+            return {
+                "resolutions": {name: seconds for name, seconds, _ in self.resolutions},
+                "series": len(self.series),
+                "samples": self.samples,
+                "out_of_order": self.out_of_order,
+            }
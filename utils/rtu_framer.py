@@ -0,0 +1,140 @@
+"""
+Modbus RTU 响应帧重组
+
+串口上读到的字节不一定正好是本次请求的响应：上一次事务超时后才到达的字节、线路干扰产生的噪声
+都可能出现在响应前后。RtuFramer 按本次请求确定期望的从站地址、功能码和数据长度，在字节流中查找
+地址、功能码、长度和CRC都正确的帧，不符合的字节丢弃并计数，只把校验通过的帧交给下游。
+"""
+
+import os
+import sys
+
+# 添加上级目录到路径
+sys.path.append(os.path.dirname(os.path.dirname(__file__)))
+from utils.modbus import check_crc, expected_response_length
+
+
+def expected_data_length(request):
+    """读请求对应的响应数据字节数
+
+    Returns:
+        int: 功能码1/2为 ceil(数量/8)，3/4为 数量*2，其他请求返回None
+    """
+    if len(request) < 6:
+        return None
+    quantity = int.from_bytes(request[4:6], byteorder='big')
+    if request[1] in (1, 2):
+        return (quantity + 7) // 8
+    if request[1] in (3, 4):
+        return quantity * 2
+    return None
+
+
+class RtuFramer:
+    """单个串口的响应帧重组器
+
+    每次事务开始时调用 expect 设置期望的响应，读到的字节逐次交给 feed，得到校验通过的帧时返回该帧。
+    帧的开始位置必须是期望的从站地址，后面跟着请求的功能码或对应的异常码，读响应的字节数必须与请求的数量一致；
+    长度足够后校验CRC，失败则从下一个字节重新查找。功能码未知、无法计算长度的帧在线路静默后由 flush 按CRC判断。
+    """
+
+    def __init__(self):
+        self.buffer = bytearray()
+        self.slave = None
+        self.function_code = None
+        self.data_length = None
+        # 本次事务中是否有地址、功能码、长度都符合但CRC错误的帧
+        self.corrupted = False
+
+        # 统计
+        self.frames = 0
+        self.garbage_bytes = 0
+        self.crc_errors = 0
+
+    def expect(self, request):
+        """开始新的事务，残留的字节计为丢弃
+
+        Args:
+            request: 本次发送的请求帧
+        """
+        self._discard(len(self.buffer))
+        self.slave = request[0]
+        self.function_code = request[1]
+        self.data_length = expected_data_length(request)
+        self.corrupted = False
+
+    def _discard(self, count):
+        if count > 0:
+            self.garbage_bytes += count
+            del self.buffer[:count]
+
+    def _find_start(self):
+        """丢弃不可能是帧开始的字节，缓冲区开头是候选帧或者为空"""
+        position = 0
+        while True:
+            position = self.buffer.find(self.slave, position)
+            if position < 0:
+                self._discard(len(self.buffer))
+                return
+            if position + 1 >= len(self.buffer) or self.buffer[position + 1] & 0x7F == self.function_code:
+                self._discard(position)
+                return
+            position += 1
+
+    def feed(self, data):
+        """加入读到的字节
+
+        Returns:
+            bytes: 校验通过的响应帧，还没有完整的帧时返回None
+        """
+        self.buffer += data
+        while True:
+            self._find_start()
+            length = expected_response_length(self.buffer)
+            if length is None:
+                return None
+            if (self.data_length is not None and not self.buffer[1] & 0x80
+                    and self.buffer[2] != self.data_length):
+                # 字节数与请求的数量不符，不是本次的响应
+                self._discard(1)
+                continue
+            if len(self.buffer) < length:
+                return None
+            frame = bytes(self.buffer[:length])
+            if check_crc(frame):
+                self.frames += 1
+                del self.buffer[:length]
+                self._discard(len(self.buffer))
+                return frame
+            self.crc_errors += 1
+            self.corrupted = True
+            self._discard(1)
+
+    def flush(self):
+        """线路静默后调用：功能码未知、无法按长度判断的帧，缓冲区整体CRC正确时作为完整的响应
+
+        Returns:
+            bytes: 校验通过的响应帧，否则返回None
+        """
+        if self.slave is None:
+            return None
+        self._find_start()
+        if len(self.buffer) < 4 or expected_response_length(self.buffer) is not None:
+            return None
+        frame = bytes(self.buffer)
+        if not check_crc(frame):
+            return None
+        self.frames += 1
+        self.buffer.clear()
+        return frame
+
+    def finish(self):
+        """事务结束，丢弃没有组成完整帧的字节"""
+        self._discard(len(self.buffer))
+
+    def stats(self):
+        return {
+            "frames": self.frames,
+            "garbage_bytes": self.garbage_bytes,
+            "crc_errors": self.crc_errors,
+        }
@@ -0,0 +1,296 @@
+"""
+后端与串口服务器同机部署时的共享内存传输
+
+后端建立TCP连接后创建两个共享内存环形缓冲区（后端->服务器、服务器->后端），通过 MSG_TRANSPORT 帧
+把名称告诉服务器，服务器连接成功后双方改为在环形缓冲区中收发，帧格式与TCP完全相同（见 utils/protocol.py）。
+原TCP连接保留为门铃和存活检测：接收方没有数据可读时设置等待标志并阻塞在socket上，
+发送方写入数据后在对方等待、或者写入前缓冲区为空（对方可能正要进入等待）时写一个字节唤醒，
+缓冲区中已有未读数据时连续发送不经过系统调用。
+等待标志和写位置的读写之间没有内存屏障，两边可能同时看到旧值，所以接收方的等待总是带超时（poll_interval），
+门铃丢失时延迟也不会超过 poll_interval。
+TCP连接断开即表示对方退出，共享内存由创建方（后端）释放。
+
+ShmChannel 提供与socket相同的 sendall/recv/close 接口，收发线程不需要区分传输方式。
+使用socket而不是eventfd或命名管道作为门铃，Windows下同样可用。
+"""
+
+import os
+import sys
+import json
+import itertools
+import select
+import socket
+import struct
+import threading
+import time
+from multiprocessing import shared_memory
+
+# 添加上级目录到路径
+sys.path.append(os.path.dirname(os.path.dirname(__file__)))
+from utils.Logger import logger
+from utils.protocol import MSG_JSON, MSG_TRANSPORT, FrameReader, encode_json
+
+# 共享内存头部: 读位置(8) + 写位置(8) + 接收方等待标志(4) + 保留(4) + 容量(8)，位置只增不减
+_HEAD = 0
+_TAIL = 8
+_WAITING = 16
+_CAPACITY = 24
+_HEADER_SIZE = 64
+_U64 = struct.Struct('<Q')
+_U32 = struct.Struct('<I')
+
+# 只有本机地址才尝试共享内存
+LOCAL_HOSTS = ('127.0.0.1', 'localhost', '::1')
+
+_names = itertools.count(1)
+
+# 接收方阻塞前空转检查的默认次数，单核时空转只会占住对方需要的CPU
+DEFAULT_SPIN = 0 if (os.cpu_count() or 1) == 1 else 100
+
+
+class ShmRing:
+    """单生产者单消费者的共享内存环形字节缓冲区"""
+
+    def __init__(self, name=None, size=1 << 20, create=False):
+        """
+        Args:
+            name: 共享内存名称，创建时为None则自动生成
+            size: 数据区大小（字节），只在创建时使用
+            create: 是否创建，否则连接已有的共享内存
+        """
+        try:
+            self.shm = shared_memory.SharedMemory(name=name, create=create, size=_HEADER_SIZE + size if create else 0)
+        except FileExistsError:
+            # 上次异常退出残留的同名共享内存（进程号重复使用），删除后重新创建
+            shared_memory.SharedMemory(name=name).unlink()
+            self.shm = shared_memory.SharedMemory(name=name, create=True, size=_HEADER_SIZE + size)
+        self.created = create
+        if not create:
+            self._untrack()
+        self.buf = self.shm.buf
+        if create:
+            self.buf[:_HEADER_SIZE] = bytes(_HEADER_SIZE)
+            _U64.pack_into(self.buf, _CAPACITY, size)
+        self.capacity = _U64.unpack_from(self.buf, _CAPACITY)[0]
+        self.data = self.buf[_HEADER_SIZE:_HEADER_SIZE + self.capacity]
+
+    @property
+    def name(self):
+        return self.shm.name
+
+    def _untrack(self):
+        """连接方不登记共享内存，避免进程退出时删除创建方仍在使用的共享内存（Python 3.13 以前的行为）"""
+        try:
+            from multiprocessing import resource_tracker
+            resource_tracker.unregister(self.shm._name, 'shared_memory')
+        except Exception:
+            pass
+
+    def write(self, data):
+        """写入尽可能多的字节
+
+        Returns:
+            int: 写入的字节数，缓冲区满时为0
+        """
+        head = _U64.unpack_from(self.buf, _HEAD)[0]
+        tail = _U64.unpack_from(self.buf, _TAIL)[0]
+        count = min(len(data), self.capacity - (tail - head))
+        if count <= 0:
+            return 0
+        index = tail % self.capacity
+        first = min(count, self.capacity - index)
+        self.data[index:index + first] = data[:first]
+        if count > first:
+            self.data[:count - first] = data[first:count]
+        # 数据写完后才更新写位置
+        _U64.pack_into(self.buf, _TAIL, tail + count)
+        return count
+
+    def read(self, limit):
+        """读取最多 limit 个字节，没有数据时返回空bytes"""
+        head = _U64.unpack_from(self.buf, _HEAD)[0]
+        tail = _U64.unpack_from(self.buf, _TAIL)[0]
+        count = min(tail - head, limit)
+        if count <= 0:
+            return b''
+        index = head % self.capacity
+        first = min(count, self.capacity - index)
+        data = bytes(self.data[index:index + first])
+        if count > first:
+            data += bytes(self.data[:count - first])
+        _U64.pack_into(self.buf, _HEAD, head + count)
+        return data
+
+    def available(self):
+        return _U64.unpack_from(self.buf, _TAIL)[0] - _U64.unpack_from(self.buf, _HEAD)[0]
+
+    @property
+    def waiting(self):
+        return _U32.unpack_from(self.buf, _WAITING)[0] != 0
+
+    @waiting.setter
+    def waiting(self, value):
+        _U32.pack_into(self.buf, _WAITING, 1 if value else 0)
+
+    def close(self):
+        """释放映射，创建方同时删除共享内存"""
+        self.data.release()
+        self.buf = self.data = None
+        self.shm.close()
+        if self.created:
+            try:
+                self.shm.unlink()
+            except FileNotFoundError:
+                pass
+
+
+class ShmChannel:
+    """基于一对共享内存环形缓冲区的连接，接口与socket一致"""
+
+    def __init__(self, sock, tx, rx, spin=None, poll_interval=0.005):
+        """
+        Args:
+            sock: 原TCP连接，用作门铃和存活检测
+            tx: 发送方向的环形缓冲区
+            rx: 接收方向的环形缓冲区
+            spin: 阻塞前空转检查的次数，连续收发时避免进入系统调用，None使用 DEFAULT_SPIN
+            poll_interval: 等待门铃的超时（秒），门铃丢失时最多延迟这么久，是唤醒延迟的上限
+        """
+        # 门铃只有一个字节，关闭Nagle算法，避免等待上一个门铃的ACK
+        sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        self.sock = sock
+        self.tx = tx
+        self.rx = rx
+        self.spin = DEFAULT_SPIN if spin is None else spin
+        self.poll_interval = poll_interval
+        self.closed = False
+        self.lock = threading.Lock()
+        self.doorbells = 0
+
+    def sendall(self, data):
+        """写入发送缓冲区，缓冲区满时等待对方读取"""
+        view = memoryview(data)
+        while view:
+            if self.closed:
+                raise OSError("共享内存连接已关闭")
+            # 写入前缓冲区为空时对方可能已经读完、正要设置等待标志，不依赖看到标志，直接敲门铃
+            empty = self.tx.available() == 0
+            count = self.tx.write(view)
+            view = view[count:]
+            if count and (empty or self.tx.waiting):
+                self._ring()
+            if view:
+                time.sleep(0.0005)
+
+    def _ring(self):
+        """唤醒等待中的接收方"""
+        self.doorbells += 1
+        self.sock.send(b'\x01')
+
+    def recv(self, size):
+        """读取最多 size 个字节，对方断开时返回空bytes"""
+        while not self.closed:
+            for _ in range(self.spin):
+                data = self.rx.read(size)
+                if data:
+                    return data
+            # 先设置等待标志再检查一次，避免对方在设置标志前写入而不敲门铃
+            self.rx.waiting = True
+            try:
+                data = self.rx.read(size)
+                if data:
+                    return data
+                readable, _, _ = select.select([self.sock], [], [], self.poll_interval)
+                if readable and not self.sock.recv(4096):
+                    return b''
+            finally:
+                self.rx.waiting = False
+        return b''
+
+    def close(self):
+        with self.lock:
+            if self.closed:
+                return
+            self.closed = True
+        try:
+            self.sock.close()
+        finally:
+            # 另一个线程可能还在读写，稍后释放映射
+            timer = threading.Timer(1.0, self._release)
+            timer.daemon = True
+            timer.start()
+
+    def _release(self):
+        for ring in (self.tx, self.rx):
+            try:
+                ring.close()
+            except Exception as e:
+                logger.error(f"释放共享内存失败: {e}")
+
+
+def open_client_channel(sock, config, timeout=5.0):
+    """后端: 创建共享内存并请求服务器改用共享内存传输
+
+    Args:
+        sock: 已连接的TCP socket
+        config: 传输配置 {"ring_size": 字节数, "spin": 空转次数, "poll_interval": 秒}
+        timeout: 等待服务器确认的时间（秒）
+
+    Returns:
+        ShmChannel，服务器不支持或不在本机时返回None，继续使用TCP
+    """
+    size = int(config.get('ring_size', 1 << 20))
+    prefix = f"wust_{os.getpid()}_{next(_names)}"
+    tx = ShmRing(f"{prefix}_tx", size, create=True)
+    rx = ShmRing(f"{prefix}_rx", size, create=True)
+    try:
+        # 服务器的发送方向是后端的接收方向
+        sock.sendall(encode_json({"type": "shm", "tx": rx.name, "rx": tx.name}, MSG_TRANSPORT))
+        reply = _read_json(sock, timeout)
+    except Exception as e:
+        reply = {"status": "error", "message": str(e)}
+    if reply.get("status") != "transport_ready":
+        logger.warning(f"服务器未启用共享内存传输，使用TCP: {reply.get('message', reply)}")
+        tx.close()
+        rx.close()
+        return None
+    return ShmChannel(sock, tx, rx, config.get('spin'), config.get('poll_interval', 0.005))
+
+
+def _read_json(sock, timeout):
+    """同步读取一个JSON控制帧，用于收发线程启动前的协商"""
+    reader = FrameReader()
+    sock.settimeout(timeout)
+    try:
+        while True:
+            data = sock.recv(4096)
+            if not data:
+                raise ConnectionError("连接已断开")
+            for msg_type, payload in reader.feed(data):
+                if msg_type == MSG_JSON:
+                    return json.loads(bytes(payload).decode('utf-8'))
+    finally:
+        sock.settimeout(None)
+
+
+def accept_server_channel(sock, request, config=None):
+    """服务器: 连接后端创建的共享内存
+
+    Args:
+        sock: 客户端TCP socket
+        request: MSG_TRANSPORT 帧的内容
+        config: 传输配置，见 open_client_channel
+
+    Returns:
+        tuple: (ShmChannel或None, 回复给后端的JSON)
+    """
+    config = config or {}
+    if request.get("type") != "shm":
+        return None, {"status": "error", "message": f"不支持的传输方式: {request.get('type')}"}
+    try:
+        tx = ShmRing(request["tx"])
+        rx = ShmRing(request["rx"])
+    except Exception as e:
+        return None, {"status": "error", "message": f"连接共享内存失败: {e}"}
+    channel = ShmChannel(sock, tx, rx, config.get('spin'), config.get('poll_interval', 0.005))
+    return channel, {"status": "transport_ready", "type": "shm"}
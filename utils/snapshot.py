@@ -0,0 +1,222 @@
+"""
+数据快照，定期把所有测点的当前值和更新时间写入二进制文件，重启后先加载快照，
+API 立即返回上次的值（标记为 stale），直到收到新的数据。
+
+文件格式: 帧头(4字节 b'WSNP') + 版本(1) + 保存时间(8) + 测点数(4)
+          + 每个测点: 路径长度(2) + 路径(UTF-8, 以 / 分隔) + 值类型(1) + 值 + 更新时间(8)
+"""
+
+import os
+import sys
+import struct
+import threading
+import time
+
+# 添加上级目录到路径
+sys.path.append(os.path.dirname(os.path.dirname(__file__)))
+from utils.Logger import logger
+
+SNAPSHOT_MAGIC = b'WSNP'
+SNAPSHOT_VERSION = 1
+
+# 值类型
+VALUE_NONE = 0
+VALUE_BOOL = 1
+VALUE_INT = 2
+VALUE_FLOAT = 3
+VALUE_STR = 4
+
+_HEADER = struct.Struct('>4sBdI')
+_LENGTH16 = struct.Struct('>H')
+_TYPE = struct.Struct('>B')
+_TIME = struct.Struct('>d')
+_BOOL = struct.Struct('>?')
+_INT = struct.Struct('>q')
+_FLOAT = struct.Struct('>d')
+
+
+def _encode_value(value):
+    """编码测点值，返回 值类型 + 值 的字节"""
+    if value is None:
+        return _TYPE.pack(VALUE_NONE)
+    if isinstance(value, bool):
+        return _TYPE.pack(VALUE_BOOL) + _BOOL.pack(value)
+    if isinstance(value, int) and -2 ** 63 <= value < 2 ** 63:
+        return _TYPE.pack(VALUE_INT) + _INT.pack(value)
+    if isinstance(value, float):
+        return _TYPE.pack(VALUE_FLOAT) + _FLOAT.pack(value)
+    text = str(value).encode('utf-8')
+    return _TYPE.pack(VALUE_STR) + _LENGTH16.pack(len(text)) + text
+
+
+def _decode_value(view, offset):
+    """解码测点值，返回 (值, 新的偏移)"""
+    value_type, = _TYPE.unpack_from(view, offset)
+    offset += _TYPE.size
+    if value_type == VALUE_NONE:
+        return None, offset
+    if value_type == VALUE_BOOL:
+        return _BOOL.unpack_from(view, offset)[0], offset + _BOOL.size
+    if value_type == VALUE_INT:
+        return _INT.unpack_from(view, offset)[0], offset + _INT.size
+    if value_type == VALUE_FLOAT:
+        return _FLOAT.unpack_from(view, offset)[0], offset + _FLOAT.size
+    if value_type == VALUE_STR:
+        length, = _LENGTH16.unpack_from(view, offset)
+        offset += _LENGTH16.size
+        return bytes(view[offset:offset + length]).decode('utf-8'), offset + length
+    raise ValueError(f"未知的值类型: {value_type}")
+
+
+def encode_snapshot(records, saved_time=None):
+    """编码快照
+
+    Args:
+        records: [(路径, 值, 更新时间), ...]
+        saved_time: 保存时间，默认为当前时间
+
+    Returns:
+        bytes: 快照文件内容
+    """
+    parts = [_HEADER.pack(SNAPSHOT_MAGIC, SNAPSHOT_VERSION, saved_time or time.time(), len(records))]
+    for path, value, timestamp in records:
+        key = path.encode('utf-8')
+        parts.append(_LENGTH16.pack(len(key)))
+        parts.append(key)
+        parts.append(_encode_value(value))
+        parts.append(_TIME.pack(timestamp))
+    return b''.join(parts)
+
+
+def decode_snapshot(data):
+    """解码快照
+
+    Returns:
+        tuple: (保存时间, [(路径, 值, 更新时间), ...])
+    """
+    view = memoryview(data)
+    magic, version, saved_time, count = _HEADER.unpack_from(view, 0)
+    if magic != SNAPSHOT_MAGIC or version != SNAPSHOT_VERSION:
+        raise ValueError("快照文件格式不匹配")
+    offset = _HEADER.size
+    records = []
+    for _ in range(count):
+        length, = _LENGTH16.unpack_from(view, offset)
+        offset += _LENGTH16.size
+        path = bytes(view[offset:offset + length]).decode('utf-8')
+        offset += length
+        value, offset = _decode_value(view, offset)
+        timestamp, = _TIME.unpack_from(view, offset)
+        offset += _TIME.size
+        records.append((path, value, timestamp))
+    return saved_time, records
+
+
+class SnapshotStore:
+    """数据快照类，后台线程定期保存数据处理器的当前状态，解析线程不受影响"""
+
+    def __init__(self, data_processor, path, interval=10.0):
+        """
+        Args:
+            data_processor: 数据处理器
+            path: 快照文件路径
+            interval: 保存间隔（秒）
+        """
+        self.data_processor = data_processor
+        self.path = path
+        self.interval = interval
+        self.running = False
+        self.thread = None
+        # 上次保存时数据处理器的版本号，数据没有变化时不重复保存
+        self.saved_version = None
+
+        # 计数
+        self.save_count = 0
+        self.last_save_time = None
+        self.last_save_ms = 0.0
+        self.last_size = 0
+        self.loaded_points = 0
+
+    def load(self):
+        """加载快照，恢复的测点标记为 stale
+
+        Returns:
+            int: 恢复的测点数
+        """
+        if not os.path.exists(self.path):
+            return 0
+        try:
+            with open(self.path, 'rb') as file:
+                saved_time, records = decode_snapshot(file.read())
+        except Exception as e:
+            logger.error(f"加载数据快照 {self.path} 失败: {e}")
+            return 0
+        self.loaded_points = self.data_processor.restore(records)
+        logger.info(
+            f"已加载数据快照 {self.path}，恢复 {self.loaded_points} 个测点，"
+            f"快照时间 {time.strftime('%Y-%m-%d %H:%M:%S', time.localtime(saved_time))}"
+        )
+        return self.loaded_points
+
+    def save(self):
+        """保存一次快照，先写临时文件再替换，避免写到一半时断电损坏快照
+
+        Returns:
+            bool: 是否写入了文件
+        """
+        version, records = self.data_processor.export()
+        if version == self.saved_version:
+            return False
+        start = time.perf_counter()
+        data = encode_snapshot(records)
+        directory = os.path.dirname(self.path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        temp_path = self.path + '.tmp'
+        with open(temp_path, 'wb') as file:
+            file.write(data)
+        os.replace(temp_path, self.path)
+
+        self.saved_version = version
+        self.save_count += 1
+        self.last_save_time = time.time()
+        self.last_save_ms = round((time.perf_counter() - start) * 1000, 3)
+        self.last_size = len(data)
+        return True
+
+    def start(self):
+        """启动定期保存线程"""
+        if self.thread and self.thread.is_alive():
+            return
+        self.running = True
+        self.thread = threading.Thread(target=self._save_thread_func)
+        self.thread.daemon = True
+        self.thread.start()
+
+    def stop(self):
+        """停止保存线程并保存最后一次快照"""
+        self.running = False
+        try:
+            self.save()
+        except Exception as e:
+            logger.error(f"保存数据快照失败: {e}")
+
+    def _save_thread_func(self):
+        """保存线程函数"""
+        while self.running:
+            time.sleep(self.interval)
+            try:
+                self.save()
+            except Exception as e:
+                logger.error(f"保存数据快照失败: {e}")
+
+    def stats(self):
+        """获取快照统计"""
+        return {
+            "path": self.path,
+            "save_count": self.save_count,
+            "last_save_time": self.last_save_time,
+            "last_save_ms": self.last_save_ms,
+            "last_size": self.last_size,
+            "loaded_points": self.loaded_points,
+        }
@@ -0,0 +1,164 @@
+import os
+import sys
+
+# 添加上级目录到路径
+sys.path.append(os.path.dirname(os.path.dirname(__file__)))
+import yaml
+from utils.Logger import logger
+
+# 默认拓扑配置文件（项目根目录下的 config/topology.yaml）
+DEFAULT_TOPOLOGY_PATH = os.path.join(
+    os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'config', 'topology.yaml'
+)
+
+
+def normalize_port(port_name):
+    """统一串口名写法，'COM 45' 和 'com45' 都视为 'COM45'"""
+    return str(port_name).replace(' ', '').upper()
+
+
+class Device:
+    """拓扑中的单个设备
+
+    location、name 描述设备在数据树中的位置，ports、slave 描述设备挂在哪些串口的哪个从站上。
+    node、refs、view_data 在 DeviceTopology.bind 时填充为数据树中对象的引用，
+    解析时直接通过引用写值，不再按 key 查找。
+    """
+
+    def __init__(self, device_type, location, name, ports, slave, channels=None, point=None, view=None):
+        self.type = device_type
+        self.location = list(location)
+        self.name = name
+        self.ports = ports
+        self.slave = slave
+        self.channels = channels or []
+        self.point = point
+        self.view = view
+
+        # 绑定到数据树后填充
+        self.node = None
+        self.refs = {}
+        self.view_data = None
+
+    @property
+    def path(self):
+        """设备节点在数据树中的路径，没有自身节点的设备返回所在分组路径"""
+        if self.name is None:
+            return self.location
+        return self.location + [self.name]
+
+
+class DeviceTopology:
+    """设备拓扑，负责加载拓扑配置并预先计算 (串口, 从站ID) -> 设备 的查找表"""
+
+    def __init__(self, config):
+        """初始化设备拓扑
+
+        Args:
+            config: 拓扑配置字典，格式见 config/topology.yaml
+        """
+        self.devices = []
+        # (串口, 从站ID) -> Device
+        self.bindings = {}
+        # 从站ID -> Device，只在 slave_fallback 开启时用于串口名不匹配的兜底查找
+        self.by_slave = {}
+        # 只有一个串口的旧配置可以开启，多个串口复用从站ID时会把数据写到别的设备上
+        self.slave_fallback = bool(config.get('slave_fallback', False))
+
+        for group in config.get('groups', []):
+            location = group.get('location', [])
+            group_view = group.get('view', 'device')
+            for item in group.get('devices', []):
+                self._add_device(item, location, group_view)
+
+    @staticmethod
+    def load(path=None):
+        """从YAML文件加载设备拓扑"""
+        path = path or DEFAULT_TOPOLOGY_PATH
+        with open(path, 'r', encoding='utf-8') as file:
+            config = yaml.safe_load(file) or {}
+        topology = DeviceTopology(config)
+        logger.info(f"成功加载设备拓扑 {path}，包含 {len(topology.devices)} 个设备")
+        return topology
+
+    def _add_device(self, item, location, group_view):
+        """解析单个设备配置并登记到查找表"""
+        ports = item.get('port', [])
+        if not isinstance(ports, list):
+            ports = [ports]
+        ports = [normalize_port(port) for port in ports]
+        slave = int(item['slave'])
+
+        device = Device(
+            device_type=item['type'],
+            location=location,
+            name=item.get('name'),
+            ports=ports,
+            slave=slave,
+            channels=item.get('channels'),
+            point=item.get('point'),
+            view=item.get('view', group_view)
+        )
+        self.devices.append(device)
+
+        for port in ports:
+            key = (port, slave)
+            if key in self.bindings:
+                logger.warning(f"拓扑配置重复: {port} 从站 {slave}，使用后定义的设备")
+            self.bindings[key] = device
+        self.by_slave.setdefault(slave, device)
+
+    def lookup(self, port_name, slave):
+        """根据串口名和从站ID查找设备，找不到返回None"""
+        device = self.bindings.get((normalize_port(port_name), slave))
+        if device is None and self.slave_fallback:
+            device = self.by_slave.get(slave)
+        return device
+
+    def build(self, templates):
+        """按拓扑创建数据树
+
+        Args:
+            templates: 设备类型 -> 创建该类型数据结构的函数
+        """
+        data = {}
+        for device in self.devices:
+            group = data
+            for key in device.location:
+                group = group.setdefault(key, {})
+            if device.name is not None:
+                group[device.name] = templates[device.type]()
+        self.bind(data)
+        return data
+
+    def bind(self, data):
+        """将设备与数据树中的节点绑定，预先保存各测点的引用"""
+        for device in self.devices:
+            group = self._resolve(data, device.location)
+            if device.name is not None:
+                device.node = group[device.name]
+                device.refs = dict(device.node)
+            else:
+                device.node = group
+                # 多通道设备（如压差变送器），每个通道对应一个房间的同名测点
+                device.refs = {}
+                for channel in device.channels:
+                    if channel in group:
+                        device.refs[channel] = group[channel][device.point]
+                    else:
+                        logger.warning(f"拓扑配置错误: {'/'.join(device.location)} 下不存在 {channel}")
+
+            if device.view == 'group':
+                device.view_data = group
+            elif device.view == 'device' or device.view is None:
+                device.view_data = device.node
+            else:
+                device.view_data = self._resolve(data, device.view)
+
+    @staticmethod
+    def _resolve(data, path):
+        """按路径在数据树中查找节点"""
+        node = data
+        for key in path:
+            node = node[key]
+        return node
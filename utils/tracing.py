@@ -0,0 +1,220 @@
+"""
+请求链路追踪，按需开启（环境变量 WUST_TRACE 或配置文件 tracing.enabled）
+
+记录一次请求在后端和串口服务器各阶段的耗时（编码、发送队列等待、socket发送、服务器接收、
+串口队列等待、串口写、等待响应、串口读、响应回传、解析），每个阶段一个span，
+通过关联ID（请求序号）串起来。span以 Chrome Trace 格式（JSON数组）写入文件，
+可直接在 chrome://tracing 或 Perfetto 中打开，文件超过大小上限后轮转。
+
+未开启时所有接口都是空操作，热路径上只多一次属性判断。
+"""
+
+import os
+import sys
+import json
+import threading
+import time
+from collections import OrderedDict
+
+# 添加上级目录到路径
+sys.path.append(os.path.dirname(os.path.dirname(__file__)))
+from utils.Logger import logger
+
+# 环境变量，设置为 1 开启追踪，设置为文件路径时同时指定追踪文件
+TRACE_ENV = 'WUST_TRACE'
+
+
+class _NullSpan:
+    """未开启追踪时使用的空span"""
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        return False
+
+
+_NULL_SPAN = _NullSpan()
+
+
+class _Span:
+    """with语句块的span，退出时记录耗时"""
+
+    def __init__(self, tracer, name, cid, args):
+        self.tracer = tracer
+        self.name = name
+        self.cid = cid
+        self.args = args
+        self.start = None
+
+    def __enter__(self):
+        self.start = time.time()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        if exc_type is not None:
+            self.args["error"] = str(exc)
+        self.tracer.add(self.name, self.start, time.time(), self.cid, **self.args)
+        return False
+
+
+class Tracer:
+    """链路追踪类，span先缓存在内存中，由后台线程批量写入文件，不阻塞调用方"""
+
+    def __init__(self):
+        self.enabled = False
+        self.path = None
+        self.max_bytes = 50 * 1024 * 1024
+        self.backup_count = 3
+        self.process_name = None
+        self.pid = os.getpid()
+
+        self.lock = threading.Lock()
+        self.buffer = []
+        # 跨线程的span起点 {key: 开始时间}，如请求入队时间
+        self.marks = OrderedDict()
+        self.mark_limit = 10000
+        self.file = None
+        self.size = 0
+        self.thread = None
+        self.event_count = 0
+
+    def configure(self, config, default_file, process_name):
+        """根据环境变量和配置开启追踪
+
+        Args:
+            config: 配置中的 tracing 部分
+            default_file: 未指定文件时使用的追踪文件
+            process_name: 在追踪视图中显示的进程名
+
+        Returns:
+            bool: 是否开启
+        """
+        if self.enabled:
+            return True
+        config = config or {}
+        env = os.environ.get(TRACE_ENV, '').strip()
+        enabled = config.get('enabled', False) or env not in ('', '0', 'false')
+        if not enabled:
+            return False
+        path = config.get('file', default_file)
+        if env not in ('', '0', '1', 'true', 'false'):
+            path = env
+        self.path = path
+        self.max_bytes = config.get('max_bytes', self.max_bytes)
+        self.backup_count = config.get('backup_count', self.backup_count)
+        self.process_name = process_name
+        self._open()
+        self.enabled = True
+        self.thread = threading.Thread(target=self._flush_thread_func, args=(config.get('flush_interval', 1.0),))
+        self.thread.daemon = True
+        self.thread.start()
+        logger.info(f"链路追踪已开启，写入 {self.path}")
+        return True
+
+    def span(self, name, cid=None, **args):
+        """with语句块的span"""
+        if not self.enabled:
+            return _NULL_SPAN
+        return _Span(self, name, cid, args)
+
+    def add(self, name, start, end, cid=None, **args):
+        """记录一个已知起止时间（time.time()）的span"""
+        if not self.enabled:
+            return
+        if cid is not None:
+            args["cid"] = cid
+        event = {
+            "name": name,
+            "ph": "X",
+            "ts": int(start * 1000000),
+            "dur": max(0, int((end - start) * 1000000)),
+            "pid": self.pid,
+            "tid": threading.get_ident(),
+            "args": args,
+        }
+        with self.lock:
+            self.buffer.append(event)
+
+    def mark(self, key):
+        """记录跨线程span的起点，由 add_since 在另一个线程结束"""
+        if not self.enabled:
+            return
+        with self.lock:
+            self.marks[key] = time.time()
+            while len(self.marks) > self.mark_limit:
+                self.marks.popitem(last=False)
+
+    def add_since(self, name, key, cid=None, **args):
+        """以 mark 记录的时间为起点，到当前时间为止记录一个span"""
+        if not self.enabled:
+            return
+        with self.lock:
+            start = self.marks.pop(key, None)
+        if start is not None:
+            self.add(name, start, time.time(), cid, **args)
+
+    def _open(self):
+        """打开新的追踪文件，JSON数组格式允许没有结尾的 ]，进程异常退出时文件仍然可用"""
+        directory = os.path.dirname(self.path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self.file = open(self.path, 'w', encoding='utf-8')
+        header = json.dumps({
+            "name": "process_name", "ph": "M", "pid": self.pid,
+            "args": {"name": self.process_name or str(self.pid)},
+        })
+        self.file.write("[\n" + header)
+        self.file.flush()
+        self.size = len(header) + 2
+
+    def _rotate(self):
+        """文件超过大小上限后轮转: trace.json -> trace.json.1 -> trace.json.2 ..."""
+        self.file.write("\n]\n")
+        self.file.close()
+        for index in range(self.backup_count - 1, 0, -1):
+            source = f"{self.path}.{index}"
+            if os.path.exists(source):
+                os.replace(source, f"{self.path}.{index + 1}")
+        if self.backup_count > 0:
+            os.replace(self.path, f"{self.path}.1")
+        self._open()
+
+    def flush(self):
+        """把缓存的span写入文件"""
+        with self.lock:
+            events, self.buffer = self.buffer, []
+        if not events or self.file is None:
+            return 0
+        data = "".join(",\n" + json.dumps(event, ensure_ascii=False) for event in events)
+        self.file.write(data)
+        self.file.flush()
+        self.size += len(data.encode('utf-8'))
+        self.event_count += len(events)
+        if self.size >= self.max_bytes:
+            self._rotate()
+        return len(events)
+
+    def _flush_thread_func(self, interval):
+        """写文件线程函数"""
+        while self.enabled:
+            time.sleep(interval)
+            try:
+                self.flush()
+            except Exception as e:
+                logger.error(f"写入追踪文件失败: {e}")
+
+    def stats(self):
+        """追踪统计"""
+        with self.lock:
+            buffered = len(self.buffer)
+        return {
+            "enabled": self.enabled,
+            "file": self.path,
+            "events": self.event_count,
+            "buffered": buffered,
+        }
+
+
+# 进程内共用的追踪器，由各程序入口按配置开启
+tracer = Tracer()
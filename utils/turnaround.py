@@ -0,0 +1,198 @@
+import os
+import sys
+import json
+import threading
+import time
+
+# 添加上级目录到路径
+sys.path.append(os.path.dirname(os.path.dirname(__file__)))
+from utils.Logger import logger
+
+
+class TurnaroundTable:
+    """从站响应时间学习类
+
+    按 (串口, 从站ID) 在线统计从发出请求到收到完整响应的时间，使用与TCP重传超时相同的
+    平滑均值 + 平均偏差估计，据此得到每个从站的读超时和请求间隔：
+        超时 = margin * (平滑均值 + 4 * 平均偏差)
+        间隔 = gap_ratio * 平滑均值
+    均限制在配置的上下限内。样本不足时使用默认值，学习结果定期保存，重启后继续使用。
+    """
+
+    # 平滑系数，与TCP一致
+    ALPHA = 0.125
+    BETA = 0.25
+
+    def __init__(self, path=None, margin=1.5, min_timeout=0.05, max_timeout=1.0, default_timeout=0.2,
+                 gap_ratio=0.5, min_gap=0.005, max_gap=0.5, default_gap=0.05, min_samples=5):
+        """
+        Args:
+            path: 学习结果保存路径，None表示不保存
+            margin: 超时的安全系数
+            min_timeout/max_timeout: 超时上下限（秒）
+            default_timeout: 样本不足时的超时（秒）
+            gap_ratio: 请求间隔与平均响应时间的比例
+            min_gap/max_gap: 请求间隔上下限（秒）
+            default_gap: 样本不足时的请求间隔（秒）
+            min_samples: 开始使用学习结果所需的样本数
+        """
+        self.path = path
+        self.margin = margin
+        self.min_timeout = min_timeout
+        self.max_timeout = max_timeout
+        self.default_timeout = default_timeout
+        self.gap_ratio = gap_ratio
+        self.min_gap = min_gap
+        self.max_gap = max_gap
+        self.default_gap = default_gap
+        self.min_samples = min_samples
+
+        self.lock = threading.Lock()
+        # (串口, 从站ID) -> {"srtt", "rttvar", "count", "timeouts", "max"}
+        self.entries = {}
+        self.dirty = False
+        self.running = False
+
+    @staticmethod
+    def _clamp(value, low, high):
+        return max(low, min(high, value))
+
+    def record(self, port, slave, seconds):
+        """记录一次完整响应的耗时（秒）"""
+        key = (port, slave)
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is None:
+                self.entries[key] = {"srtt": seconds, "rttvar": seconds / 2, "count": 1, "timeouts": 0, "max": seconds}
+            else:
+                entry["rttvar"] += self.BETA * (abs(entry["srtt"] - seconds) - entry["rttvar"])
+                entry["srtt"] += self.ALPHA * (seconds - entry["srtt"])
+                entry["count"] += 1
+                entry["max"] = max(entry["max"], seconds)
+            self.dirty = True
+
+    def record_timeout(self, port, slave):
+        """记录一次超时，偏差加倍使下次超时变长，设备恢复后再随正常样本回落"""
+        with self.lock:
+            entry = self.entries.get((port, slave))
+            if entry is None:
+                return
+            entry["timeouts"] += 1
+            entry["rttvar"] = min(entry["rttvar"] * 2, self.max_timeout)
+            self.dirty = True
+
+    def timeout(self, port, slave):
+        """从站的读超时（秒）"""
+        with self.lock:
+            entry = self.entries.get((port, slave))
+            if entry is None or entry["count"] < self.min_samples:
+                return self.default_timeout
+            value = self.margin * (entry["srtt"] + 4 * entry["rttvar"])
+        return self._clamp(value, self.min_timeout, self.max_timeout)
+
+    def gap(self, port, slave):
+        """对该从站的事务结束后，串口上开始下一次事务前的间隔（秒）"""
+        with self.lock:
+            entry = self.entries.get((port, slave))
+            if entry is None or entry["count"] < self.min_samples:
+                return self.default_gap
+            value = self.gap_ratio * entry["srtt"]
+        return self._clamp(value, self.min_gap, self.max_gap)
+
+    def export(self, port):
+        """导出一个串口的学习结果，供独立进程模式下在主进程和串口进程之间同步
+
+        Returns:
+            dict: {从站ID: 统计}
+        """
+        with self.lock:
+            return {slave: dict(entry) for (name, slave), entry in self.entries.items() if name == port}
+
+    def merge(self, port, entries):
+        """合并串口进程学习到的结果，由主进程统一保存"""
+        with self.lock:
+            for slave, entry in entries.items():
+                self.entries[(port, slave)] = dict(entry)
+            if entries:
+                self.dirty = True
+
+    def load(self):
+        """加载保存的学习结果"""
+        if not self.path or not os.path.exists(self.path):
+            return 0
+        try:
+            with open(self.path, 'r', encoding='utf-8') as file:
+                data = json.load(file)
+        except Exception as e:
+            logger.error(f"加载从站响应时间 {self.path} 失败: {e}")
+            return 0
+        with self.lock:
+            for item in data.get('entries', []):
+                self.entries[(item['port'], item['slave'])] = {
+                    "srtt": item['srtt'],
+                    "rttvar": item['rttvar'],
+                    "count": item['count'],
+                    "timeouts": item.get('timeouts', 0),
+                    "max": item.get('max', item['srtt']),
+                }
+        logger.info(f"已加载 {len(self.entries)} 个从站的响应时间")
+        return len(self.entries)
+
+    def save(self):
+        """保存学习结果，没有变化时不写文件"""
+        if not self.path:
+            return False
+        with self.lock:
+            if not self.dirty:
+                return False
+            entries = [dict(entry, port=port, slave=slave) for (port, slave), entry in self.entries.items()]
+            self.dirty = False
+        directory = os.path.dirname(self.path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        temp_path = self.path + '.tmp'
+        with open(temp_path, 'w', encoding='utf-8') as file:
+            json.dump({"saved": time.time(), "entries": entries}, file, ensure_ascii=False, indent=2)
+        os.replace(temp_path, self.path)
+        return True
+
+    def start(self, interval=30.0):
+        """启动定期保存线程"""
+        if self.running:
+            return
+        self.running = True
+        thread = threading.Thread(target=self._save_thread_func, args=(interval,))
+        thread.daemon = True
+        thread.start()
+
+    def stop(self):
+        """停止保存线程并保存一次"""
+        self.running = False
+        self.save()
+
+    def _save_thread_func(self, interval):
+        """保存线程函数"""
+        while self.running:
+            time.sleep(interval)
+            try:
+                self.save()
+            except Exception as e:
+                logger.error(f"保存从站响应时间失败: {e}")
+
+    def stats(self):
+        """各从站的响应时间和当前使用的超时、间隔，单位为毫秒"""
+        with self.lock:
+            keys = list(self.entries.keys())
+            entries = {key: dict(entry) for key, entry in self.entries.items()}
+        return {
+            f"{port}/{slave}": {
+                "count": entries[(port, slave)]["count"],
+                "timeouts": entries[(port, slave)]["timeouts"],
+                "srtt_ms": round(entries[(port, slave)]["srtt"] * 1000, 3),
+                "rttvar_ms": round(entries[(port, slave)]["rttvar"] * 1000, 3),
+                "max_ms": round(entries[(port, slave)]["max"] * 1000, 3),
+                "timeout_ms": round(self.timeout(port, slave) * 1000, 3),
+                "gap_ms": round(self.gap(port, slave) * 1000, 3),
+            }
+            for port, slave in keys
+        }